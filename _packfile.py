@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# File format shared by the memory-mapped data files (poi_local.py indexes,
+# model_pack.py packs): an 8-byte MAGIC, a uint64 header length, a JSON
+# header, then flat numpy arrays. Each array starts on a 64-byte boundary
+# after the header, and the header's 'arrays' entry maps every name to its
+# offset, dtype and shape. Files are written to a temporary path and renamed
+# into place: readers still mapping the old file keep a consistent inode.
+ALIGN = 64
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def data_start(magic, header_len):
+    """File offset of the array region."""
+    start = len(magic) + 8 + header_len
+    return start + _pad(start)
+
+
+def write(path, magic, header, arrays, checksum=False):
+    """Write `arrays` ({name: ndarray}) after `header`; returns the header written.
+
+    With checksum=True the header also gets 'sha256', a digest of the whole
+    array region (padding included), for verify().
+    """
+    specs = {}
+    offset = 0
+    for name, arr in arrays.items():
+        specs[name] = {'offset': offset, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+        offset += arr.nbytes + _pad(arr.nbytes)
+    header = dict(header, arrays=specs)
+    if checksum:
+        h = hashlib.sha256()
+        for arr in arrays.values():
+            h.update(np.ascontiguousarray(arr))
+            h.update(bytes(_pad(arr.nbytes)))
+        header['sha256'] = h.hexdigest()
+    hdr = json.dumps(header).encode('utf-8')
+    start = data_start(magic, len(hdr))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(magic)
+        f.write(np.uint64(len(hdr)).tobytes())
+        f.write(hdr)
+        for name, arr in arrays.items():
+            f.seek(start + specs[name]['offset'])
+            f.write(np.ascontiguousarray(arr))
+        # zero-fill the padding after the last array too
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+    return header
+
+
+def read_header(path, magic, what='data file'):
+    """(header length, header); ValueError when `path` does not start with `magic`."""
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f'{path} is not a {what}')
+        hlen = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return hlen, json.loads(f.read(hlen).decode('utf-8'))
+
+
+def verify(path, magic, header_len, header):
+    """True when the array region matches header['sha256']."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(data_start(magic, header_len))
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest() == header.get('sha256')
+
+
+def open_arrays(path, magic, header_len, header):
+    """{name: read-only np.memmap} for the arrays listed in `header`."""
+    start = data_start(magic, header_len)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        if int(np.prod(shape)) == 0:
+            # np.memmap cannot map zero bytes
+            arrays[name] = np.zeros(shape, dtype=np.dtype(spec['dtype']))
+            continue
+        arrays[name] = np.memmap(path, dtype=np.dtype(spec['dtype']), mode='r',
+                                 offset=start + spec['offset'], shape=shape)
+    return arrays
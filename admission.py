@@ -0,0 +1,231 @@
+import os
+import json
+import math
+import time
+from collections import OrderedDict
+from threading import Condition, Lock
+
+import metrics
+
+# Per-route admission control and load shedding.
+#
+# Routes belong to priority classes, each with its own concurrency limit,
+# bounded wait queue and queue-time budget per worker process:
+#
+#   chat   /handle_message                           highest: large share, long budget
+#   feeds  /latest_updates, /detect_location
+#   geo    /nearby_disasters, /map_pois, /bootstrap   lowest: slow upstream fan-out
+#
+# Under gthread a request waiting for a slot still holds a worker thread,
+# so the geo and feeds limits plus queues are kept well below the thread
+# count (gunicorn.conf.py derives them from THREADS). A spike of slow geo
+# requests then fills only its own share and /handle_message keeps the rest.
+# A request that finds its class's queue full, or waits past the budget, gets
+# an immediate 503 with Retry-After; if this worker has served the same
+# request successfully before (within ADMISSION_STALE_TTL) that response body
+# is returned with it, marked by `X-Cache: stale` and `Age`.
+#
+# ADMISSION_LIMITS (app.config, else the environment) overrides classes as
+# `name=limit/queue/budget_s,...`; routes not listed below are never limited
+# (e.g. /alerts/stream, /metrics). The limiters and the stale responses
+# belong to one application (app.extensions['admission']).
+ENABLED = os.environ.get('ADMISSION_ENABLED', '1') not in ('0', 'false', 'no')
+DEFAULT_LIMITS = 'chat=32/32/5,feeds=4/4/2,geo=8/4/1'
+ROUTE_CLASSES = {
+    '/handle_message': 'chat',
+    '/latest_updates': 'feeds',
+    '/detect_location': 'feeds',
+    '/nearby_disasters': 'geo',
+    '/map_pois': 'geo',
+    '/bootstrap': 'geo',
+}
+STALE_ROUTES = ('/latest_updates', '/nearby_disasters', '/map_pois', '/bootstrap')
+STALE_TTL = int(os.environ.get('ADMISSION_STALE_TTL', '3600'))
+STALE_SIZE = int(os.environ.get('ADMISSION_STALE_SIZE', '256'))
+MAX_RETRY_AFTER = 60
+EWMA_ALPHA = 0.2
+
+
+class Limiter:
+    """Concurrency limit with a bounded FIFO-ish wait and a queue-time budget."""
+
+    def __init__(self, name, limit, queue, budget):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.queue = max(0, int(queue))
+        self.budget = float(budget)
+        self.active = 0
+        self.waiting = 0
+        self.service_ewma = 1.0
+        self._cond = Condition()
+
+    def acquire(self):
+        """Return (admitted, waited_s, reason); reason is 'queue_full' or 'timeout' when shed."""
+        start = time.monotonic()
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return True, 0.0, None
+            if self.waiting >= self.queue:
+                return False, 0.0, 'queue_full'
+            self.waiting += 1
+            deadline = start + self.budget
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False, time.monotonic() - start, 'timeout'
+                    self._cond.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+        return True, time.monotonic() - start, None
+
+    def release(self, service_s):
+        with self._cond:
+            self.active -= 1
+            self.service_ewma = EWMA_ALPHA * service_s + (1 - EWMA_ALPHA) * self.service_ewma
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until a slot is likely free: the queue ahead drained at the observed service rate."""
+        est = self.service_ewma * (self.waiting + 1) / self.limit
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(est)))
+
+    def snapshot(self):
+        return {'limit': self.limit, 'queue': self.queue, 'budget_s': self.budget, 'active': self.active,
+                'waiting': self.waiting, 'service_ewma_s': round(self.service_ewma, 3)}
+
+
+def parse_limits(spec):
+    """{name: (limit, queue, budget_s)} from `name=limit/queue/budget,...`."""
+    out = {}
+    for part in (spec or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if not name or not value:
+            continue
+        limit, queue, budget = (value.split('/') + ['0', '1'])[:3]
+        out[name] = (int(limit), int(queue), float(budget))
+    return out
+
+
+def build_limiters(spec=None):
+    """{class: Limiter} from DEFAULT_LIMITS overridden by `spec` (else ADMISSION_LIMITS)."""
+    limits = parse_limits(DEFAULT_LIMITS)
+    limits.update(parse_limits(spec if spec is not None else os.environ.get('ADMISSION_LIMITS')))
+    return {name: Limiter(name, *v) for name, v in limits.items()}
+
+
+class Admission:
+    """One application's limiters and last good responses."""
+
+    def __init__(self, spec=None):
+        self.limiters = build_limiters(spec)
+        self._stale = OrderedDict()
+        self._stale_lock = Lock()
+
+    def limiter_for(self, rule):
+        if not ENABLED:
+            return None
+        return self.limiters.get(ROUTE_CLASSES.get(rule))
+
+    def state(self):
+        return {name: lim.snapshot() for name, lim in self.limiters.items()}
+
+    def remember(self, key, body, content_type):
+        with self._stale_lock:
+            self._stale[key] = (time.time(), body, content_type)
+            self._stale.move_to_end(key)
+            while len(self._stale) > STALE_SIZE:
+                self._stale.popitem(last=False)
+
+    def recall(self, key):
+        """(age_s, body, content_type) of the last good response for `key`, or None."""
+        with self._stale_lock:
+            rec = self._stale.get(key)
+        if rec is None or time.time() - rec[0] > STALE_TTL:
+            return None
+        return time.time() - rec[0], rec[1], rec[2]
+
+
+def stale_key(rule, data):
+    """Key for a reusable response, or None (deltas, streams, IP-located bootstraps)."""
+    if rule not in STALE_ROUTES or not isinstance(data, dict):
+        return None
+    if data.get('since') is not None or data.get('stream'):
+        return None
+    if rule == '/bootstrap' and data.get('lat') is None:
+        return None
+    norm = dict(data)
+    for k in ('lat', 'lon'):
+        try:
+            # ~100 m: close enough for radius searches measured in km
+            norm[k] = round(float(norm[k]), 3)
+        except (KeyError, TypeError, ValueError):
+            pass
+    return rule + ' ' + json.dumps(norm, sort_keys=True, default=str)
+
+
+def init_app(app):
+    from flask import Response, g, jsonify, request
+
+    adm = app.extensions['admission'] = Admission(app.config.get('ADMISSION_LIMITS'))
+
+    def _request_key():
+        rule = request.url_rule.rule if request.url_rule else None
+        if rule not in STALE_ROUTES:
+            return None
+        return stale_key(rule, request.get_json(silent=True))
+
+    @app.before_request
+    def _admit():
+        rule = request.url_rule.rule if request.url_rule else None
+        limiter = adm.limiter_for(rule)
+        if limiter is None:
+            return None
+        admitted, waited, reason = limiter.acquire()
+        if admitted:
+            g._admission = (limiter, time.monotonic())
+            metrics.admission_admitted(limiter.name, waited, limiter.active)
+            return None
+
+        retry_after = limiter.retry_after()
+        key = _request_key()
+        stale = adm.recall(key) if key else None
+        metrics.admission_shed(limiter.name, reason, stale is not None)
+        if stale is not None:
+            age, body, content_type = stale
+            resp = Response(body, status=503, content_type=content_type)
+            resp.headers['X-Cache'] = 'stale'
+            resp.headers['Age'] = str(int(age))
+        else:
+            resp = jsonify({'error': 'busy', 'retry_after': retry_after})
+            resp.status_code = 503
+        resp.headers['Retry-After'] = str(retry_after)
+        return resp
+
+    @app.after_request
+    def _remember(response):
+        if getattr(g, '_admission', None) is None:
+            return response
+        if response.is_streamed:
+            # the view has only built the generator; the upstream work runs while
+            # the body is sent, so the slot is held until the server closes it
+            response.call_on_close(lambda slot=g.pop('_admission'): _release_slot(slot))
+        elif response.status_code == 200:
+            key = _request_key()
+            if key:
+                adm.remember(key, response.get_data(), response.content_type)
+        return response
+
+    @app.teardown_request
+    def _release(exc):
+        slot = g.pop('_admission', None)
+        if slot is not None:
+            _release_slot(slot)
+
+
+def _release_slot(slot):
+    limiter, start = slot
+    limiter.release(time.monotonic() - start)
+    metrics.admission_released(limiter.name, limiter.active)
@@ -0,0 +1,293 @@
+import os
+import time
+import asyncio
+import threading
+import concurrent.futures
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+try:
+    import gevent.monkey    # optional: only relevant under gevent workers
+except Exception:
+    gevent = None
+
+# Shared async HTTP client for all upstream calls (USGS, ReliefWeb,
+# weather.gov, Overpass, Nominatim, ip-api).
+#
+# Each worker process runs one background event loop thread that owns a
+# single httpx.AsyncClient, so every request thread shares one connection
+# pool and in-flight upstream calls are bounded by sockets (MAX_CONNECTIONS),
+# not by threads. Views and other sync code call `run(coro)` with one
+# coroutine covering their whole upstream fan-out; everything else (session
+# access, shaping, serialization) stays in the calling thread, so the loop
+# thread only ever does socket work. Code that consumes a streamed body in
+# its own thread (overpass_pool.open_query: exports, the CLI) uses
+# sync_client(), a blocking httpx.Client with the same limits and metrics.
+#
+# Under gevent workers every greenlet shares one OS thread, and asyncio keeps
+# its running loop per OS thread, so the loop must live in a native thread.
+MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '200'))
+MAX_KEEPALIVE = int(os.environ.get('HTTP_MAX_KEEPALIVE', '50'))
+DEFAULT_TIMEOUT = 10.0
+USER_AGENT = 'disaster-chatbot/0.1'
+# Load tests point every upstream at a local simulator
+# (benchmarks/upstream_sim.py): https://host/path?q -> UPSTREAM_BASE_URL/host/path?q
+UPSTREAM_BASE_URL = os.environ.get('UPSTREAM_BASE_URL', '').rstrip('/')
+
+_LOCK = threading.Lock()
+_LOOP = None
+_CLIENT = None
+_PID = None
+_SYNC_CLIENT = None
+_SYNC_PID = None
+_LOOP_THREAD = None
+
+
+def _gevent_patched():
+    return gevent is not None and gevent.monkey.is_module_patched('threading')
+
+
+def cooperative():
+    """True when gevent has patched threading (greenlet workers): blocking is cheap."""
+    return _gevent_patched()
+
+
+def start_native_thread(fn):
+    """Start `fn` on a real OS thread, even when gevent has patched threading."""
+    if _gevent_patched():
+        gevent.monkey.get_original('_thread', 'start_new_thread')(fn, ())
+    else:
+        threading.Thread(target=fn, daemon=True).start()
+
+
+def native_ident():
+    """OS thread id of the caller (the keys of sys._current_frames())."""
+    if _gevent_patched():
+        return gevent.monkey.get_original('_thread', 'get_ident')()
+    return threading.get_ident()
+
+
+def loop_thread_id():
+    """OS thread id of the shared loop, or None before it has started."""
+    return _LOOP_THREAD
+
+
+def original_sleep():
+    """time.sleep for native threads (a gevent-patched sleep would start a hub there)."""
+    if _gevent_patched():
+        return gevent.monkey.get_original('time', 'sleep')
+    return time.sleep
+
+
+def _observe_error(request, e):
+    if isinstance(e, httpx.TimeoutException):
+        error = 'timeout'
+    elif isinstance(e, httpx.ConnectError):
+        error = 'connect'
+    else:
+        error = 'other'
+    metrics.observe_upstream(request.url, 0, error=error)
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """Records per-host latency, status and error counts for every upstream call."""
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        try:
+            resp = await super().handle_async_request(request)
+        except Exception as e:
+            _observe_error(request, e)
+            raise
+        metrics.observe_upstream(request.url, time.perf_counter() - start, status=resp.status_code)
+        return resp
+
+
+class _MeteredSyncTransport(httpx.HTTPTransport):
+    """_MeteredTransport for sync_client()."""
+
+    def handle_request(self, request):
+        start = time.perf_counter()
+        try:
+            resp = super().handle_request(request)
+        except Exception as e:
+            _observe_error(request, e)
+            raise
+        metrics.observe_upstream(request.url, time.perf_counter() - start, status=resp.status_code)
+        return resp
+
+
+class _NativeExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Default executor for the loop under gevent (DNS lookups, run_in_executor).
+
+    Monkey-patched threads are greenlets, and the loop thread never runs a
+    gevent hub to schedule them, so these workers are real OS threads.
+    """
+
+    # subclassed only because asyncio insists on a ThreadPoolExecutor
+    def __init__(self, workers=8):
+        self._queue = gevent.monkey.get_original('queue', 'SimpleQueue')()
+        for _ in range(workers):
+            start_native_thread(self._work)
+
+    def _work(self):
+        while True:
+            fn, args, kwargs, fut = self._queue.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    def submit(self, fn, /, *args, **kwargs):
+        fut = concurrent.futures.Future()
+        self._queue.put((fn, args, kwargs, fut))
+        return fut
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        pass
+
+
+def _start():
+    global _LOOP, _PID
+    if _gevent_patched():
+        # gevent's selector needs a running hub; the loop thread has none
+        loop = asyncio.SelectorEventLoop(gevent.monkey.get_original('selectors', 'DefaultSelector')())
+        loop.set_default_executor(_NativeExecutor())
+    else:
+        loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def runner():
+        global _LOOP_THREAD
+        _LOOP_THREAD = native_ident()
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    # under gevent a greenlet would share the OS thread (and asyncio state)
+    # with the request greenlets, so this must be a real thread
+    start_native_thread(runner)
+    ready.wait()
+    _LOOP = loop
+    _PID = os.getpid()
+
+
+def get_loop():
+    """Return this process's shared event loop, starting it on first use."""
+    global _CLIENT
+    # after a fork (gunicorn workers) the parent's loop thread is gone
+    if _LOOP is None or _PID != os.getpid():
+        with _LOCK:
+            if _LOOP is None or _PID != os.getpid():
+                # built here rather than on the loop thread: its lazy imports
+                # may spawn subprocesses, which gevent only allows in the hub thread
+                _CLIENT = httpx.AsyncClient(
+                    timeout=DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                    headers={'User-Agent': USER_AGENT},
+                    transport=_MeteredTransport(limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)),
+                )
+                _start()
+    return _LOOP
+
+
+def client():
+    """The shared AsyncClient; only use it from coroutines on the shared loop."""
+    get_loop()
+    return _CLIENT
+
+
+def sync_client():
+    """This process's blocking httpx.Client, for callers outside the shared loop."""
+    global _SYNC_CLIENT, _SYNC_PID
+    if _SYNC_CLIENT is None or _SYNC_PID != os.getpid():
+        with _LOCK:
+            if _SYNC_CLIENT is None or _SYNC_PID != os.getpid():
+                _SYNC_CLIENT = httpx.Client(
+                    timeout=DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                    headers={'User-Agent': USER_AGENT},
+                    transport=_MeteredSyncTransport(limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)),
+                )
+                _SYNC_PID = os.getpid()
+    return _SYNC_CLIENT
+
+
+def run(coro, timeout=None):
+    """Run `coro` on the shared loop and block until it finishes (sync callers)."""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError('aio.run() called from the shared loop; await the coroutine instead')
+    fut = asyncio.run_coroutine_threadsafe(coro, loop)
+    if _gevent_patched():
+        _gevent_wait(fut, timeout)
+    return fut.result(timeout)
+
+
+def _gevent_wait(fut, timeout):
+    # Wake this greenlet through the hub's async watcher, gevent's own
+    # cross-thread wakeup, instead of a patched lock released by a foreign thread.
+    import gevent.event
+    watcher = gevent.get_hub().loop.async_()
+    done = gevent.event.Event()
+    watcher.start(done.set)
+    try:
+        fut.add_done_callback(lambda _: watcher.send())
+        done.wait(timeout)
+    finally:
+        watcher.close()
+
+
+def as_completed(coros):
+    """Run {key: coro} on the shared loop; yield (key, result, error) as each finishes.
+
+    A sync generator, so a streamed Flask response can emit each part as
+    soon as it is ready. Unfinished coroutines are cancelled on close.
+    """
+    async def start():
+        done = asyncio.Queue()
+
+        async def one(key, coro):
+            try:
+                done.put_nowait((key, await coro, None))
+            except Exception as e:
+                done.put_nowait((key, None, e))
+        return done, [asyncio.ensure_future(one(k, c)) for k, c in coros.items()]
+
+    done, tasks = run(start())
+    try:
+        for _ in tasks:
+            yield run(done.get())
+    finally:
+        loop = get_loop()
+        for t in tasks:
+            loop.call_soon_threadsafe(t.cancel)
+
+
+def upstream_url(url):
+    """`url`, or its UPSTREAM_BASE_URL rewrite when one is configured."""
+    if not UPSTREAM_BASE_URL or url.startswith(UPSTREAM_BASE_URL + '/'):
+        return url
+    parts = urlsplit(url)
+    out = f'{UPSTREAM_BASE_URL}/{parts.netloc}{parts.path or "/"}'
+    return f'{out}?{parts.query}' if parts.query else out
+
+
+async def get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    return await client().get(upstream_url(url), timeout=timeout, **kwargs)
+
+
+async def gather_settled(*coros):
+    """asyncio.gather that turns exceptions into None (upstreams fail independently)."""
+    results = await asyncio.gather(*coros, return_exceptions=True)
+    return [None if isinstance(r, BaseException) else r for r in results]
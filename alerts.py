@@ -0,0 +1,235 @@
+import os
+import json
+import math
+import time
+import queue
+import threading
+
+import aio
+import event_store
+
+# Server-Sent Events push of nearby disaster events.
+#
+# Clients subscribe with lat/lon/radius and are grouped by a fixed-size
+# lat/lon grid cell. A single background poller refreshes each active cell
+# once per interval (one upstream fan-out per cell, not per client), reads
+# the newly ingested events for that cell from the event store and hands
+# them to every subscriber in the cell whose own radius they fall in.
+#
+# Each subscriber is only a small bounded queue; the streaming response
+# blocks on it for as long as the client stays connected. That is only
+# affordable when a stream costs a greenlet, so /alerts/stream requires
+# gunicorn's gevent worker: gunicorn.conf.py refuses to start another worker
+# class unless ALERTS_STREAM=0, and a non-cooperative process (the Flask dev
+# server) answers 503. Reconnecting clients send Last-Event-ID; everything
+# stored since that cursor is replayed page by page, so none is skipped.
+#
+# Only geolocated events are pushed: an event without coordinates (mostly
+# country-level ReliefWeb disasters) cannot be matched to a subscriber's
+# circle, so clients only get those from /nearby_disasters.
+CELL_DEG = float(os.environ.get('ALERTS_CELL_DEG', '1.0'))
+POLL_SECONDS = float(os.environ.get('ALERTS_POLL_SECONDS', '60'))
+HEARTBEAT_SECONDS = float(os.environ.get('ALERTS_HEARTBEAT_SECONDS', '15'))
+STREAM_ENABLED = os.environ.get('ALERTS_STREAM', '1') not in ('0', 'false', 'no')
+MAX_RADIUS_KM = 500.0
+QUEUE_SIZE = 100
+# events read from the store per query when catching up
+PAGE_SIZE = 500
+
+_CELLS = {}
+_LOCK = threading.Lock()
+_POLLER = None
+
+
+class _Subscriber:
+    __slots__ = ('lat', 'lon', 'radius_km', 'cursor', 'queue')
+
+    def __init__(self, lat, lon, radius_km, cursor):
+        self.lat = lat
+        self.lon = lon
+        self.radius_km = radius_km
+        self.cursor = cursor
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+
+class _Cell:
+    __slots__ = ('key', 'subscribers', 'cursor', 'last_poll')
+
+    def __init__(self, key, cursor):
+        self.key = key
+        self.subscribers = set()
+        self.cursor = cursor
+        self.last_poll = 0.0
+
+    def center(self):
+        return ((self.key[0] + 0.5) * CELL_DEG, (self.key[1] + 0.5) * CELL_DEG)
+
+    def query_radius_km(self):
+        # half-diagonal of the cell plus the widest subscriber radius, so one
+        # query around the centre covers every subscriber circle in the cell
+        half_diag = math.hypot(CELL_DEG, CELL_DEG) * 111.0 / 2.0
+        widest = max((s.radius_km for s in self.subscribers), default=0.0)
+        return half_diag + widest
+
+
+def _cell_key(lat, lon):
+    return (int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG)))
+
+
+def subscribe(lat, lon, radius_km, cursor=None):
+    """Register a subscriber and return it; pair with `unsubscribe`."""
+    radius_km = min(float(radius_km), MAX_RADIUS_KM)
+    start = str(event_store.parse_cursor(cursor)) if cursor is not None else event_store.current_cursor()
+    sub = _Subscriber(float(lat), float(lon), radius_km, start)
+    key = _cell_key(sub.lat, sub.lon)
+    with _LOCK:
+        cell = _CELLS.get(key)
+        if cell is None:
+            cell = _Cell(key, event_store.current_cursor())
+            _CELLS[key] = cell
+        cell.subscribers.add(sub)
+    _ensure_poller()
+    return sub
+
+
+def unsubscribe(sub):
+    key = _cell_key(sub.lat, sub.lon)
+    with _LOCK:
+        cell = _CELLS.get(key)
+        if cell is None:
+            return
+        cell.subscribers.discard(sub)
+        if not cell.subscribers:
+            del _CELLS[key]
+
+
+def _deliver(sub, ev):
+    try:
+        sub.queue.put_nowait(ev)
+    except queue.Full:
+        # slow consumer: drop; it can catch up via Last-Event-ID on reconnect
+        pass
+
+
+def _since(lat, lon, radius_km, cursor):
+    """Every stored event within radius_km after `cursor`, oldest first, a page at a time."""
+    while True:
+        page = event_store.query_nearby(lat, lon, radius_km, since=cursor, limit=PAGE_SIZE)
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        cursor = str(page[-1]['_seq'])
+
+
+def _poll_cell(cell):
+    from disasters import get_nearby_disasters
+    lat, lon = cell.center()
+    radius = cell.query_radius_km()
+    try:
+        # refreshes the event store (cached upstream calls, shared by workers)
+        get_nearby_disasters(lat=lat, lon=lon, radius_km=round(radius, 1))
+    except Exception:
+        pass
+    cell.last_poll = time.time()
+    with _LOCK:
+        subscribers = list(cell.subscribers)
+    for ev in _since(lat, lon, radius, cell.cursor):
+        cell.cursor = str(ev['_seq'])
+        for sub in subscribers:
+            if ev['_seq'] <= int(sub.cursor):
+                continue
+            if event_store._haversine_km(sub.lat, sub.lon, ev['lat'], ev['lon']) <= sub.radius_km:
+                _deliver(sub, ev)
+
+
+def _poll_loop():
+    while True:
+        with _LOCK:
+            cells = list(_CELLS.values())
+        now = time.time()
+        for cell in cells:
+            if now - cell.last_poll >= POLL_SECONDS:
+                try:
+                    _poll_cell(cell)
+                except Exception:
+                    continue
+        time.sleep(min(5.0, POLL_SECONDS))
+
+
+def _ensure_poller():
+    global _POLLER
+    with _LOCK:
+        if _POLLER is None or not _POLLER.is_alive():
+            _POLLER = threading.Thread(target=_poll_loop, name='alerts-poller', daemon=True)
+            _POLLER.start()
+
+
+def _format_event(ev):
+    ev = dict(ev)
+    seq = ev.pop('_seq', '')
+    ev.pop('raw', None)
+    return f"id: {seq}\nevent: disaster\ndata: {json.dumps(ev, default=str)}\n\n"
+
+
+def stream(sub, max_seconds=None):
+    """Yield SSE frames for a subscriber until the client disconnects (or `max_seconds`)."""
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        # a bounded stream ends on purpose: ask for a prompt reconnect
+        yield f"retry: {1000 if deadline else int(POLL_SECONDS * 1000)}\n\n"
+        # backlog: everything already stored for this circle since the cursor
+        for ev in _since(sub.lat, sub.lon, sub.radius_km, sub.cursor):
+            sub.cursor = str(max(int(sub.cursor), ev['_seq']))
+            yield _format_event(ev)
+        while True:
+            wait = HEARTBEAT_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return
+            try:
+                ev = sub.queue.get(timeout=wait)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if ev['_seq'] <= int(sub.cursor):
+                continue
+            sub.cursor = str(ev['_seq'])
+            yield _format_event(ev)
+    finally:
+        unsubscribe(sub)
+
+
+class _Stream:
+    """Response body for one stream; close() unsubscribes even if it never started."""
+
+    def __init__(self, sub):
+        self.sub = sub
+        self._frames = stream(sub)
+
+    def __iter__(self):
+        return self._frames
+
+    def close(self):
+        self._frames.close()
+        unsubscribe(self.sub)
+
+
+def available():
+    """True when this process can hold alert streams open (gevent worker, ALERTS_STREAM on)."""
+    return STREAM_ENABLED and aio.cooperative()
+
+
+def open_stream(lat, lon, radius_km, cursor=None):
+    """SSE body for a new subscriber, or None when streams are not available here."""
+    if not available():
+        return None
+    return _Stream(subscribe(lat, lon, radius_km, cursor=cursor))
+
+
+def stats():
+    with _LOCK:
+        return {
+            'cells': len(_CELLS),
+            'subscribers': sum(len(c.subscribers) for c in _CELLS.values()),
+        }
@@ -1,23 +1,14 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Blueprint, Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
 import os
-import json
+import time
 import random
 import importlib
 
-app = Flask(__name__, template_folder='templates')
-CORS(app)
-
-# -------------------------
-# INTENTS.JSON SAFETY
-# -------------------------
-INTENTS_FILE = os.path.join(os.path.dirname(__file__), "intents.json")
-if os.path.exists(INTENTS_FILE):
-    with open(INTENTS_FILE, "r", encoding="utf-8") as f:
-        INTENTS_JSON = json.load(f)
-else:
-    print("Warning: intents.json not found, using empty intents")
-    INTENTS_JSON = {"intents": []}
+# Routes live on a blueprint; create_app() builds an application. Importing
+# this module builds none: wsgi.py does for gunicorn, `flask --app app run`
+# finds the factory itself.
+bp = Blueprint('chatbot', __name__)
 
 # -------------------------
 # FALLBACK RULES
@@ -42,8 +33,8 @@ def _fallback_intent_for_message(message):
                 return tag
     return None
 
-def _build_fallback_response(tag):
-    for it in INTENTS_JSON.get('intents', []):
+def _build_fallback_response(tag, intents_json):
+    for it in intents_json.get('intents', []):
         if it.get('tag') == tag:
             responses = it.get('responses', [])
             if responses:
@@ -54,19 +45,8 @@ def _build_fallback_response(tag):
 # -------------------------
 # LAZY LOAD ML BACKEND
 # -------------------------
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "model", "my_model.h5")
-tf_model = None
-
-def load_tf_model():
-    global tf_model
-    if tf_model is None:
-        import tensorflow as tf
-        if not os.path.exists(MODEL_PATH):
-            print("Warning: TensorFlow model file missing")
-            return None
-        tf_model = tf.keras.models.load_model(MODEL_PATH)
-    return tf_model
-
+# intents, vocabulary and the Keras model come from model_bundle, which
+# app.py and main.py share and which reloads without a worker restart
 def _get_main():
     try:
         return importlib.import_module('main')
@@ -74,30 +54,53 @@ def _get_main():
         print("Warning: main.py import failed:", e)
         return None
 
+import aio
 import updates
 import location
+import payloads
+import metrics
+import profiling
+import admission
+import model_bundle
+import model_pack
+import session_store
+import cache_snapshot
 
 # -------------------------
 # ROUTES
 # -------------------------
-@app.route('/')
+# Views run in the request's own thread (or greenlet). Only their upstream
+# calls go to the shared loop in aio, as one coroutine per request through
+# aio.run(), so concurrent requests' fan-out shares one httpx client while
+# session access, shaping and serialization stay in parallel threads.
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/model_status')
+@bp.route('/model_status')
 def model_status():
-    model_exists = os.path.exists(MODEL_PATH)
-    return jsonify({"model_found": model_exists})
+    model_exists = any(os.path.exists(os.path.join(model_bundle.MODEL_DIR, name))
+                       for name in (model_bundle.MODEL_FILE, model_pack.PACK_FILE))
+    return jsonify({"model_found": model_exists, **model_bundle.status()})
 
-@app.route('/handle_message', methods=['POST'])
+@bp.route('/handle_message', methods=['POST'])
 def handle_message():
     message = request.json.get('message', '')
+    # one bundle for the whole request, even if a reload swaps it meanwhile
+    bundle = model_bundle.current()
 
     main = _get_main()
     if main:
         try:
-            intents_list = main.predict_class(message)
-            response = main.get_response(intents_list, main.intents)
+            start = time.perf_counter()
+            intents_list = main.predict_class(message, bundle)
+            # main falls back to keyword rules when the Keras model cannot load
+            metrics.observe_inference(bundle.engine, time.perf_counter() - start)
+            intents_list = session_store.filter_by_context(intents_list, bundle.intents)
+            # follow-ups reuse the updates this session fetched moments ago
+            response = main.get_response(intents_list, bundle.intents,
+                                         lambda tag: session_store.updates_for(tag, main.fetch_latest_disaster_updates))
+            session_store.note_intent(intents_list, bundle.intents)
             return jsonify({'response': response})
         except Exception as e:
             print("Error in main.predict_class:", e)
@@ -105,9 +108,9 @@ def handle_message():
     # Fallback keyword intent
     tag = _fallback_intent_for_message(message)
     if tag:
-        resp_text = _build_fallback_response(tag)
+        resp_text = _build_fallback_response(tag, bundle.intents)
         try:
-            tips = updates.fetch_latest_disaster_updates(tag or 'general')
+            tips = session_store.updates_for(tag or 'general', updates.fetch_latest_disaster_updates)
             if tips:
                 resp_text += "\n\nLATEST UPDATES:\n" + "\n".join(f"{i+1}. {t}" for i, t in enumerate(tips[:3]))
         except Exception:
@@ -116,28 +119,31 @@ def handle_message():
 
     # General fallback
     try:
-        tips = updates.fetch_latest_disaster_updates('general')
+        tips = session_store.updates_for('general', updates.fetch_latest_disaster_updates)
     except Exception:
         tips = []
     fall_text = "I couldn't access the model right now, but here are some important tips and latest updates:\n\n"
     fall_text += "\n".join(f"{i+1}. {t}" for i, t in enumerate(tips))
     return jsonify({'response': fall_text}), 503
 
-@app.route('/latest_updates', methods=['POST'])
+@bp.route('/latest_updates', methods=['POST'])
 def latest_updates():
     data = request.json or {}
     tag = data.get('tag', 'general')
-    tips = updates.fetch_latest_disaster_updates(tag)
+    tips = session_store.updates_for(tag, updates.fetch_latest_disaster_updates)
     return jsonify({'updates': tips})
 
-@app.route('/detect_location', methods=['GET'])
+@bp.route('/detect_location', methods=['GET'])
 def detect_location_route():
-    loc = location.detect_location(request)
+    loc = session_store.location()
+    if loc is None:
+        loc = location.detect_location(request)
+        session_store.set_location(loc)
     if not loc:
         return jsonify({'error': 'Could not detect location'}), 404
     return jsonify({'location': loc})
 
-@app.route('/nearby_disasters', methods=['POST'])
+@bp.route('/nearby_disasters', methods=['POST'])
 def nearby_disasters_route():
     data = request.json or {}
     lat = data.get('lat')
@@ -145,22 +151,46 @@ def nearby_disasters_route():
     radius = data.get('radius_km') or data.get('radius') or 20
     days = data.get('days')
     country = data.get('country')
+    since = data.get('since')
     try:
         lat = float(lat)
         lon = float(lon)
     except Exception:
         return jsonify({'error': 'lat and lon required'}), 400
-    from disasters import get_nearby_disasters
-    res = get_nearby_disasters(lat=lat, lon=lon, radius_km=radius or None, days=days or None, country=country)
-    return jsonify({'disasters': res})
+    import disasters
+    import event_store
+    query = {'lat': lat, 'lon': lon, 'radius_km': radius or None, 'days': days or None, 'country': country}
+    if since is not None:
+        # Deltas come from the event store, which the full query (or the
+        # refresh started here, answered on the next poll) keeps current.
+        # Only geolocated events are in the store.
+        disasters.refresh_in_background(**query)
+        try:
+            radius_km = float(radius)
+            start_ts = time.time() - int(days or 180) * 86400
+        except Exception:
+            return jsonify({'error': 'radius_km and days must be numeric'}), 400
+        res, cursor = event_store.changes_nearby(lat, lon, radius_km, since, start_ts)
+        for e in res:
+            e.pop('_seq', None)
+    else:
+        res = disasters.get_nearby_disasters(**query)
+        # Read the cursor after the (possibly refreshing) query so the client's
+        # next poll starts exactly after what it has just been sent.
+        cursor = event_store.current_cursor()
+    page, next_offset = payloads.shape(res, data, payloads.compact_event)
+    return payloads.json_response({'disasters': page, 'cursor': cursor, 'next_offset': next_offset})
 
-@app.route('/map_pois', methods=['POST'])
+@bp.route('/map_pois', methods=['POST'])
 def map_pois_route():
     data = request.json or {}
     lat = data.get('lat')
     lon = data.get('lon')
     radius = data.get('radius_m') or data.get('radius') or 20000
     kind = data.get('kind') or 'amenity'
+    kinds = data.get('kinds')
+    if isinstance(kinds, str):
+        kinds = [k.strip() for k in kinds.split(',') if k.strip()]
     limit = data.get('limit') or 50
 
     try:
@@ -173,14 +203,117 @@ def map_pois_route():
 
     try:
         overpass = importlib.import_module('overpass')
-        pois = overpass.search_pois(lat=lat, lon=lon, radius_m=radius, kind=kind, limit=limit)
-        return jsonify({'pois': pois})
+        if kinds:
+            # several kinds in one Overpass round trip, results keyed by kind
+            by_kind = aio.run(overpass.search_pois_multi_async(lat=lat, lon=lon, radius_m=radius,
+                                                               kinds=kinds, limit=limit))
+            out = {}
+            for k, pois in by_kind.items():
+                page, next_offset = payloads.shape(pois, data, payloads.compact_poi)
+                out[k] = {'pois': page, 'next_offset': next_offset}
+            return payloads.json_response({'kinds': out})
+        pois = aio.run(overpass.search_pois_async(lat=lat, lon=lon, radius_m=radius, kind=kind, limit=limit))
+        page, next_offset = payloads.shape(pois, data, payloads.compact_poi)
+        return payloads.json_response({'pois': page, 'next_offset': next_offset})
     except Exception as e:
+        import overpass_pool
+        if isinstance(e, overpass_pool.OverpassUnavailable):
+            # every Overpass endpoint is throttled or down: tell the client when to retry
+            resp = jsonify({'error': 'POI service busy', 'details': str(e)})
+            if e.retry_after:
+                resp.headers['Retry-After'] = str(e.retry_after)
+            return resp, 503
         return jsonify({'error': 'Could not fetch POIs', 'details': str(e)}), 500
 
+@bp.route('/bootstrap', methods=['POST'])
+def bootstrap_route():
+    import bootstrap
+    data = request.json or {}
+    try:
+        opts = bootstrap.parse_options(data)
+    except Exception:
+        return jsonify({'error': 'lat, lon, radius_km, days and limit must be numeric'}), 400
+    # browser coordinates win; without them the session's location saves the IP lookup
+    loc = session_store.location() if opts['lat'] is None else None
+    if not loc:
+        loc = aio.run(bootstrap.resolve_location(location._get_client_ip(request), opts))
+    session_store.set_location(loc)
+    if payloads.parse_bool(data.get('stream') or request.args.get('stream')):
+        # one NDJSON line per part as it completes; don't let proxies buffer it
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(bootstrap.stream(loc, opts), mimetype='application/x-ndjson', headers=headers)
+    out = aio.run(bootstrap.build(loc, opts))
+    return payloads.json_response(out, status=200 if out['location'] else 404)
+
+@bp.route('/alerts/stream', methods=['GET'])
+def alerts_stream_route():
+    import alerts
+    try:
+        lat = float(request.args.get('lat'))
+        lon = float(request.args.get('lon'))
+        radius = float(request.args.get('radius_km') or 20)
+    except Exception:
+        return jsonify({'error': 'lat and lon required'}), 400
+    # EventSource sends Last-Event-ID on reconnect; it is our event cursor
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    body = alerts.open_stream(lat, lon, radius, cursor=cursor)
+    if body is None:
+        # streams need the gevent worker (see alerts.py)
+        return jsonify({'error': 'alert streams are not available on this server'}), 503
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(body, mimetype='text/event-stream', headers=headers)
+
+@bp.route('/admin/model/reload', methods=['POST'])
+def model_reload_route():
+    if not profiling.authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'forbidden'}), 403
+    # every worker (this one included) picks the trigger up on its next poll
+    model_bundle.request_reload()
+    return jsonify({'requested': True, **model_bundle.status()}), 202
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_route():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@bp.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_route():
+    if not profiling.authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'forbidden'}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            rate = float(data.get('rate', 1.0 if payloads.parse_bool(data.get('enabled')) else 0.0))
+        except Exception:
+            return jsonify({'error': 'rate must be a number between 0 and 1'}), 400
+        profiling.set_rate(rate)
+    return jsonify(profiling.state())
+
+# -------------------------
+# APP FACTORY
+# -------------------------
+def create_app(config=None):
+    """Build the Flask application; `config` entries override app.config."""
+    flask_app = Flask(__name__, template_folder='templates')
+    if config:
+        flask_app.config.update(config)
+    CORS(flask_app)
+    flask_app.register_blueprint(bp)
+    metrics.init_app(flask_app)
+    profiling.init_app(flask_app)
+    # before admission so a session hit needs no slot
+    session_store.init_app(flask_app)
+    # after metrics so shed requests are still timed and counted
+    admission.init_app(flask_app)
+    # warm the caches from the last snapshot and keep snapshotting them
+    cache_snapshot.init_app(flask_app)
+    return flask_app
+
 # -------------------------
 # MAIN
 # -------------------------
 if __name__ == '__main__':
+    # development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
     PORT = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=PORT, debug=True)
+    DEBUG = os.environ.get("FLASK_DEBUG", "1") not in ("0", "false", "no")
+    create_app().run(host='0.0.0.0', port=PORT, debug=DEBUG)
@@ -0,0 +1,377 @@
+"""Intent inference cost as intents.json grows, per engine.
+
+Generates synthetic intent corpora at several scales (vocabulary x tags),
+builds the words/classes lists the way training.py does, creates the
+training.py network for each (trained only with --epochs), exports and
+reloads it, then runs main.py's own functions against it:
+
+    encode         main.bag_of_words(message)
+    forward        model.predict on one bag (verbose off)
+    forward_call   model(bag), skipping predict()'s per-call setup
+    predict        main.predict_class(message), end to end
+    response       main.get_response(...) with the web updates stubbed out
+    batch          bag_of_words for --batch messages + one predict, per message
+    add            tfidf only: index one more pattern, then classify a message
+
+Latency is reported per call (p50/p95, ms) and memory as model weight and
+export size, Python allocation peak per message (tracemalloc; TensorFlow's
+own buffers are not included) and peak RSS growth per scale. The `rules`
+engine is main.py's keyword fallback with one rule per synthetic tag; `pack`
+is the same network written by model_pack.py and served from its memory map,
+and `pack-int8` / `pack-float16` its quantized copies (their top intent is
+also compared with float32's on every message: top1_vs_float32). `tfidf` is
+intent_tfidf.py's nearest-neighbour index over the same patterns; its
+load_ms is the time to build the index.
+
+Results can be saved (--out) and checked against a stored baseline
+(--baseline): a stage whose p50 grew by more than --tolerance is reported
+and the exit status is 1.
+
+    python benchmarks/bench_inference.py [--scales 100x10,1000x50,10000x200,50000x1000]
+        [--engines keras,pack,pack-int8,pack-float16,tfidf,rules] [--messages 200] [--batch 32] [--epochs 0]
+        [--out run.json] [--baseline base.json] [--save-baseline base.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+# synthetic bundles are swapped in directly; don't watch model/ meanwhile
+os.environ.setdefault('MODEL_WATCH_SECONDS', '0')
+
+DEFAULT_SCALES = '100x10,1000x50,10000x200,50000x1000'
+STAGES = ('encode', 'forward', 'forward_call', 'predict', 'response', 'batch', 'add')
+IGNORE_SYMBOLS = ['?', '!', '.', ',']
+STUB_UPDATES = ['Update: simulated feed item one', 'Update: simulated feed item two']
+# training.py's dense bags are rows x vocabulary; beyond this they do not fit in memory
+MAX_TRAIN_CELLS = 2 * 10 ** 8
+_SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'ba', 'du', 'fe', 'gi', 'ho', 'ju', 'py',
+              'qua', 'shi', 'tre', 'wen', 'xo', 'yar', 'cel', 'dor']
+
+
+def _load_main():
+    sys.path.insert(0, ROOT)
+    import main
+    main.fetch_latest_disaster_updates = lambda tag: list(STUB_UPDATES)
+    return main
+
+
+def _vocabulary(n, rng):
+    out = set()
+    while len(out) < n:
+        out.add(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(out)
+
+
+def make_corpus(vocab_size, n_tags, seed=0):
+    """Return (intents_json, messages, rules); every vocabulary word appears in some pattern.
+
+    Each tag owns an equal share of the vocabulary; patterns mix 2-4 of the
+    tag's words with common words. Messages are (text, tag) pairs built the
+    same way plus a word outside the vocabulary; rules give each tag its
+    first owned word as a keyword for main.py's fallback.
+    """
+    rng = random.Random(seed)
+    vocab = _vocabulary(vocab_size, rng)
+    n_common = max(5, vocab_size // 20)
+    common, owned = vocab[:n_common], vocab[n_common:]
+    share = max(1, len(owned) // n_tags)
+    zipf = [1.0 / (i + 1) for i in range(n_common)]
+    intents = []
+    own_by_tag = []
+    for t in range(n_tags):
+        own = owned[t * share:(t + 1) * share] or [rng.choice(owned)]
+        if t == n_tags - 1:
+            own = owned[t * share:] or own
+        own_by_tag.append(own)
+        patterns = []
+        for i in range(0, len(own), 3):
+            words = own[i:i + 3] + rng.choices(common, zipf, k=rng.randint(2, 4))
+            rng.shuffle(words)
+            patterns.append(' '.join(words) + rng.choice(['', '?', '!']))
+        responses = [' '.join(rng.choices(vocab, k=rng.randint(8, 16))).capitalize() + '. '
+                     + ' '.join(rng.choices(vocab, k=rng.randint(6, 12))) + '.' for _ in range(6)]
+        intents.append({'tag': f'tag{t:04d}', 'patterns': patterns, 'responses': responses})
+
+    messages = []
+    for _ in range(1000):
+        t = rng.randrange(n_tags)
+        words = rng.sample(own_by_tag[t], min(2, len(own_by_tag[t]))) + rng.choices(common, zipf, k=3)
+        words.append('unknownword')
+        rng.shuffle(words)
+        messages.append((' '.join(words), f'tag{t:04d}'))
+    rules = {it['tag']: [own[0]] for it, own in zip(intents, own_by_tag)}
+    return {'intents': intents}, messages, rules
+
+
+def build_vocab(main, intents):
+    """words, classes and tokenized documents, as in training.py."""
+    import nltk
+    words, classes, documents = [], [], []
+    for intent in intents['intents']:
+        for pattern in intent['patterns']:
+            word_list = nltk.word_tokenize(pattern)
+            words.extend(word_list)
+            documents.append((word_list, intent['tag']))
+            if intent['tag'] not in classes:
+                classes.append(intent['tag'])
+    words = sorted(set(main.lemmatizer.lemmatize(w.lower()) for w in words if w not in IGNORE_SYMBOLS))
+    return words, sorted(set(classes)), documents
+
+
+def build_model(n_words, n_classes):
+    """The network from training.py."""
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Dropout
+    from tensorflow.keras.optimizers import SGD
+    model = Sequential()
+    model.add(Dense(128, input_shape=(n_words,), activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(64, activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(n_classes, activation='softmax'))
+    model.compile(loss='categorical_crossentropy', metrics=['accuracy'],
+                  optimizer=SGD(learning_rate=0.01, momentum=0.9, nesterov=True))
+    return model
+
+
+def train(main, model, words, classes, documents, epochs):
+    cells = len(documents) * len(words)
+    if cells > MAX_TRAIN_CELLS:
+        return {'skipped': f'{len(documents)} x {len(words)} dense bags do not fit in memory'}
+    index = {w: i for i, w in enumerate(words)}
+    x = np.zeros((len(documents), len(words)), dtype=np.float32)
+    y = np.zeros((len(documents), len(classes)), dtype=np.float32)
+    for row, (tokens, tag) in enumerate(documents):
+        for w in tokens:
+            i = index.get(main.lemmatizer.lemmatize(w.lower()))
+            if i is not None:
+                x[row, i] = 1
+        y[row, classes.index(tag)] = 1
+    start = time.perf_counter()
+    hist = model.fit(x, y, epochs=epochs, batch_size=5, verbose=0)
+    return {'seconds': round(time.perf_counter() - start, 2),
+            'accuracy': round(float(hist.history['accuracy'][-1]), 3)}
+
+
+def export_and_reload(model):
+    """Save like training.py and load like main.py; returns (model, bytes, load seconds)."""
+    from tensorflow.keras.models import load_model
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'chatbot_model.keras')
+        model.save(path)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        loaded = load_model(path)
+        return loaded, size, time.perf_counter() - start
+
+
+def export_pack(model, intents, words, classes, tmp, precision='float32'):
+    """Pack like model_pack.py and open it; returns (Pack, bytes, load seconds)."""
+    import model_pack
+    path = os.path.join(tmp, model_pack.PACK_FILE)
+    model_pack.write_pack(path, intents, words, classes, model_pack.dense_layers(model), quantized=(precision,))
+    start = time.perf_counter()
+    pack = model_pack.Pack(path)
+    return pack, os.path.getsize(path), time.perf_counter() - start
+
+
+def _install(main, intents, words, classes, model, rules=None):
+    import model_bundle
+    model_bundle.swap(model_bundle.Bundle(intents, words, classes, model, version='synthetic'))
+    if rules is not None:
+        main._RULES = rules
+
+
+def _timed(fn, items):
+    out = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def _summary(seconds, per=1):
+    s = sorted(seconds)
+    if not s:
+        return None
+    return {'p50_ms': round(s[len(s) // 2] / per * 1000, 4),
+            'p95_ms': round(s[min(len(s) - 1, int(0.95 * len(s)))] / per * 1000, 4),
+            'mean_ms': round(sum(s) / len(s) / per * 1000, 4)}
+
+
+def _alloc_peak_kib(fn, item):
+    tracemalloc.start()
+    try:
+        fn(item)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def _maxrss_mib():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_engine(main, engine, corpus, labelled, args):
+    intents, rules, words, classes, documents = corpus
+    messages = [text for text, _ in labelled]
+    out = {'words': len(words), 'classes': len(classes), 'stages': {}}
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    reference = None
+    if engine == 'keras' or engine.startswith('pack'):
+        model = build_model(len(words), len(classes))
+        if args.epochs:
+            out['train'] = train(main, model, words, classes, documents, args.epochs)
+        model, out['export_bytes'], load_s = export_and_reload(model)
+        out['weight_bytes'] = int(sum(w.nbytes for w in model.get_weights()))
+        if engine.startswith('pack'):
+            precision = engine.partition('-')[2] or 'float32'
+            with tempfile.TemporaryDirectory() as tmp:
+                # the mapping outlives the unlinked file
+                pack, out['export_bytes'], load_s = export_pack(model, intents, words, classes, tmp, precision)
+            model = pack.models[precision]
+            reference = pack.models['float32'] if precision != 'float32' else None
+            out['weight_bytes'] = model.nbytes
+            intents = pack.intents
+        out['load_ms'] = round(load_s * 1000, 1)
+        _install(main, intents, words, classes, model)
+    elif engine == 'tfidf':
+        import intent_tfidf
+        start = time.perf_counter()
+        index = intent_tfidf.TfidfIndex.from_intents(intents)
+        index.similarities('')
+        out['load_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        _install(main, intents, [], index.classes, index)
+    else:
+        _install(main, intents, words, classes, None, rules=rules)
+
+    warm = messages[:5]
+    with quiet:
+        for m in warm:
+            main.get_response(main.predict_class(m), main.intents)
+    stages = out['stages']
+    if engine == 'keras' or engine.startswith('pack'):
+        bows = [np.array([main.bag_of_words(m)]) for m in messages]
+        stages['encode'] = _summary(_timed(main.bag_of_words, messages))
+        stages['forward'] = _summary(_timed(lambda b: model.predict(b, verbose=0), bows))
+        if engine == 'keras':
+            stages['forward_call'] = _summary(_timed(lambda b: model(b, training=False), bows))
+        batches = [messages[i:i + args.batch] for i in range(0, len(messages), args.batch)]
+        batch_s = _timed(lambda ms: model.predict(np.array([main.bag_of_words(m) for m in ms]), verbose=0),
+                         batches)
+        stages['batch'] = _summary(batch_s, per=args.batch)
+        if reference is not None:
+            x = np.vstack(bows)
+            same = model.predict(x).argmax(axis=1) == reference.predict(x).argmax(axis=1)
+            out['top1_vs_float32'] = round(float(same.mean()), 4)
+    if engine == 'tfidf':
+        extra = [(tag, text) for text, tag in labelled[:50]]
+        stages['add'] = _summary(_timed(lambda tp: (index.add(*tp), index.classify(tp[1])), extra))
+    with quiet:
+        stages['predict'] = _summary(_timed(main.predict_class, messages))
+        predicted = [main.predict_class(m) for m in messages]
+        # build responses for the true tag so every call takes the full path
+        truth = [[{'intent': tag, 'probability': '1.0'}] for _, tag in labelled]
+        stages['response'] = _summary(_timed(lambda il: main.get_response(il, main.intents), truth))
+        out['alloc_peak_kib'] = _alloc_peak_kib(lambda m: main.get_response(main.predict_class(m), main.intents),
+                                                messages[0])
+    hits = sum(1 for p, (_, tag) in zip(predicted, labelled) if p and p[0]['intent'] == tag)
+    out['top1_accuracy'] = round(hits / len(labelled), 3)
+    return out
+
+
+def compare(baseline, results, tolerance, min_delta_ms=0.0):
+    """Return [(key, stage, before_ms, after_ms)] for p50 regressions beyond tolerance."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        for stage, summary in res['stages'].items():
+            before = (base['stages'].get(stage) or {}).get('p50_ms')
+            after = (summary or {}).get('p50_ms')
+            if before and after and after > before * (1 + tolerance) and after - before >= min_delta_ms:
+                regressions.append((key, stage, before, after))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--scales', default=DEFAULT_SCALES, help='vocabulary x tags, comma separated')
+    ap.add_argument('--engines', default='keras,pack,pack-int8,pack-float16,tfidf,rules')
+    ap.add_argument('--messages', type=int, default=200)
+    ap.add_argument('--batch', type=int, default=32)
+    ap.add_argument('--epochs', type=int, default=0, help='train each model first (latency does not need it)')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', help='write results JSON here')
+    ap.add_argument('--baseline', help='results JSON to check for regressions')
+    ap.add_argument('--save-baseline', help='also write the results as a new baseline here')
+    ap.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 growth before flagging')
+    ap.add_argument('--min-delta-ms', type=float, default=0.05, help='ignore smaller p50 changes (timer noise)')
+    args = ap.parse_args()
+
+    main_mod = _load_main()
+    engines = [e for e in args.engines.split(',') if e]
+    try:
+        import tensorflow  # noqa: F401
+    except Exception:
+        # the pack engines are built from a Keras model too
+        for e in [e for e in engines if e == 'keras' or e.startswith('pack')]:
+            print(f'{e}: TensorFlow is not installed, skipping')
+            engines.remove(e)
+
+    results = {}
+    print(f'{"engine@scale":<26}{"stage":<14}{"p50 ms":>10}{"p95 ms":>10}{"mean ms":>10}')
+    for scale in args.scales.split(','):
+        vocab_size, n_tags = (int(x) for x in scale.lower().split('x'))
+        intents, messages, rules = make_corpus(vocab_size, n_tags, seed=args.seed)
+        messages = messages[:args.messages]
+        corpus = (intents, rules) + build_vocab(main_mod, intents)
+        for engine in engines:
+            rss_before = _maxrss_mib()
+            res = bench_engine(main_mod, engine, corpus, messages, args)
+            res['peak_rss_growth_mib'] = round(_maxrss_mib() - rss_before, 1)
+            key = f'{engine}@{scale}'
+            results[key] = res
+            for stage in STAGES:
+                s = res['stages'].get(stage)
+                if s:
+                    print(f'{key:<26}{stage:<14}{s["p50_ms"]:>10}{s["p95_ms"]:>10}{s["mean_ms"]:>10}')
+            extra = {k: res[k] for k in ('top1_accuracy', 'top1_vs_float32', 'weight_bytes', 'export_bytes', 'load_ms',
+                                          'alloc_peak_kib', 'peak_rss_growth_mib', 'train') if k in res}
+            print(f'{key:<26}{json.dumps(extra)}')
+
+    report = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'scales': args.scales,
+                       'engines': engines, 'messages': args.messages, 'batch': args.batch,
+                       'epochs': args.epochs, 'seed': args.seed},
+              'results': results}
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), results, args.tolerance, args.min_delta_ms)
+        for key, stage, before, after in regressions:
+            print(f'REGRESSION {key} {stage}: p50 {before} -> {after} ms')
+        if regressions:
+            sys.exit(1)
+        print(f'no p50 regressions beyond {args.tolerance:.0%} against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
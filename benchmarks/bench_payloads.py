@@ -0,0 +1,109 @@
+"""Payload size / serialization time for /nearby_disasters and /map_pois.
+
+Builds synthetic responses shaped like the real ones (ReliefWeb items with
+their `raw` dict, OSM POIs with full tag sets) and compares the old path
+(stdlib json, full objects) against compact mode, field projection and
+orjson.
+
+    python benchmarks/bench_payloads.py [--events 50] [--pois 200]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import payloads  # noqa: E402
+
+
+def _words(n):
+    vocab = ['flood', 'river', 'district', 'relief', 'emergency', 'appeal', 'rain',
+             'cyclone', 'landslide', 'population', 'affected', 'response', 'health']
+    return ' '.join(random.choice(vocab) for _ in range(n))
+
+
+def make_events(n):
+    out = []
+    for i in range(n):
+        raw = {
+            'id': str(100000 + i),
+            'href': f'https://api.reliefweb.int/v1/disasters/{100000 + i}',
+            'fields': {
+                'name': f'Flood {i}',
+                'description': _words(400),
+                'country': [{'name': 'India', 'iso3': 'ind'}],
+                'type': [{'name': 'Flood'}, {'name': 'Flash Flood'}],
+                'status': 'ongoing',
+                'date': {'created': '2025-09-01T00:00:00+00:00'},
+            },
+        }
+        out.append({
+            'id': raw['href'], 'source': 'reliefweb', 'type': 'declared_disaster',
+            'title': f'Flood {i}', 'description': _words(60), 'time': '2025-09-01T00:00:00Z',
+            'lat': 20.0 + random.random(), 'lon': 78.0 + random.random(),
+            'url': raw['href'], 'mag': None, 'raw': raw, '_distance_km': round(random.random() * 20, 2),
+        })
+    return out
+
+
+def make_pois(n):
+    out = []
+    for i in range(n):
+        tags = {'amenity': 'hospital', 'name': f'Hospital {i}', 'addr:street': 'Main Road',
+                'addr:city': 'Delhi', 'phone': '+91 11 0000 0000', 'website': 'https://example.org',
+                'opening_hours': '24/7', 'healthcare': 'hospital', 'emergency': 'yes'}
+        for k in ('operator', 'operator:type', 'beds', 'source', 'wikidata', 'wikipedia',
+                  'name:hi', 'name:en', 'check_date', 'building', 'note', 'description'):
+            tags[k] = _words(4)
+        out.append({'id': 1000 + i, 'osm_type': 'node', 'lat': 28.5 + random.random() / 10,
+                    'lon': 77.2 + random.random() / 10, 'name': tags['name'], 'tags': tags,
+                    'distance_km': round(random.random() * 20, 3)})
+    return out
+
+
+def _stdlib_dumps(payload):
+    # what flask.jsonify does by default
+    return json.dumps(payload, sort_keys=True).encode('utf-8')
+
+
+def bench(label, fn, payload, repeat):
+    body = fn(payload)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    dt = (time.perf_counter() - t0) / repeat
+    print(f'{label:<44} {len(body) / 1024:9.1f} KiB {dt * 1e3:9.3f} ms')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--events', type=int, default=50)
+    ap.add_argument('--pois', type=int, default=200)
+    ap.add_argument('--repeat', type=int, default=200)
+    args = ap.parse_args()
+    random.seed(0)
+
+    events = make_events(args.events)
+    pois = make_pois(args.pois)
+    fast = 'orjson' if payloads.orjson is not None else 'json (orjson not installed)'
+    print(f'{"case":<44} {"size":>13} {"encode":>12}')
+
+    bench('disasters full, stdlib json', _stdlib_dumps, {'disasters': events}, args.repeat)
+    bench(f'disasters full, {fast}', payloads.dumps, {'disasters': events}, args.repeat)
+    page, _ = payloads.shape(events, {'compact': True}, payloads.compact_event)
+    bench(f'disasters compact, {fast}', payloads.dumps, {'disasters': page}, args.repeat)
+    page, _ = payloads.shape(events, {'fields': 'id,title,time,source,url,lat,lon'}, payloads.compact_event)
+    bench(f'disasters fields=map UI, {fast}', payloads.dumps, {'disasters': page}, args.repeat)
+
+    bench('pois full, stdlib json', _stdlib_dumps, {'pois': pois}, args.repeat)
+    bench(f'pois full, {fast}', payloads.dumps, {'pois': pois}, args.repeat)
+    page, _ = payloads.shape(pois, {'compact': True}, payloads.compact_poi)
+    bench(f'pois compact, {fast}', payloads.dumps, {'pois': page}, args.repeat)
+    page, _ = payloads.shape(pois, {'compact': True, 'page_size': 50}, payloads.compact_poi)
+    bench(f'pois compact page_size=50, {fast}', payloads.dumps, {'pois': page}, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
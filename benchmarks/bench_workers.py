@@ -0,0 +1,145 @@
+"""Throughput of gunicorn worker models under a slow simulated upstream.
+
+Starts a stub Overpass endpoint that answers after --delay seconds, points
+the app at it (OVERPASS_ENDPOINTS), then for each worker class runs
+`gunicorn -c gunicorn.conf.py wsgi:app` and drives /map_pois with
+--clients concurrent clients for --seconds. Every request uses a fresh
+coordinate so it misses the POI caches and really waits on the upstream.
+
+    python benchmarks/bench_workers.py [--delay 0.2] [--clients 64] [--workers 2]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import itertools
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_stub(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(delay)
+            body = json.dumps({'elements': [
+                {'type': 'node', 'id': 1, 'lat': 28.6, 'lon': 77.2, 'tags': {'amenity': 'hospital', 'name': 'Stub'}}
+            ]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{srv.server_port}/api/interpreter'
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait_ready(url, timeout=30):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            requests.get(url + '/model_status', timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+
+def drive(base, clients, seconds):
+    counter = itertools.count()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.time() + seconds
+
+    def client():
+        s = requests.Session()
+        while time.time() < stop:
+            i = next(counter)
+            body = {'lat': 10 + (i % 100000) * 1e-4, 'lon': 77.2, 'radius_m': 1000, 'kind': 'all', 'limit': 10}
+            t0 = time.perf_counter()
+            try:
+                r = s.post(base + '/map_pois', json=body, timeout=30)
+                ok = r.status_code == 200
+            except Exception:
+                ok = False
+            dt = time.perf_counter() - t0
+            with lock:
+                if ok:
+                    latencies.append(dt)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    t0 = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - t0
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+
+    return {'ok': len(latencies), 'errors': errors[0], 'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': pct(0.50), 'p95_ms': pct(0.95)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--delay', type=float, default=0.2, help='upstream latency in seconds')
+    ap.add_argument('--clients', type=int, default=64)
+    ap.add_argument('--seconds', type=float, default=10)
+    ap.add_argument('--workers', type=int, default=2)
+    ap.add_argument('--classes', default='sync,gthread,gevent')
+    args = ap.parse_args()
+
+    stub = start_stub(args.delay)
+    print(f'upstream delay {args.delay * 1000:.0f} ms, {args.clients} clients, {args.workers} workers')
+    print(f'{"worker class":<14}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+    for cls in args.classes.split(','):
+        port = _free_port()
+        env = dict(os.environ, OVERPASS_ENDPOINTS=stub, WORKER_CLASS=cls, WEB_CONCURRENCY=str(args.workers),
+                   BIND=f'127.0.0.1:{port}', ACCESS_LOG='/dev/null', POI_BACKEND='overpass', ALERTS_STREAM='0')
+        if cls == 'sync':
+            # gunicorn silently switches sync to gthread when threads > 1
+            env['THREADS'] = '1'
+        proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = f'http://127.0.0.1:{port}'
+            if not _wait_ready(base):
+                print(f'{cls:<14} failed to start')
+                continue
+            r = drive(base, args.clients, args.seconds)
+            print(f'{cls:<14}{r["rps"]:>10}{r["p50_ms"]:>10}{r["p95_ms"]:>10}{r["errors"]:>8}')
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
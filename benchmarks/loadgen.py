@@ -0,0 +1,305 @@
+"""Load generator for the main routes, with results saved for comparison.
+
+Drives /handle_message, /nearby_disasters, /map_pois and /latest_updates
+with a weighted mix of realistic requests: chat messages drawn from
+intents.json, and coordinates that are mostly a handful of popular cities
+(--hot, so caches warm up the way they do in production) and otherwise
+random points that miss every cache. Reports throughput and p50/p95/p99 per
+route and overall, and writes them as JSON (--out) so runs can be compared
+(--compare old.json).
+
+By default every client sends its next request as soon as the previous one
+returns. With --rate the arrival rate is fixed instead and latency is
+measured from each request's scheduled send time, so a stalled server shows
+up in the percentiles rather than just lowering throughput.
+
+Against a running app (started with UPSTREAM_BASE_URL, see upstream_sim.py):
+
+    python benchmarks/loadgen.py --base http://127.0.0.1:5000 --sim http://127.0.0.1:8900 --out run.json
+
+Or let it start the simulator and gunicorn itself:
+
+    python benchmarks/loadgen.py --spawn --profile realistic --worker-class gevent --out gevent.json
+    python benchmarks/loadgen.py --spawn --worker-class gthread --compare gevent.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import upstream_sim  # noqa: E402
+from bench_workers import ROOT, _free_port, _wait_ready  # noqa: E402
+
+DEFAULT_MIX = 'handle_message=5,map_pois=2,nearby_disasters=2,latest_updates=1'
+CITIES = [
+    ('New Delhi', 28.6139, 77.2090, 'India'),
+    ('Mumbai', 19.0760, 72.8777, 'India'),
+    ('Tokyo', 35.6812, 139.7671, 'Japan'),
+    ('Manila', 14.5995, 120.9842, 'Philippines'),
+    ('Houston', 29.7604, -95.3698, 'United States'),
+    ('Jakarta', -6.2088, 106.8456, 'Indonesia'),
+    ('Santiago', -33.4489, -70.6693, 'Chile'),
+    ('Istanbul', 41.0082, 28.9784, 'Turkey'),
+]
+POI_KINDS = ['hospital', 'pharmacy', 'police', 'fire_station', 'school', 'fuel']
+UPDATE_TAGS = ['general', 'earthquake', 'flood', 'hurricane_cyclone_typhoon', 'wildfire', 'tsunami']
+FREE_TEXT = ['what should I do now', 'is it safe to go outside', 'where is the nearest shelter',
+             'my house is shaking', 'the river is rising fast', 'any updates?']
+
+
+def _messages():
+    with open(os.path.join(ROOT, 'intents.json'), 'r', encoding='utf-8') as f:
+        intents = json.load(f)['intents']
+    return [p for it in intents for p in it.get('patterns', [])] + FREE_TEXT
+
+
+class Workload:
+    """Builds (route, json body) pairs for the configured mix."""
+
+    def __init__(self, mix, hot, seed=None):
+        self.routes = [r for r, _ in mix]
+        self.weights = [w for _, w in mix]
+        self.hot = hot
+        self.rng = random.Random(seed)
+        self.messages = _messages()
+        self.lock = threading.Lock()
+
+    def _place(self):
+        if self.rng.random() < self.hot:
+            _, lat, lon, country = self.rng.choice(CITIES)
+            return lat, lon, country
+        # cold: a random populated-ish latitude band, misses every cache
+        return round(self.rng.uniform(-40, 60), 4), round(self.rng.uniform(-120, 150), 4), None
+
+    def next(self):
+        with self.lock:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            return route, getattr(self, '_' + route)()
+
+    def _handle_message(self):
+        return {'message': self.rng.choice(self.messages)}
+
+    def _nearby_disasters(self):
+        lat, lon, country = self._place()
+        body = {'lat': lat, 'lon': lon, 'radius_km': self.rng.choice([20, 50, 100, 200]), 'compact': True}
+        if country:
+            body['country'] = country
+        return body
+
+    def _map_pois(self):
+        lat, lon, _ = self._place()
+        body = {'lat': lat, 'lon': lon, 'radius_m': self.rng.choice([1000, 2000, 5000]), 'limit': 50, 'compact': True}
+        if self.rng.random() < 0.5:
+            body['kinds'] = self.rng.sample(POI_KINDS, self.rng.randint(2, 4))
+        else:
+            body['kind'] = self.rng.choice(POI_KINDS)
+        return body
+
+    def _latest_updates(self):
+        return {'tag': self.rng.choice(UPDATE_TAGS)}
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().lstrip('/')
+        if not hasattr(Workload, '_' + name):
+            raise SystemExit(f'unknown route in --mix: {name}')
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def run(base, workload, clients, seconds, rate=None, timeout=30):
+    """Drive the app; returns {route: [(latency_s, status), ...]}."""
+    samples = {r: [] for r in workload.routes}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    stop = start + seconds
+    slot = [0]
+
+    def client():
+        s = requests.Session()
+        while True:
+            if rate:
+                with lock:
+                    i = slot[0]
+                    slot[0] += 1
+                sent = start + i / rate
+                if sent >= stop:
+                    return
+                time.sleep(max(0.0, sent - time.perf_counter()))
+            else:
+                sent = time.perf_counter()
+                if sent >= stop:
+                    return
+            route, body = workload.next()
+            try:
+                status = s.post(f'{base}/{route}', json=body, timeout=timeout).status_code
+            except requests.RequestException:
+                status = 'error'
+            with lock:
+                samples[route].append((time.perf_counter() - sent, status))
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    latencies = sorted(lat for lat, _ in results)
+    ok = sum(1 for _, st in results if isinstance(st, int) and st < 400)
+    errors = {}
+    for _, st in results:
+        if not (isinstance(st, int) and st < 400):
+            errors[str(st)] = errors.get(str(st), 0) + 1
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+    return {
+        'requests': len(results),
+        'ok': ok,
+        'errors': errors,
+        'rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def print_report(report):
+    print(f'{"route":<18}{"req":>8}{"ok":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}  errors')
+    rows = list(report['routes'].items()) + [('overall', report['overall'])]
+    for name, r in rows:
+        print(f'{name:<18}{r["requests"]:>8}{r["ok"]:>8}{r["rps"]:>9}{r["p50_ms"] or "-":>9}'
+              f'{r["p95_ms"] or "-":>9}{r["p99_ms"] or "-":>9}  {r["errors"] or ""}')
+
+
+def print_comparison(old, new):
+    print(f'\ncompared with {old["meta"].get("label") or old["meta"].get("timestamp")}:')
+    print(f'{"route":<18}{"metric":<8}{"before":>10}{"after":>10}{"change":>9}')
+    names = [n for n in new['routes'] if n in old['routes']] + ['overall']
+    for name in names:
+        a = old['overall'] if name == 'overall' else old['routes'][name]
+        b = new['overall'] if name == 'overall' else new['routes'][name]
+        for metric in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            x, y = a.get(metric), b.get(metric)
+            change = f'{(y - x) / x * 100:+.1f}%' if x and y is not None else '-'
+            print(f'{name:<18}{metric:<8}{x if x is not None else "-":>10}{y if y is not None else "-":>10}{change:>9}')
+
+
+def spawn(args):
+    """Start the simulator and gunicorn pointed at it; returns (base, sim_base, proc)."""
+    _, sim_base = upstream_sim.start(args.profile, seed=args.seed)
+    port = _free_port()
+    tmp = tempfile.mkdtemp(prefix='loadgen-')
+    env = dict(os.environ, UPSTREAM_BASE_URL=sim_base, BIND=f'127.0.0.1:{port}', ACCESS_LOG='/dev/null',
+               WEB_CONCURRENCY=str(args.workers), EVENT_STORE_PATH=os.path.join(tmp, 'events.db'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp, 'prometheus'), ALERTS_STREAM='0')
+    env.pop('OVERPASS_ENDPOINTS', None)
+    env.pop('REDIS_URL', None)
+    if args.worker_class:
+        env['WORKER_CLASS'] = args.worker_class
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    if not _wait_ready(base):
+        proc.terminate()
+        raise SystemExit('gunicorn did not start')
+    return base, sim_base, proc
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--base', default='http://127.0.0.1:5000', help='app URL (ignored with --spawn)')
+    ap.add_argument('--sim', help='simulator URL, to include its per-host counts in the results')
+    ap.add_argument('--spawn', action='store_true', help='start the simulator and gunicorn')
+    ap.add_argument('--profile', default='realistic', help='simulator profile for --spawn')
+    ap.add_argument('--worker-class', help='WORKER_CLASS for --spawn')
+    ap.add_argument('--workers', type=int, default=2, help='WEB_CONCURRENCY for --spawn')
+    ap.add_argument('--mix', default=DEFAULT_MIX, help='route=weight,...')
+    ap.add_argument('--hot', type=float, default=0.8, help='fraction of requests for popular cities')
+    ap.add_argument('--clients', type=int, default=32)
+    ap.add_argument('--rate', type=float, help='fixed arrival rate in req/s (open loop)')
+    ap.add_argument('--seconds', type=float, default=30)
+    ap.add_argument('--warmup', type=float, default=5, help='seconds driven before measuring')
+    ap.add_argument('--seed', type=int)
+    ap.add_argument('--label', help='name for this run in comparisons')
+    ap.add_argument('--out', help='write results JSON here')
+    ap.add_argument('--compare', help='previous results JSON to compare against')
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    proc = None
+    base, sim_base = args.base.rstrip('/'), args.sim
+    if args.spawn:
+        base, sim_base, proc = spawn(args)
+    try:
+        workload = Workload(mix, args.hot, seed=args.seed)
+        if args.warmup > 0:
+            run(base, workload, args.clients, args.warmup, rate=args.rate)
+        if sim_base:
+            requests.post(sim_base + '/_sim/reset', timeout=5)
+        samples, elapsed = run(base, workload, args.clients, args.seconds, rate=args.rate)
+        upstream = requests.get(sim_base + '/_sim/stats', timeout=5).json() if sim_base else None
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    report = {
+        'meta': {
+            'label': args.label,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': _git_commit(),
+            'base': base,
+            'clients': args.clients,
+            'rate': args.rate,
+            'seconds': args.seconds,
+            'warmup': args.warmup,
+            'mix': dict(mix),
+            'hot': args.hot,
+            'seed': args.seed,
+            'profile': args.profile if args.spawn else None,
+            'worker_class': args.worker_class if args.spawn else None,
+        },
+        'overall': summarize([s for per_route in samples.values() for s in per_route], elapsed),
+        'routes': {r: summarize(s, elapsed) for r, s in samples.items()},
+        'upstream': upstream,
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nresults written to {args.out}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
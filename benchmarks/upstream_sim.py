@@ -0,0 +1,277 @@
+"""Local stand-in for every upstream the app calls, for load tests.
+
+Serves the recorded payloads in benchmarks/fixtures/<host>.json with a
+configurable latency, error and 429 profile per host. Start the app with
+UPSTREAM_BASE_URL pointing here and aio.upstream_url() sends each request
+for https://<host>/<path> to <base>/<host>/<path> instead:
+
+    python benchmarks/upstream_sim.py --port 8900 --profile realistic
+    UPSTREAM_BASE_URL=http://127.0.0.1:8900 gunicorn -c gunicorn.conf.py wsgi:app
+
+Fixtures with "recenter" have their coordinates shifted from "origin" to the
+point being queried (latitude/longitude, point=, Overpass around: or bbox),
+so every coordinate the load generator asks about has nearby results.
+Profiles are the names in PROFILES or a JSON file of the same shape; GET
+/_sim/stats returns per-host counts and POST /_sim/reset clears them.
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Per-host behaviour; "hosts" entries override "default" key by key.
+#   latency_ms / jitter_ms   uniform latency in [latency - jitter, latency + jitter]
+#   slow_rate / slow_ms      fraction of responses that take slow_ms instead (the tail)
+#   error_rate               fraction answered 500
+#   rate_429 / retry_after   fraction answered 429 with Retry-After: retry_after
+PROFILES = {
+    'fast': {'default': {'latency_ms': 2}},
+    'realistic': {
+        'default': {'latency_ms': 120, 'jitter_ms': 60, 'slow_rate': 0.02, 'slow_ms': 1500},
+        'hosts': {
+            'overpass-api.de': {'latency_ms': 700, 'jitter_ms': 300, 'slow_rate': 0.05, 'slow_ms': 4000,
+                                'rate_429': 0.01, 'retry_after': 5},
+            'nominatim.openstreetmap.org': {'latency_ms': 250, 'jitter_ms': 100},
+            'ip-api.com': {'latency_ms': 60, 'jitter_ms': 20},
+        },
+    },
+    'degraded': {
+        'default': {'latency_ms': 400, 'jitter_ms': 200, 'slow_rate': 0.1, 'slow_ms': 5000, 'error_rate': 0.1},
+    },
+    'throttled': {
+        'default': {'latency_ms': 120, 'jitter_ms': 60},
+        'hosts': {
+            'overpass-api.de': {'latency_ms': 700, 'jitter_ms': 300, 'rate_429': 0.5, 'retry_after': 10},
+            'nominatim.openstreetmap.org': {'latency_ms': 250, 'rate_429': 0.3, 'retry_after': 2},
+        },
+    },
+}
+DEFAULTS = {'latency_ms': 0, 'jitter_ms': 0, 'slow_rate': 0.0, 'slow_ms': 0,
+            'error_rate': 0.0, 'rate_429': 0.0, 'retry_after': 5}
+
+_AROUND = re.compile(r'around:\s*[\d.]+\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)')
+_BBOX = re.compile(r'\(\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*\)')
+_BUSY_STATUS = ('Rate limit: 2\n0 slots available now.\n'
+                'Slot available after: {at}, in {secs} seconds.\n')
+
+
+def load_profile(name_or_path):
+    if name_or_path in PROFILES:
+        return PROFILES[name_or_path]
+    with open(name_or_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """{host: [route, ...]} with routes sorted longest path first."""
+    out = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            routes = json.load(f)['routes']
+        for r in routes:
+            if 'recenter' not in r:
+                # static payloads are encoded once
+                r['_encoded'] = r['text'].encode() if 'text' in r else json.dumps(r['body']).encode()
+        out[name[:-len('.json')]] = sorted(routes, key=lambda r: -len(r['path']))
+    return out
+
+
+def _query_centre(query, body):
+    """(lat, lon) the request is about, or None."""
+    q = parse_qs(query)
+    for lat_key, lon_key in (('latitude', 'longitude'), ('lat', 'lon')):
+        if lat_key in q and lon_key in q:
+            return float(q[lat_key][0]), float(q[lon_key][0])
+    if 'point' in q:
+        lat, lon = q['point'][0].split(',')
+        return float(lat), float(lon)
+    if body:
+        text = body.decode('utf-8', 'replace')
+        form = parse_qs(text)
+        if 'data' in form:
+            text = form['data'][0]
+        m = _AROUND.search(text)
+        if m:
+            return float(m.group(1)), float(m.group(2))
+        boxes = [tuple(map(float, b)) for b in _BBOX.findall(text)]
+        if boxes:
+            return (sum(b[0] + b[2] for b in boxes) / (2 * len(boxes)),
+                    sum(b[1] + b[3] for b in boxes) / (2 * len(boxes)))
+    return None
+
+
+def _recenter(route, centre):
+    body = copy.deepcopy(route['body'])
+    if centre is None:
+        return body
+    dlat = centre[0] - route['origin'][0]
+    dlon = centre[1] - route['origin'][1]
+    if route['recenter'] == 'geojson':
+        for feat in body.get('features', []):
+            c = (feat.get('geometry') or {}).get('coordinates')
+            if c and len(c) >= 2:
+                c[0] = round(c[0] + dlon, 5)
+                c[1] = round(c[1] + dlat, 5)
+    elif route['recenter'] == 'overpass':
+        for el in body.get('elements', []):
+            for p in (el, el.get('center')):
+                if p and 'lat' in p:
+                    p['lat'] = round(p['lat'] + dlat, 7)
+                    p['lon'] = round(p['lon'] + dlon, 7)
+    return body
+
+
+class Simulator:
+    def __init__(self, profile, fixtures, seed=None):
+        self.profile = profile
+        self.fixtures = fixtures
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.throttled_until = {}
+
+    def settings(self, host):
+        s = dict(DEFAULTS)
+        s.update(self.profile.get('default', {}))
+        s.update(self.profile.get('hosts', {}).get(host, {}))
+        return s
+
+    def route(self, host, method, path):
+        for r in self.fixtures.get(host, ()):
+            if path.startswith(r['path']) and r.get('method', 'GET') == method:
+                return r
+        return None
+
+    def count(self, host, status):
+        with self.lock:
+            per_host = self.stats.setdefault(host, {})
+            per_host[str(status)] = per_host.get(str(status), 0) + 1
+
+    def latency(self, s):
+        if s['slow_rate'] and self.rng.random() < s['slow_rate']:
+            return s['slow_ms'] / 1000.0
+        return max(0.0, s['latency_ms'] + self.rng.uniform(-s['jitter_ms'], s['jitter_ms'])) / 1000.0
+
+    def handle(self, method, raw_path, body):
+        """Return (status, headers, payload) for one proxied request."""
+        parts = urlsplit(raw_path)
+        host, _, rest = parts.path.lstrip('/').partition('/')
+        host = host.split(':')[0]
+        path = '/' + rest
+        route = self.route(host, method, path)
+        if route is None:
+            self.count(host, 404)
+            return 404, {'Content-Type': 'text/plain'}, f'no fixture for {method} {host}{path}\n'.encode()
+
+        s = self.settings(host)
+        time.sleep(self.latency(s))
+        roll = self.rng.random()
+        if roll < s['rate_429']:
+            with self.lock:
+                self.throttled_until[host] = time.time() + s['retry_after']
+            self.count(host, 429)
+            return 429, {'Content-Type': 'text/plain', 'Retry-After': str(s['retry_after'])}, b'rate limited\n'
+        if roll < s['rate_429'] + s['error_rate']:
+            self.count(host, 500)
+            return 500, {'Content-Type': 'text/plain'}, b'upstream error\n'
+
+        self.count(host, 200)
+        headers = {'Content-Type': route['content_type']}
+        if path.endswith('/status'):
+            # Overpass reports its slot wait here; overpass_pool reads it after a 429
+            wait = self.throttled_until.get(host, 0) - time.time()
+            if wait > 0:
+                at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + wait))
+                return 200, headers, _BUSY_STATUS.format(at=at, secs=int(wait) + 1).encode()
+        if 'recenter' in route:
+            payload = json.dumps(_recenter(route, _query_centre(parts.query, body))).encode()
+        else:
+            payload = route['_encoded']
+        return 200, headers, payload
+
+
+def make_server(sim, host='127.0.0.1', port=0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, headers, payload):
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _dispatch(self, method):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.path.startswith('/_sim/'):
+                if self.path.startswith('/_sim/reset'):
+                    with sim.lock:
+                        sim.stats.clear()
+                with sim.lock:
+                    payload = json.dumps(sim.stats).encode()
+                return self._reply(200, {'Content-Type': 'application/json'}, payload)
+            self._reply(*sim.handle(method, self.path, body))
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def start(profile='realistic', fixtures_dir=FIXTURES_DIR, host='127.0.0.1', port=0, seed=None):
+    """Serve in a background thread; returns (server, base_url)."""
+    if isinstance(profile, str):
+        profile = load_profile(profile)
+    srv = make_server(Simulator(profile, load_fixtures(fixtures_dir), seed=seed), host, port)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f'http://{host}:{srv.server_port}'
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8900)
+    ap.add_argument('--profile', default='realistic', help=f'{", ".join(PROFILES)} or a JSON file')
+    ap.add_argument('--fixtures', default=FIXTURES_DIR)
+    ap.add_argument('--seed', type=int)
+    ap.add_argument('--latency-ms', type=float, help='override the default latency for every host')
+    ap.add_argument('--error-rate', type=float, help='override the default 500 rate')
+    ap.add_argument('--rate-429', type=float, help='override the default 429 rate')
+    args = ap.parse_args()
+
+    profile = copy.deepcopy(load_profile(args.profile))
+    overrides = {'latency_ms': args.latency_ms, 'error_rate': args.error_rate, 'rate_429': args.rate_429}
+    profile.setdefault('default', {}).update({k: v for k, v in overrides.items() if v is not None})
+    srv, base = start(profile, args.fixtures, args.host, args.port, args.seed)
+    print(f'upstream simulator ({args.profile}) on {base}')
+    print(f'run the app with UPSTREAM_BASE_URL={base}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
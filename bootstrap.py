@@ -0,0 +1,112 @@
+import os
+import asyncio
+
+import aio
+import location
+import payloads
+
+# Everything the page needs after load, in one request: location (from the
+# browser's coordinates or the client IP), nearby disasters, POIs of the
+# default kinds and general updates. Once the location is known the three
+# lookups run concurrently on the shared upstream loop, so the response
+# takes as long as the slowest upstream instead of the sum of the round
+# trips. `stream()` emits each part as an NDJSON line as soon as it is ready.
+# The caller resolves the location once (resolve_location, or the session's
+# own) and passes it to build() or stream().
+POI_KINDS = [k for k in os.environ.get('BOOTSTRAP_POI_KINDS', 'hospital,pharmacy,police,fire_station').split(',') if k]
+POI_LIMIT = 50
+PARTS = ('disasters', 'pois', 'updates')
+
+
+def parse_options(data):
+    """Normalize a /bootstrap request body; raises ValueError on bad numbers."""
+    kinds = data.get('kinds') or POI_KINDS
+    if isinstance(kinds, str):
+        kinds = [k.strip() for k in kinds.split(',') if k.strip()]
+    opts = {
+        'lat': None,
+        'lon': None,
+        'label': data.get('label') or '',
+        'radius_km': float(data.get('radius_km') or 20),
+        'days': int(data.get('days') or 180),
+        'country': data.get('country'),
+        'kinds': list(kinds),
+        'limit': int(data.get('limit') or POI_LIMIT),
+        'shape': {k: data.get(k) for k in ('compact', 'fields', 'offset', 'page_size')},
+    }
+    if data.get('lat') is not None and data.get('lon') is not None:
+        opts['lat'] = float(data['lat'])
+        opts['lon'] = float(data['lon'])
+    return opts
+
+
+async def resolve_location(ip, opts):
+    if opts['lat'] is not None:
+        return {'lat': opts['lat'], 'lon': opts['lon'], 'display_name': opts['label'] or 'You are here'}
+    return await location.lookup_ip_async(ip)
+
+
+async def _disasters(loc, opts):
+    from disasters import get_nearby_disasters_async
+    import event_store
+    res = await get_nearby_disasters_async(lat=loc['lat'], lon=loc['lon'], radius_km=opts['radius_km'],
+                                           days=opts['days'], country=opts['country'])
+    page, next_offset = payloads.shape(res, opts['shape'], payloads.compact_event)
+    # blocking SQLite read: keep it off the shared loop the other parts run on
+    cursor = await asyncio.get_running_loop().run_in_executor(None, event_store.current_cursor)
+    return {'disasters': page, 'cursor': cursor, 'next_offset': next_offset}
+
+
+async def _pois(loc, opts):
+    import overpass
+    radius_m = max(100, int(opts['radius_km'] * 1000))
+    by_kind = await overpass.search_pois_multi_async(lat=loc['lat'], lon=loc['lon'], radius_m=radius_m,
+                                                     kinds=opts['kinds'], limit=opts['limit'])
+    out = {}
+    for k, pois in by_kind.items():
+        page, next_offset = payloads.shape(pois, opts['shape'], payloads.compact_poi)
+        out[k] = {'pois': page, 'next_offset': next_offset}
+    return out
+
+
+async def _updates(loc, opts):
+    import updates
+    return await updates.fetch_latest_disaster_updates_async('general')
+
+
+def part_coros(loc, opts):
+    return {'disasters': _disasters(loc, opts), 'pois': _pois(loc, opts), 'updates': _updates(loc, opts)}
+
+
+def _error(e):
+    retry_after = getattr(e, 'retry_after', None)
+    return {'error': str(e) or type(e).__name__, 'retry_after': retry_after}
+
+
+async def build(loc, opts):
+    """Return the combined payload for the resolved `loc` (None when it could not
+    be detected); a failing part is reported under `errors`."""
+    out = {'location': loc, 'errors': {}}
+    if not loc:
+        out['errors']['location'] = {'error': 'Could not detect location'}
+        return out
+    coros = part_coros(loc, opts)
+    results = await asyncio.gather(*coros.values(), return_exceptions=True)
+    for name, res in zip(coros, results):
+        if isinstance(res, Exception):
+            out['errors'][name] = _error(res)
+        else:
+            out[name] = res
+    return out
+
+
+def stream(loc, opts):
+    """Yield NDJSON lines {"part": ..., "data" | "error": ...}, location first, then by completion."""
+    if not loc:
+        yield payloads.dumps({'part': 'location', 'error': 'Could not detect location'}) + b'\n'
+        return
+    yield payloads.dumps({'part': 'location', 'data': loc}) + b'\n'
+    for name, res, err in aio.as_completed(part_coros(loc, opts)):
+        line = {'part': name, **_error(err)} if err is not None else {'part': name, 'data': res}
+        yield payloads.dumps(line) + b'\n'
+    yield payloads.dumps({'part': 'done'}) + b'\n'
@@ -1,12 +1,17 @@
 import time
+import inspect
+import metrics
 from threading import Lock
 from functools import wraps
 
 _CACHE = {}
 _LOCK = Lock()
+# 'module.qualname' of fn -> that function's insert path, for entries
+# restored from a snapshot; it is also key[0] of fn's entries in _CACHE
+_STORES = {}
 
 def ttl_cache(ttl_seconds=60):
-    """Simple thread-safe TTL cache decorator.
+    """Simple thread-safe TTL cache decorator (works on coroutine functions too).
 
     Usage:
         @ttl_cache(30)
@@ -14,18 +19,82 @@ def ttl_cache(ttl_seconds=60):
             ...
     """
     def deco(fn):
-        @wraps(fn)
-        def wrapped(*args, **kwargs):
-            key = (fn.__name__, args, tuple(sorted(kwargs.items())))
-            now = time.time()
+        sig = inspect.signature(fn)
+        # qualified: same-named functions in two modules must not share entries
+        name = f'{fn.__module__}.{fn.__qualname__}'
+        keys = set()        # fn's keys in _CACHE
+        swept = [0.0]       # last time fn's expired entries were dropped
+
+        def make_key(args, kwargs):
+            # bind to parameter names so f(1, b=2) and f(a=1, b=2) share an entry
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return (name, tuple(bound.arguments.items()))
+
+        def lookup(key, now):
             with _LOCK:
                 rec = _CACHE.get(key)
-                if rec and rec[0] > now:
-                    return rec[1]
-            # compute outside lock to avoid blocking long calls
-            result = fn(*args, **kwargs)
+                hit = bool(rec and rec[0] > now)
+            metrics.cache_lookup(name, hit)
+            return (True, rec[1]) if hit else (False, None)
+
+        def store(key, expires, result):
+            now = time.time()
             with _LOCK:
-                _CACHE[key] = (now + ttl_seconds, result)
-            return result
+                _CACHE[key] = (expires, result)
+                keys.add(key)
+                if now - swept[0] >= ttl_seconds:
+                    # at most once per TTL, so the size below counts live entries
+                    swept[0] = now
+                    for k in [k for k in keys if _CACHE[k][0] <= now]:
+                        del _CACHE[k]
+                        keys.discard(k)
+                n = len(keys)
+            metrics.cache_size(name, n)
+
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def wrapped(*args, **kwargs):
+                key = make_key(args, kwargs)
+                now = time.time()
+                hit, value = lookup(key, now)
+                if hit:
+                    return value
+                result = await fn(*args, **kwargs)
+                store(key, now + ttl_seconds, result)
+                return result
+        else:
+            @wraps(fn)
+            def wrapped(*args, **kwargs):
+                key = make_key(args, kwargs)
+                now = time.time()
+                hit, value = lookup(key, now)
+                if hit:
+                    return value
+                # compute outside lock to avoid blocking long calls
+                result = fn(*args, **kwargs)
+                store(key, now + ttl_seconds, result)
+                return result
+
+        def cache_set(result, *args, **kwargs):
+            """Store `result` as the cached value for this call signature."""
+            store(make_key(args, kwargs), time.time() + ttl_seconds, result)
+
+        def cache_lookup(*args, **kwargs):
+            """Return (hit, value) for this call signature without calling fn."""
+            return lookup(make_key(args, kwargs), time.time())
+
+        wrapped.cache_set = cache_set
+        wrapped.cache_lookup = cache_lookup
+        _STORES[name] = store
         return wrapped
     return deco
+
+
+def _cache_put(key, value, expires):
+    """Insert an entry saved by cache_snapshot; False if its function is not cached here."""
+    store = _STORES.get(key[0])
+    if store is None:
+        return False
+    store(key, expires, value)
+    return True
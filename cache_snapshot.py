@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import zlib
+import pickle
+import struct
+import importlib
+try:
+    import fcntl            # POSIX: serializes workers merging into one snapshot
+except Exception:
+    fcntl = None
+
+import aio
+
+# Warm start for the in-process caches across restarts, deploys and worker
+# recycles.
+#
+# Every CACHE_SNAPSHOT_SECONDS, and once more when a gunicorn worker exits,
+# the caches below are written to CACHE_SNAPSHOT_PATH. Each entry is saved
+# with its absolute expiry time. A new process restores the snapshot when
+# the app is created, drops what has expired meanwhile and logs how many
+# entries it restored and how long that took. All the caches hold
+# (expires, value) records, so the original TTLs carry over unchanged.
+#
+# Workers share one file. A writer takes a lock on `<path>.lock`, merges
+# its own entries into the live ones already in the file (the later expiry
+# wins) and replaces the file atomically, so a reader never sees half a
+# snapshot. Values that cannot be pickled are skipped.
+#
+# File layout: MAGIC, uint32 header length, JSON header (format, created,
+# per-cache entry counts), then a zlib-compressed pickle of
+# {cache: [(key, expires, value), ...]}. Restored entries go through each
+# cache's own insert function, so LRU limits and the size metrics stay
+# right. A snapshot written in another
+# FORMAT, or one that cannot be read, is ignored: the process starts cold.
+# Bump FORMAT when a cache key or value changes shape.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PATH = os.environ.get('CACHE_SNAPSHOT_PATH', os.path.join(ROOT, 'data', 'cache.snapshot'))
+INTERVAL = float(os.environ.get('CACHE_SNAPSHOT_SECONDS', '60'))
+MAGIC = b'DPCACHE1'
+# 2: ttl_cache keys start with the function's module.qualname, not its name
+FORMAT = 2
+
+# name: (module, dict attribute, lock attribute, insert function). The insert
+# function is put(key, value, expires); it returns False if it refuses the entry.
+CACHES = {
+    'ttl_cache': ('cache', '_CACHE', '_LOCK', '_cache_put'),
+    'cached_get': ('disasters', '_CACHE', '_CACHE_LOCK', '_cache_put'),
+    'geoip': ('location', '_CACHE', '_LOCK', '_cache_put'),
+    'poi_tiles': ('poi_tiles', '_TILES', '_LOCK', '_cache_put'),
+}
+
+_WRITER_PID = None
+
+
+def _cache(name):
+    module, data, lock, put = CACHES[name]
+    mod = importlib.import_module(module)
+    return getattr(mod, data), getattr(mod, lock), getattr(mod, put)
+
+
+def collect(now=None):
+    """{cache: [(key, expires, value), ...]} of the live entries in this process."""
+    now = time.time() if now is None else now
+    out = {}
+    for name in CACHES:
+        try:
+            data, lock, _ = _cache(name)
+        except Exception as e:
+            print(f'Warning: cache {name} not snapshotted:', e)
+            continue
+        with lock:
+            out[name] = [(k, rec[0], rec[1]) for k, rec in data.items() if rec[0] > now]
+    return out
+
+
+def _picklable(entries):
+    try:
+        pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL)
+        return entries
+    except Exception:
+        # rare: drop just the entries that cannot be pickled
+        keep = []
+        for e in entries:
+            try:
+                pickle.dumps(e, protocol=pickle.HIGHEST_PROTOCOL)
+                keep.append(e)
+            except Exception:
+                pass
+        return keep
+
+
+def write(path, caches):
+    """Write `caches` to `path` atomically; returns the number of entries."""
+    caches = {name: _picklable(entries) for name, entries in caches.items()}
+    body = zlib.compress(pickle.dumps(caches, protocol=pickle.HIGHEST_PROTOCOL), 6)
+    header = json.dumps({'format': FORMAT, 'created': time.time(),
+                         'caches': {name: len(entries) for name, entries in caches.items()}}).encode()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header + body)
+    os.replace(tmp, path)
+    return sum(len(entries) for entries in caches.values())
+
+
+def read(path):
+    """(header, {cache: [(key, expires, value), ...]}); ValueError if not a snapshot of this FORMAT."""
+    with open(path, 'rb') as f:
+        blob = f.read()
+    if blob[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} is not a cache snapshot')
+    (n,) = struct.unpack_from('<I', blob, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(blob[start:start + n])
+    if header.get('format') != FORMAT:
+        raise ValueError(f'{path} has snapshot format {header.get("format")}, expected {FORMAT}')
+    return header, pickle.loads(zlib.decompress(blob[start + n:]))
+
+
+def merge(old, new, now):
+    """Union of two snapshots' live entries; the later expiry wins per key."""
+    out = {}
+    for name in set(old) | set(new):
+        by_key = {}
+        for key, expires, value in list(old.get(name, ())) + list(new.get(name, ())):
+            if expires > now and (key not in by_key or expires > by_key[key][0]):
+                by_key[key] = (expires, value)
+        out[name] = [(k, e, v) for k, (e, v) in by_key.items()]
+    return out
+
+
+def save(path=None):
+    """Merge this process's caches into the snapshot file; returns the entries written."""
+    path = path or PATH
+    if not path:
+        return 0
+    now = time.time()
+    caches = collect(now)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            caches = merge(read(path)[1], caches, now)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print('Warning: replacing unreadable cache snapshot:', e)
+        return write(path, caches)
+
+
+def restore(path=None):
+    """Load the live entries of the snapshot into the caches; returns the number restored."""
+    path = path or PATH
+    if not path or not os.path.exists(path):
+        return 0
+    # import the cache modules first: only the restore itself is timed
+    targets = {name: _cache(name) for name in CACHES}
+    start = time.perf_counter()
+    try:
+        _, caches = read(path)
+    except Exception as e:
+        print('Warning: cache snapshot not restored, starting cold:', e)
+        return 0
+    now = time.time()
+    restored = expired = 0
+    for name, entries in caches.items():
+        if name not in targets:
+            continue
+        data, lock, put = targets[name]
+        # soonest expiry first: an LRU cache that overflows drops those
+        live = sorted((e for e in entries if e[1] > now), key=lambda e: e[1])
+        expired += len(entries) - len(live)
+        for key, expires, value in live:
+            with lock:
+                rec = data.get(key)
+            # never overwrite something this process has fetched since
+            if (rec is None or rec[0] < expires) and put(key, value, expires) is not False:
+                restored += 1
+    print(f'Restored {restored} cache entries ({expired} expired) from {path}'
+          f' in {(time.perf_counter() - start) * 1000:.1f} ms')
+    return restored
+
+
+def _write_periodically():
+    sleep = aio.original_sleep()
+    while True:
+        sleep(INTERVAL)
+        try:
+            save()
+        except Exception as e:
+            print('Warning: cache snapshot failed:', e)
+
+
+def init_app(app):
+    """Restore the snapshot and start this process's snapshot writer (once per process)."""
+    global _WRITER_PID
+    if not PATH or _WRITER_PID == os.getpid():
+        return
+    _WRITER_PID = os.getpid()
+    restore()
+    if INTERVAL > 0:
+        aio.start_native_thread(_write_periodically)
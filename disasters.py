@@ -1,10 +1,15 @@
-import requests
+import asyncio
+import json
+from urllib.parse import quote
 from cache import ttl_cache
+import aio
+import metrics
 import math
 import time
 from datetime import datetime, timedelta
 from threading import Lock
 import os
+import event_store
 try:
     import pycountry
 except Exception:
@@ -22,22 +27,24 @@ if os.environ.get('REDIS_URL'):
 # Simple in-memory TTL cache for GET requests / expensive computations
 _CACHE = {}
 _CACHE_LOCK = Lock()
+_SWEPT = 0.0
 
 
-def _cached_get(url, ttl=300):
-    """GET with simple TTL cache keyed by URL."""
+async def _cached_get_async(url, ttl=300):
+    """GET with simple TTL cache keyed by URL (on the shared async client)."""
     # If Redis is configured, use it as a cache backend
     if _REDIS:
         try:
+            loop = asyncio.get_running_loop()
             key = 'disasters:cache:' + url
-            v = _REDIS.get(key)
+            v = await loop.run_in_executor(None, _REDIS.get, key)
+            metrics.cache_lookup('cached_get', bool(v))
             if v:
-                return requests.utils.json.loads(v)
-            r = requests.get(url, timeout=8)
-            if r.status_code != 200:
+                return json.loads(v)
+            data = await _fetch_json(url)
+            if data is None:
                 return None
-            data = r.json()
-            _REDIS.setex(key, ttl, requests.utils.json.dumps(data))
+            await loop.run_in_executor(None, _REDIS.setex, key, ttl, json.dumps(data))
             return data
         except Exception:
             pass
@@ -45,18 +52,53 @@ def _cached_get(url, ttl=300):
     now = time.time()
     with _CACHE_LOCK:
         rec = _CACHE.get(url)
-        if rec and rec[0] > now:
-            return rec[1]
+        hit = bool(rec and rec[0] > now)
+    metrics.cache_lookup('cached_get', hit)
+    if hit:
+        return rec[1]
     try:
-        r = requests.get(url, timeout=8)
-        if r.status_code != 200:
-            return None
-        data = r.json()
-        with _CACHE_LOCK:
-            _CACHE[url] = (now + ttl, data)
-        return data
+        data = await _fetch_json(url)
     except Exception:
         return None
+    if data is None:
+        return None
+    _cache_put(url, data, now + ttl)
+    return data
+
+
+def _cache_put(url, data, expires):
+    global _SWEPT
+    now = time.time()
+    with _CACHE_LOCK:
+        _CACHE[url] = (expires, data)
+        if now - _SWEPT >= 60:
+            # drop expired URLs (at most once a minute) so the size counts live entries
+            _SWEPT = now
+            for k in [k for k, rec in _CACHE.items() if rec[0] <= now]:
+                del _CACHE[k]
+        n = len(_CACHE)
+    metrics.cache_size('cached_get', n)
+
+
+async def _fetch_json(url):
+    """GET and decode JSON; None on a non-200 or undecodable body (counted as feed errors)."""
+    feed = metrics.host_of(url)
+    r = await aio.get(url, timeout=8)
+    if r.status_code != 200:
+        metrics.feed_error(feed, 'status')
+        return None
+    try:
+        data = r.json()
+    except ValueError:
+        metrics.feed_error(feed, 'parse')
+        return None
+    metrics.feed_success(feed)
+    return data
+
+
+def _cached_get(url, ttl=300):
+    """GET with simple TTL cache keyed by URL."""
+    return aio.run(_cached_get_async(url, ttl=ttl))
 
 
 def _country_to_iso(country_name):
@@ -81,7 +123,7 @@ def _country_to_iso(country_name):
         return (None, None)
 
 
-def _query_usgs_earthquakes(lat, lon, maxradiuskm=200, days=30, limit=10):
+async def _query_usgs_earthquakes(lat, lon, maxradiuskm=200, days=30, limit=10):
     """Query USGS for earthquakes near a point in the last `days` days.
 
     Returns a list of dicts with keys: type='earthquake', title, mag, place, time (iso), lat, lon, url
@@ -92,7 +134,7 @@ def _query_usgs_earthquakes(lat, lon, maxradiuskm=200, days=30, limit=10):
         f'?format=geojson&latitude={lat}&longitude={lon}&maxradiuskm={maxradiuskm}&starttime={starttime}&limit={limit}'
     )
     try:
-        data = _cached_get(url, ttl=300)
+        data = await _cached_get_async(url, ttl=300)
         if not data:
             return []
         out = []
@@ -121,11 +163,11 @@ def _query_usgs_earthquakes(lat, lon, maxradiuskm=200, days=30, limit=10):
         return []
 
 
-def _query_weather_alerts(lat, lon):
+async def _query_weather_alerts(lat, lon):
     """Query weather.gov active alerts for a point. Returns list of alert dicts."""
     url = f'https://api.weather.gov/alerts/active?point={lat},{lon}'
     try:
-        data = _cached_get(url, ttl=300)
+        data = await _cached_get_async(url, ttl=300)
         if not data:
             return []
         out = []
@@ -149,7 +191,7 @@ def _query_weather_alerts(lat, lon):
         return []
 
 
-def _query_reliefweb_by_country(country, limit=5):
+async def _query_reliefweb_by_country(country, limit=5):
     """Query ReliefWeb disasters for a given country name. Returns list of events."""
     try:
         if not country:
@@ -159,16 +201,16 @@ def _query_reliefweb_by_country(country, limit=5):
         alpha2, alpha3 = _country_to_iso(country)
         attempts = []
         # filter by country field
-        attempts.append(('filter[field]=country&filter[value]=' + requests.utils.quote(country), 3600))
+        attempts.append(('filter[field]=country&filter[value]=' + quote(country), 3600))
         # try ISO3 code filter
         if alpha3:
-            attempts.append(('filter[field]=country_iso3&filter[value]=' + requests.utils.quote(alpha3), 3600))
+            attempts.append(('filter[field]=country_iso3&filter[value]=' + quote(alpha3), 3600))
         # fallback: query text search
-        attempts.append(('query=' + requests.utils.quote(country), 3600))
+        attempts.append(('query=' + quote(country), 3600))
 
         for q, ttl in attempts:
             url = 'https://api.reliefweb.int/v1/disasters?appname=apidoc&' + q + f'&limit={limit}'
-            data = _cached_get(url, ttl=ttl)
+            data = await _cached_get_async(url, ttl=ttl)
             if not data:
                 continue
             for item in data.get('data', [])[:limit]:
@@ -191,8 +233,8 @@ def _query_reliefweb_by_country(country, limit=5):
         # If no disasters results, try ReliefWeb reports (broader) and pick ones mentioning the country
         if not out:
             try:
-                url = 'https://api.reliefweb.int/v1/reports?appname=apidoc&query=' + requests.utils.quote(country) + f'&limit={limit}'
-                data = _cached_get(url, ttl=3600)
+                url = 'https://api.reliefweb.int/v1/reports?appname=apidoc&query=' + quote(country) + f'&limit={limit}'
+                data = await _cached_get_async(url, ttl=3600)
                 if data:
                     for item in data.get('data', [])[:limit]:
                         fields = item.get('fields', {})
@@ -245,10 +287,45 @@ def _normalize_event(e):
     return out
 
 
-@ttl_cache(ttl_seconds=300)
 def get_nearby_disasters(lat=None, lon=None, radius_km=20, days=180, country=None, max_results=50):
+    """Sync wrapper around get_nearby_disasters_async."""
+    return aio.run(get_nearby_disasters_async(lat=lat, lon=lon, radius_km=radius_km, days=days,
+                                              country=country, max_results=max_results))
+
+
+_REFRESHING = set()
+_REFRESH_LOCK = Lock()
+
+
+def refresh_in_background(**kwargs):
+    """Refresh the event store for get_nearby_disasters_async(**kwargs) without waiting.
+
+    Skipped when that query is still cached (the store already has its
+    results) or already being refreshed. Used by delta polls, which are
+    answered from the store.
+    """
+    hit, _ = get_nearby_disasters_async.cache_lookup(**kwargs)
+    key = tuple(sorted(kwargs.items()))
+    with _REFRESH_LOCK:
+        if hit or key in _REFRESHING:
+            return
+        _REFRESHING.add(key)
+
+    def done(fut):
+        with _REFRESH_LOCK:
+            _REFRESHING.discard(key)
+        if not fut.cancelled():
+            fut.exception()     # retrieved, so a failed refresh is not logged as unhandled
+
+    fut = asyncio.run_coroutine_threadsafe(get_nearby_disasters_async(**kwargs), aio.get_loop())
+    fut.add_done_callback(done)
+
+
+@ttl_cache(ttl_seconds=300)
+async def get_nearby_disasters_async(lat=None, lon=None, radius_km=20, days=180, country=None, max_results=50):
     """Return deduplicated, normalized list of nearby disasters.
 
+    - Queries USGS, weather.gov and ReliefWeb concurrently
     - Uses a small TTL cache for external requests
     - Deduplicates by URL or title+time
     - Keeps ReliefWeb items (may lack lat/lon)
@@ -266,19 +343,18 @@ def get_nearby_disasters(lat=None, lon=None, radius_km=20, days=180, country=Non
     except Exception:
         days = 180
 
-    # Earthquakes
-    eqs = _query_usgs_earthquakes(lat, lon, maxradiuskm=radius_km, days=days, limit=50)
-    # Weather alerts
-    alerts = _query_weather_alerts(lat, lon)
+    # Earthquakes, weather alerts and (when a country is known) ReliefWeb
+    # declared disasters are independent upstreams: fetch them concurrently
+    eqs, alerts, rw = await aio.gather_settled(
+        _query_usgs_earthquakes(lat, lon, maxradiuskm=radius_km, days=days, limit=50),
+        _query_weather_alerts(lat, lon),
+        _query_reliefweb_by_country(country, limit=25),
+    )
 
     combined = []
-    combined.extend(eqs)
-    combined.extend(alerts)
-
-    # Query ReliefWeb by country when available to capture declared disasters
-    if country:
-        rw = _query_reliefweb_by_country(country, limit=25)
-        combined.extend(rw)
+    combined.extend(eqs or [])
+    combined.extend(alerts or [])
+    combined.extend(rw or [])
 
     # Normalize and deduplicate
     seen = set()
@@ -305,7 +381,8 @@ def get_nearby_disasters(lat=None, lon=None, radius_km=20, days=180, country=Non
 
     # If some events lack lat/lon, attempt to geocode a small number of them
     # using Nominatim (OpenStreetMap). We limit the number of geocoding
-    # calls to avoid rate limits and cache results via _cached_get.
+    # calls to avoid rate limits (Nominatim allows ~1 req/s, so these stay
+    # sequential) and cache results via _cached_get_async.
     to_geocode = [e for e in normalized if not e.get('lat') or not e.get('lon')]
     geocode_budget = 8
     for e in to_geocode:
@@ -326,9 +403,9 @@ def get_nearby_disasters(lat=None, lon=None, radius_km=20, days=180, country=Non
         if not query:
             continue
         # build nominatim url (use format=json, limit=1)
-        url = 'https://nominatim.openstreetmap.org/search?format=json&limit=1&q=' + requests.utils.quote(query)
+        url = 'https://nominatim.openstreetmap.org/search?format=json&limit=1&q=' + quote(query)
         try:
-            data = _cached_get(url, ttl=24*3600)
+            data = await _cached_get_async(url, ttl=24*3600)
             if data and isinstance(data, list) and len(data) > 0:
                 item = data[0]
                 lat_s = item.get('lat')
@@ -375,6 +452,13 @@ def get_nearby_disasters(lat=None, lon=None, radius_km=20, days=180, country=Non
     if remaining > 0:
         results.extend(without_coords[:remaining])
 
+    # Record results in the local event store so polling clients can ask
+    # for only what changed since their last cursor (SQLite off the loop).
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, event_store.upsert_events, results)
+    except Exception:
+        pass
+
     return results
     
 
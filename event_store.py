@@ -0,0 +1,277 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+from datetime import datetime
+from threading import Lock
+
+# Local store of normalized disaster events (see disasters._normalize_event).
+#
+# Events are upserted by their `id`. Every insert or content change bumps a
+# store-wide sequence number, which is what clients use as a `since` cursor:
+# a poll with the last cursor only returns events whose seq is newer, read
+# straight from the store (changes_nearby). Events whose time (or, without
+# one, last change) is older than EVENT_STORE_RETENTION_DAYS are pruned.
+# SQLite in WAL mode lets several gunicorn workers share the same file.
+STORE_PATH = os.environ.get(
+    'EVENT_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'events.db')
+)
+RETENTION_DAYS = float(os.environ.get('EVENT_STORE_RETENTION_DAYS', '365'))
+PRUNE_SECONDS = 3600
+
+_CONN = None
+_LOCK = Lock()
+_LAST_PRUNE = 0.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    time_ts REAL,
+    lat REAL,
+    lon REAL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_seq ON events (seq);
+CREATE INDEX IF NOT EXISTS events_time ON events (time_ts);
+CREATE INDEX IF NOT EXISTS events_latlon ON events (lat, lon);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# keys that depend on the query point rather than on the event itself
+_VOLATILE_KEYS = ('_distance_km',)
+
+
+def _conn():
+    global _CONN
+    if _CONN is None:
+        c = sqlite3.connect(STORE_PATH, timeout=10, check_same_thread=False)
+        try:
+            c.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:
+            # e.g. ':memory:' databases do not support WAL
+            pass
+        c.executescript(_SCHEMA)
+        c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('seq', 0)")
+        c.commit()
+        _CONN = c
+    return _CONN
+
+
+def _time_ts(t):
+    if not t:
+        return None
+    try:
+        return datetime.fromisoformat(str(t).replace('Z', '+00:00')).timestamp()
+    except Exception:
+        return None
+
+
+def _float_or_none(v):
+    try:
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def _stored_form(ev):
+    return {k: v for k, v in ev.items() if k not in _VOLATILE_KEYS}
+
+
+def _digest(ev):
+    blob = json.dumps(ev, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+
+# insert, or update only when the content digest changed
+_UPSERT = (
+    'INSERT INTO events (id, seq, digest, updated_at, time_ts, lat, lon, payload) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (id) DO UPDATE SET seq = excluded.seq, digest = excluded.digest, '
+    'updated_at = excluded.updated_at, time_ts = excluded.time_ts, lat = excluded.lat, '
+    'lon = excluded.lon, payload = excluded.payload '
+    'WHERE events.digest != excluded.digest'
+)
+
+
+def upsert_events(events):
+    """Insert new events and update changed ones, keyed by event `id`.
+
+    Unchanged events keep their sequence number so they are not re-sent to
+    clients polling with a cursor. Returns the list of ids that were
+    inserted or changed.
+    """
+    now = time.time()
+    rows = {}
+    for ev in events or ():
+        eid = ev.get('id')
+        if not eid:
+            continue
+        stored = _stored_form(ev)
+        rows[eid] = (eid, _digest(stored), now, _time_ts(ev.get('time')),
+                     _float_or_none(ev.get('lat')), _float_or_none(ev.get('lon')),
+                     json.dumps(stored, default=str))
+    if not rows:
+        return []
+    with _LOCK:
+        c = _conn()
+        with c:
+            # reserve a seq range first: the write lock then keeps other
+            # workers out until commit
+            c.execute("UPDATE meta SET value = value + ? WHERE key = 'seq'", (len(rows),))
+            base = _seq(c) - len(rows)
+            c.executemany(_UPSERT, [(r[0], base + i + 1) + r[1:] for i, r in enumerate(rows.values())])
+            changed = c.execute('SELECT id, seq FROM events WHERE seq > ? ORDER BY seq', (base,)).fetchall()
+            # hand back the unused part of the range so cursors stay dense
+            c.execute("UPDATE meta SET value = ? WHERE key = 'seq'", (changed[-1][1] if changed else base,))
+        _maybe_prune(c, now)
+    return [eid for eid, _ in changed]
+
+
+def _maybe_prune(c, now):
+    global _LAST_PRUNE
+    if now - _LAST_PRUNE < PRUNE_SECONDS:
+        return
+    _LAST_PRUNE = now
+    _prune(c, now - RETENTION_DAYS * 86400)
+
+
+def prune(before_ts):
+    """Delete events whose time (or last change, without one) is before `before_ts`."""
+    with _LOCK:
+        return _prune(_conn(), before_ts)
+
+
+def _prune(c, before_ts):
+    with c:
+        return c.execute('DELETE FROM events WHERE COALESCE(time_ts, updated_at) < ?', (before_ts,)).rowcount
+
+
+def _seq(c):
+    row = c.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+    return row[0] if row else 0
+
+
+def current_cursor():
+    """Return the latest sequence number as an opaque cursor string."""
+    with _LOCK:
+        return str(_seq(_conn()))
+
+
+def parse_cursor(cursor):
+    """Parse a client-supplied cursor; unknown or future cursors mean 'from scratch'."""
+    with _LOCK:
+        return _parse_cursor(_conn(), cursor)
+
+
+def _parse_cursor(c, cursor):
+    try:
+        seq = int(cursor)
+    except Exception:
+        return 0
+    if seq < 0 or seq > _seq(c):
+        # store was reset (or cursor is bogus): resend everything
+        return 0
+    return seq
+
+
+def changed_ids_since(cursor, ids):
+    """Return the subset of `ids` that were inserted or changed after `cursor`."""
+    ids = [i for i in ids if i]
+    if not ids:
+        return set()
+    seq = parse_cursor(cursor)
+    out = set()
+    with _LOCK:
+        c = _conn()
+        # stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = c.execute(
+                f'SELECT id FROM events WHERE seq > ? AND id IN ({marks})',
+                [seq] + chunk
+            ).fetchall()
+            out.update(r[0] for r in rows)
+    return out
+
+
+def query_nearby(lat, lon, radius_km, since=None, start_ts=None, limit=200):
+    """Return stored geolocated events within `radius_km` of (lat, lon).
+
+    Uses the (lat, lon) index via a bounding box, then filters by great-circle
+    distance. `since` restricts to events changed after that cursor and
+    `start_ts` to events whose time is at or after that unix timestamp (or
+    that have no time). Results are ordered by sequence number (oldest change
+    first).
+    """
+    with _LOCK:
+        return _query_nearby(_conn(), lat, lon, radius_km, since, start_ts, limit)
+
+
+def changes_nearby(lat, lon, radius_km, since, start_ts=None, limit=500):
+    """(events changed after `since` near (lat, lon), next cursor), read in one snapshot.
+
+    When `limit` cuts the changes short the cursor is the last returned
+    event's, so the next poll picks up the rest.
+    """
+    with _LOCK:
+        c = _conn()
+        c.execute('BEGIN')
+        try:
+            events = _query_nearby(c, lat, lon, radius_km, since, start_ts, limit)
+            cursor = _seq(c)
+        finally:
+            c.execute('COMMIT')
+    if len(events) >= limit:
+        cursor = events[-1]['_seq']
+    return events, str(cursor)
+
+
+def _query_nearby(c, lat, lon, radius_km, since, start_ts, limit):
+    lat = float(lat)
+    lon = float(lon)
+    radius_km = float(radius_km)
+    dlat = radius_km / 111.0
+    dlon = radius_km / max(1e-6, 111.0 * math.cos(math.radians(lat)))
+    sql = 'SELECT seq, payload FROM events WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?'
+    params = [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+    if since is not None:
+        sql += ' AND seq > ?'
+        params.append(_parse_cursor(c, since))
+    if start_ts is not None:
+        sql += ' AND (time_ts IS NULL OR time_ts >= ?)'
+        params.append(float(start_ts))
+    sql += ' ORDER BY seq'
+    rows = c.execute(sql, params).fetchall()
+
+    out = []
+    for seq, payload in rows:
+        ev = json.loads(payload)
+        dkm = _haversine_km(lat, lon, ev['lat'], ev['lon'])
+        if dkm > radius_km:
+            continue
+        ev['_distance_km'] = round(dkm, 2)
+        ev['_seq'] = seq
+        out.append(ev)
+        if len(out) >= limit:
+            break
+    return out
+
+
+def _haversine_km(a_lat, a_lon, b_lat, b_lon):
+    R = 6371.0
+    phi1 = math.radians(a_lat)
+    phi2 = math.radians(b_lat)
+    dphi = math.radians(b_lat - a_lat)
+    dlambda = math.radians(b_lon - a_lon)
+    x = math.sin(dphi/2.0)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2.0)**2
+    return 2 * R * math.asin(min(1, math.sqrt(x)))
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+# Gunicorn settings for production serving (`gunicorn -c gunicorn.conf.py wsgi:app`).
+#
+# The routes spend nearly all their time waiting on upstream HTTP calls
+# (USGS, ReliefWeb, weather.gov, Overpass, Nominatim, ip-api), so workers use
+# a concurrent model: gevent (greenlets, required for /alerts/stream) when
+# installed, otherwise gthread with ALERTS_STREAM=0. Every setting can be
+# overridden from the environment.
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _default_worker_class():
+    try:
+        import gevent  # noqa: F401
+        return 'gevent'
+    except Exception:
+        return 'gthread'
+
+
+bind = os.environ.get('BIND', '0.0.0.0:' + os.environ.get('PORT', '5000'))
+worker_class = os.environ.get('WORKER_CLASS', _default_worker_class())
+# /alerts/stream holds a connection per subscriber for as long as it is open,
+# which only greenlets make affordable (see alerts.py)
+if worker_class != 'gevent' and os.environ.get('ALERTS_STREAM', '1') not in ('0', 'false', 'no'):
+    raise RuntimeError(f'/alerts/stream needs the gevent worker class, not {worker_class!r};'
+                       ' install gevent or set ALERTS_STREAM=0')
+# I/O bound: a couple of workers per core is plenty, concurrency comes from
+# threads / greenlets inside each worker
+workers = _env_int('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2))
+# gthread: threads per worker (gunicorn turns 'sync' into gthread when > 1)
+threads = _env_int('THREADS', 32)
+# gevent: simultaneous connections (greenlets) per worker
+worker_connections = _env_int('WORKER_CONNECTIONS', 2000)
+# must exceed the slowest upstream chain (Overpass up to 25s + geocoding)
+timeout = _env_int('TIMEOUT', 60)
+graceful_timeout = _env_int('GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('KEEPALIVE', 5)
+# recycle workers now and then to cap slow memory growth (TensorFlow)
+max_requests = _env_int('MAX_REQUESTS', 5000)
+max_requests_jitter = _env_int('MAX_REQUESTS_JITTER', 500)
+accesslog = os.environ.get('ACCESS_LOG', '-')
+errorlog = os.environ.get('ERROR_LOG', '-')
+# Prometheus multi-process mode: workers write metric samples here and
+# /metrics merges them. Set before workers fork so they inherit it.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'chatbot-prometheus'))
+
+
+# Admission control (admission.py), per worker as name=limit/queue/budget_s.
+# gthread: a queued request holds a thread, so geo and feeds together may
+# hold at most ~5/8 of the threads and /handle_message always has the rest.
+# gevent: waiting greenlets are cheap; the limits only bound upstream fan-out.
+def _admission_limits():
+    if worker_class == 'gevent':
+        return 'chat=512/1024/5,feeds=64/128/2,geo=64/128/2'
+    t = max(8, threads)
+    return f'chat={t}/{t}/5,feeds={t // 8}/{t // 8}/2,geo={t // 4}/{t // 8}/1'
+
+
+os.environ.setdefault('ADMISSION_LIMITS', _admission_limits())
+
+
+def on_starting(server):
+    # samples from a previous run would be merged into the new one
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def worker_exit(server, worker):
+    # runs in the worker: one last cache snapshot so its replacement starts warm
+    import cache_snapshot
+    try:
+        cache_snapshot.save()
+    except Exception as e:
+        print('Warning: final cache snapshot failed:', e)
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+# do not preload: the gevent worker must monkey-patch before the app (and
+# requests / sqlite3 users) are imported
+preload_app = False
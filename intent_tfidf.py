@@ -0,0 +1,179 @@
+import os
+import re
+import math
+from array import array
+from collections import Counter
+from functools import lru_cache
+from threading import Lock
+
+import numpy as np
+
+# Sparse TF-IDF nearest-neighbour intent engine: an alternative to the MLP
+# that needs no training run and no TensorFlow.
+#
+# Every pattern in intents.json becomes a sparse vector of word unigrams and
+# character 3-5-grams taken within word boundaries, weighted by sublinear tf
+# times smoothed idf and L2-normalized. The character n-grams catch
+# inflections and typos that the lemmatized bag of words misses. The index
+# is stored feature-major, like a CSC matrix: indptr over features, then
+# pattern ids and weights. Scoring a message reads only the columns of the
+# features it contains and sums them with np.bincount, a sparse
+# matrix-vector product, to get the cosine similarity with every pattern.
+#
+# Classes are scored from the TFIDF_K nearest patterns. In 'vote' mode
+# (default) a class gets its share of the neighbours' summed similarity, so
+# several so-so matches for "flood" outvote one short pattern like "What?".
+# In 'cosine' mode a class gets its single nearest pattern's similarity.
+# A message whose nearest pattern is below TFIDF_MIN_SIMILARITY matches
+# nothing, and classes under TFIDF_THRESHOLD are dropped, as
+# main.predict_class drops those under its ERROR_THRESHOLD.
+#
+# add() appends a pattern's (feature, pattern, tf) triples to flat arrays.
+# The next query re-sorts them into columns and recomputes idf and the
+# pattern norms, all in numpy.
+#
+# Select it with INTENT_ENGINE=tfidf (see model_bundle.py).
+K = int(os.environ.get('TFIDF_K', '5'))
+MODE = os.environ.get('TFIDF_MODE', 'vote')
+THRESHOLD = float(os.environ.get('TFIDF_THRESHOLD', '0.25'))
+MIN_SIMILARITY = float(os.environ.get('TFIDF_MIN_SIMILARITY', '0.25'))
+CHAR_NGRAMS = (3, 5)
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+@lru_cache(maxsize=65536)
+def _token_features(tok):
+    padded = f' {tok} '
+    return ('w ' + tok,) + tuple('c ' + padded[i:i + n]
+                                 for n in range(CHAR_NGRAMS[0], CHAR_NGRAMS[1] + 1)
+                                 for i in range(len(padded) - n + 1))
+
+
+def features(text):
+    """{feature: count} for word unigrams and in-word character n-grams."""
+    out = Counter()
+    for tok in _TOKEN.findall(text.lower()):
+        out.update(_token_features(tok))
+    return out
+
+
+class TfidfIndex:
+    """Incrementally built TF-IDF index over intent patterns."""
+
+    engine = 'tfidf'
+
+    def __init__(self, k=None, mode=None, threshold=None, min_similarity=None):
+        self.k = k or K
+        self.mode = mode or MODE
+        self.threshold = THRESHOLD if threshold is None else threshold
+        self.min_similarity = MIN_SIMILARITY if min_similarity is None else min_similarity
+        if self.mode not in ('vote', 'cosine'):
+            raise ValueError(f"unknown TF-IDF mode {self.mode!r}; expected 'vote' or 'cosine'")
+        self.classes = []
+        self._class_ids = {}
+        self._features = {}
+        # one entry per (pattern, feature): COO triples, sorted into columns by _freeze()
+        self._cols = array('q')
+        self._rows = array('q')
+        self._tf = array('f')
+        self._pattern_class = []
+        self._frozen = None
+        self._lock = Lock()
+
+    @classmethod
+    def from_intents(cls, intents, **kwargs):
+        index = cls(**kwargs)
+        for intent in intents.get('intents', []):
+            for pattern in intent.get('patterns', []):
+                index.add(intent['tag'], pattern)
+        return index
+
+    def __len__(self):
+        return len(self._pattern_class)
+
+    def add(self, tag, pattern):
+        """Index one more pattern for `tag`; visible to the next query."""
+        feats = features(pattern)
+        with self._lock:
+            if tag not in self._class_ids:
+                self._class_ids[tag] = len(self.classes)
+                self.classes.append(tag)
+            ids = self._features
+            self._cols.extend([ids.setdefault(f, len(ids)) for f in feats])
+            self._rows.extend([len(self._pattern_class)] * len(feats))
+            self._tf.extend([1.0 + math.log(c) for c in feats.values()])
+            self._pattern_class.append(self._class_ids[tag])
+            self._frozen = None
+
+    def _freeze(self):
+        """Feature-major arrays (indptr, pattern ids, weights), idf and pattern classes."""
+        with self._lock:
+            if self._frozen is not None:
+                return self._frozen
+            n = len(self._pattern_class)
+            cols = np.frombuffer(self._cols, dtype=np.int64) if len(self._cols) else np.zeros(0, np.int64)
+            order = np.argsort(cols, kind='stable')
+            cols = cols[order]
+            rows = np.frombuffer(self._rows, dtype=np.int64)[order] if len(order) else cols
+            df = np.bincount(cols, minlength=len(self._features))
+            idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+            indptr = np.zeros(len(df) + 1, dtype=np.int64)
+            np.cumsum(df, out=indptr[1:])
+            tf = np.frombuffer(self._tf, dtype=np.float32)[order] if len(order) else np.zeros(0, np.float32)
+            data = tf * idf[cols]
+            norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2, minlength=n))
+            data /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+            self._frozen = (indptr, rows, data, idf, np.array(self._pattern_class, dtype=np.int64),
+                            math.log(1.0 + n) + 1.0)
+            return self._frozen
+
+    def similarities(self, text):
+        """Cosine similarity of `text` with every indexed pattern."""
+        return self._similarities(text, self._freeze())
+
+    def _similarities(self, text, frozen):
+        # `frozen` is a snapshot: patterns added meanwhile are scored from the next query on
+        indptr, rows, data, idf, pattern_class, unseen_idf = frozen
+        n = len(pattern_class)
+        cols, weights, norm2 = [], [], 0.0
+        for feat, count in features(text).items():
+            col = self._features.get(feat)
+            w = (1.0 + math.log(count)) * (idf[col] if col is not None and col < len(idf) else unseen_idf)
+            # features no pattern has still count towards the message's norm
+            norm2 += w * w
+            if col is not None and col < len(idf):
+                cols.append(col)
+                weights.append(w)
+        if not cols or not n:
+            return np.zeros(n, dtype=np.float32)
+        spans = [np.arange(indptr[c], indptr[c + 1]) for c in cols]
+        idx = np.concatenate(spans)
+        q = np.repeat(np.array(weights, dtype=np.float32), [len(s) for s in spans])
+        return (np.bincount(rows[idx], weights=data[idx] * q, minlength=n) / math.sqrt(norm2)).astype(np.float32)
+
+    def classify(self, text):
+        """[{'intent', 'probability'}] best first, like main.predict_class."""
+        frozen = self._freeze()
+        sims = self._similarities(text, frozen)
+        if not len(sims):
+            return []
+        pattern_class = frozen[4]
+        k = min(self.k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[sims[top] > 0]
+        if not len(top) or sims[top].max() < self.min_similarity:
+            return []
+        scores = {}
+        if self.mode == 'cosine':
+            for i in top:
+                c = int(pattern_class[i])
+                scores[c] = max(scores.get(c, 0.0), float(sims[i]))
+        else:
+            total = float(sims[top].sum())
+            for i in top:
+                c = int(pattern_class[i])
+                scores[c] = scores.get(c, 0.0) + float(sims[i])
+            scores = {c: s / total for c, s in scores.items()}
+        ranked = sorted(((s, c) for c, s in scores.items() if s > self.threshold), reverse=True)
+        return [{'intent': self.classes[c], 'probability': str(round(s, 6))} for s, c in ranked]
@@ -1,4 +1,32 @@
-import requests
+import os
+import time
+import ipaddress
+from collections import OrderedDict
+from threading import Lock
+
+import aio
+import metrics
+try:
+    import maxminddb        # optional: offline GeoIP lookups from an .mmdb file
+except Exception:
+    maxminddb = None
+
+# Offline GeoIP database (MaxMind GeoLite2-City / DB-IP City Lite .mmdb).
+# When present it is the primary backend; ip-api.com is only a fallback.
+GEOIP_DB_PATH = os.environ.get(
+    'GEOIP_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'GeoLite2-City.mmdb')
+)
+_READER = None
+_READER_LOADED = False
+
+# LRU+TTL cache of lookups. Clients are keyed by network prefix (/24 for
+# IPv4, /48 for IPv6): city-level geolocation does not differ within one.
+CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', '10000'))
+CACHE_TTL = int(os.environ.get('GEOIP_CACHE_TTL', str(6 * 3600)))
+NEGATIVE_TTL = 60
+_CACHE = OrderedDict()
+_LOCK = Lock()
 
 
 def _get_client_ip(flask_request):
@@ -11,14 +39,79 @@ def _get_client_ip(flask_request):
     return flask_request.remote_addr
 
 
-def detect_location(flask_request):
-    """Return a dict with latitude, longitude and a human-readable name.
+def _cache_key(ip):
+    if ip in ('127.0.0.1', '::1', None):
+        return 'self'
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    prefix = 24 if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f'{addr}/{prefix}', strict=False))
 
-    Uses an external IP geolocation service (ip-api.com) as a fallback when
-    browser geolocation isn't available. Returns None if detection fails.
-    """
-    ip = _get_client_ip(flask_request)
 
+def _cache_get(key):
+    now = time.time()
+    with _LOCK:
+        rec = _CACHE.get(key)
+        if rec is None:
+            return False, None
+        if rec[0] <= now:
+            del _CACHE[key]
+            return False, None
+        _CACHE.move_to_end(key)
+        return True, rec[1]
+
+
+def _cache_put(key, value, expires=None):
+    if expires is None:
+        expires = time.time() + (CACHE_TTL if value else NEGATIVE_TTL)
+    with _LOCK:
+        _CACHE[key] = (expires, value)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+        n = len(_CACHE)
+    metrics.cache_size('geoip', n)
+
+
+def _get_reader():
+    """Open the .mmdb file once (memory-mapped); None if unavailable."""
+    global _READER, _READER_LOADED
+    if not _READER_LOADED:
+        _READER_LOADED = True
+        if maxminddb is not None and os.path.exists(GEOIP_DB_PATH):
+            try:
+                _READER = maxminddb.open_database(GEOIP_DB_PATH, maxminddb.MODE_MMAP)
+            except Exception as e:
+                print("Warning: could not open GeoIP database:", e)
+                _READER = None
+    return _READER
+
+
+def _lookup_mmdb(ip):
+    reader = _get_reader()
+    if reader is None or ip in ('127.0.0.1', '::1', None):
+        return None
+    try:
+        rec = reader.get(ip)
+    except Exception:
+        return None
+    if not rec or not rec.get('location'):
+        return None
+
+    def _name(node):
+        return ((node or {}).get('names') or {}).get('en')
+
+    city = _name(rec.get('city'))
+    region = _name((rec.get('subdivisions') or [None])[0])
+    country = _name(rec.get('country'))
+    display = ', '.join([p for p in (city, region, country) if p])
+    return {'lat': rec['location'].get('latitude'), 'lon': rec['location'].get('longitude'),
+            'display_name': display or ip}
+
+
+async def _lookup_ip_api(ip):
     # Use ip-api.com (HTTP) which returns JSON like {lat, lon, city, country, ...}
     # If IP is local/loopback, call without IP to let the service detect caller IP
     if ip in ('127.0.0.1', '::1', None):
@@ -27,7 +120,7 @@ def detect_location(flask_request):
         url = f'http://ip-api.com/json/{ip}'
 
     try:
-        resp = requests.get(url, timeout=5)
+        resp = await aio.get(url, timeout=5)
         if resp.status_code != 200:
             return None
         data = resp.json()
@@ -42,3 +135,36 @@ def detect_location(flask_request):
         return {'lat': lat, 'lon': lon, 'display_name': display or data.get('query')}
     except Exception:
         return None
+
+
+async def lookup_ip_async(ip):
+    """Geolocate an IP: cache, then the local GeoIP database, then ip-api.com."""
+    key = _cache_key(ip)
+    hit, loc = _cache_get(key)
+    metrics.cache_lookup('geoip', hit)
+    if hit:
+        return loc
+    loc = _lookup_mmdb(ip) or await _lookup_ip_api(ip)
+    _cache_put(key, loc)
+    return loc
+
+
+def lookup_ip(ip):
+    key = _cache_key(ip)
+    hit, loc = _cache_get(key)
+    if hit:
+        # skip the event loop round trip for cache hits
+        metrics.cache_lookup('geoip', True)
+        return loc
+    return aio.run(lookup_ip_async(ip))
+
+
+def detect_location(flask_request):
+    """Return a dict with latitude, longitude and a human-readable name.
+
+    Uses the local GeoIP database when configured and an external IP
+    geolocation service (ip-api.com) as a fallback when browser geolocation
+    isn't available. Lookups are cached per network prefix. Returns None if
+    detection fails.
+    """
+    return lookup_ip(_get_client_ip(flask_request))
@@ -1,25 +1,27 @@
 import random
-import json
-import pickle
 import numpy as np
 import nltk
 from nltk.stem import WordNetLemmatizer
-from tensorflow.keras.models import load_model
-# TensorFlow model is loaded lazily below; avoid importing at module import time
 
 # For web scraping
 import requests
 from bs4 import BeautifulSoup
+import aio
 import updates
+import model_bundle
+from model_pack import normalize_tip
 
 lemmatizer = WordNetLemmatizer()
-intents = json.load(open('intents.json'))
-words = pickle.load(open('model/words.pkl', 'rb'))
-classes = pickle.load(open('model/classes.pkl', 'rb'))
-# Load the Keras model lazily to avoid import-time failures / heavy memory usage.
-model = None
-_model_load_attempted = False
-_model_load_failed = False
+# intents, vocabulary, classes and the Keras model live in a hot-swappable
+# bundle (model_bundle.py), loaded on first use; the old module attributes
+# still resolve to the current bundle.
+_BUNDLE_ATTRS = ('intents', 'words', 'classes', 'model')
+
+
+def __getattr__(name):
+    if name in _BUNDLE_ATTRS:
+        return getattr(model_bundle.current(), name)
+    raise AttributeError(name)
 
 # Lightweight keyword-based intent fallback (used if model can't be loaded).
 _RULES = {
@@ -68,7 +70,7 @@ def fetch_latest_disaster_updates(intent_tag):
     try:
         for url in urls:
             try:
-                resp = requests.get(url, timeout=6)
+                resp = requests.get(aio.upstream_url(url), timeout=6)
             except Exception:
                 # skip unreachable sources
                 continue
@@ -175,8 +177,10 @@ def clean_up_sentence(sentence):
     sentence_words = [lemmatizer.lemmatize(word.lower()) for word in sentence_words]
     return sentence_words
 
-def bag_of_words(sentence):
+def bag_of_words(sentence, words=None):
     """Convert sentence to bag-of-words array."""
+    if words is None:
+        words = model_bundle.current().words
     sentence_words = clean_up_sentence(sentence)
     bag = [0] * len(words)
     for w in sentence_words:
@@ -185,17 +189,16 @@ def bag_of_words(sentence):
                 bag[i] = 1
     return np.array(bag)
 
-def predict_class(sentence):
-    """Predict intent class for input sentence."""
-    global model, _model_load_attempted, _model_load_failed
-    # Ensure model is loaded (attempt lazily).
-    if model is None and not _model_load_attempted:
-        try:
-            _model_load_attempted = True
-            from tensorflow.keras.models import load_model as _load_model
-            model = _load_model('model/chatbot_model.keras')
-        except Exception:
-            _model_load_failed = True
+def predict_class(sentence, bundle=None, precision=None):
+    """Predict intent class for input sentence.
+
+    Pass the `bundle` the caller will also build the response from, so a
+    reload in between cannot mix two model versions in one request.
+    `precision` ('float32', 'int8', 'float16') picks one of the weight copies
+    in a quantized pack; by default the bundle's own model (MODEL_PRECISION).
+    """
+    bundle = bundle or model_bundle.current()
+    model = bundle.model if precision is None or bundle.model is None else bundle.variant(precision)
 
     # If model failed to load, use a simple keyword-based fallback
     text = sentence.lower() if isinstance(sentence, str) else ''
@@ -212,14 +215,18 @@ def predict_class(sentence):
         # No rule matched — return empty so the caller can fallback
         return []
 
-    bow = bag_of_words(sentence)
+    if getattr(model, 'engine', None) == 'tfidf':
+        # nearest patterns by TF-IDF similarity (intent_tfidf.py), already in this shape
+        return model.classify(sentence)
+
+    bow = bag_of_words(sentence, bundle.words)
     res = model.predict(np.array([bow]))[0]
     ERROR_THRESHOLD = 0.25
     results = [[i, r] for i, r in enumerate(res) if r > ERROR_THRESHOLD]
     results.sort(key=lambda x: x[1], reverse=True)
     return_list = []
     for r in results:
-        return_list.append({'intent': classes[r[0]], 'probability': str(r[1])})
+        return_list.append({'intent': bundle.classes[r[0]], 'probability': str(r[1])})
     return return_list
 
 def markdown_bulletify(text):
@@ -233,14 +240,17 @@ def markdown_bulletify(text):
         return f"- {lines[0]}"
     return '\n'.join([f"{idx+1}. {l}" for idx, l in enumerate(lines)])
 
-def get_response(intents_list, intents_json):
+def get_response(intents_list, intents_json, fetch_updates=None):
     """
     Get chatbot response for predicted intents, merging static and web tips.
     Returns formatted response with preparedness tips and latest updates.
+    `fetch_updates(tag)` replaces fetch_latest_disaster_updates, e.g. to reuse
+    a session's recent updates (see session_store.py).
     """
+    fetch_updates = fetch_updates or fetch_latest_disaster_updates
     if not intents_list:
         # Fallback: fetch general tips from web
-        web_tips = fetch_latest_disaster_updates("general")
+        web_tips = fetch_updates("general")
         final_text = "I couldn't find a specific answer, but here are some important tips:\n\n" + \
             "\n".join(f"{i+1}. {t}" for i, t in enumerate(web_tips))
         return final_text
@@ -250,8 +260,10 @@ def get_response(intents_list, intents_json):
     
     for i in list_of_intents:
         if i['tag'] == tag:
-            # Select 4-5 distinct responses (phrases) from the intent's responses
-            base_responses = i.get('responses', [])
+            # Select 4-5 distinct responses (phrases) from the intent's responses;
+            # packed bundles (model_pack.py) carry them already normalized as 'tips'
+            prenormalized = 'tips' in i
+            base_responses = i['tips'] if prenormalized else i.get('responses', [])
             num_to_pick = min(5, max(4, len(base_responses))) if base_responses else 5
             try:
                 # If there are enough unique responses, sample without replacement
@@ -267,10 +279,9 @@ def get_response(intents_list, intents_json):
             chosen_tips = []
             for resp in chosen:
                 # If a response has multiple sentences, keep it as one concise tip by taking first 2 sentences
-                parts = [p.strip() for p in resp.replace('\n', '. ').split('. ') if p.strip()]
-                if not parts:
+                tip_text = resp if prenormalized else normalize_tip(resp)
+                if not tip_text:
                     continue
-                tip_text = '. '.join(parts[:2]) if len(parts) > 1 else parts[0]
                 if tip_text not in chosen_tips:
                     chosen_tips.append(tip_text)
 
@@ -285,7 +296,7 @@ def get_response(intents_list, intents_json):
             chosen_tips = chosen_tips[:5]
 
             # Get latest updates
-            web_tips = fetch_latest_disaster_updates(tag)
+            web_tips = fetch_updates(tag)
 
             # Build final output: numbered list of the selected tips
             final_text = "PREPAREDNESS TIPS:\n"
@@ -300,7 +311,7 @@ def get_response(intents_list, intents_json):
             return final_text
 
     # If no intent matched, fallback
-    web_tips = fetch_latest_disaster_updates("general")
+    web_tips = fetch_updates("general")
     return "I couldn't find a specific answer, but here are some important tips:\n\n" + \
            "\n".join(f"{i+1}. {t}" for i, t in enumerate(web_tips))
 
@@ -318,8 +329,9 @@ def main():
             print('\nGoodbye! Stay safe and prepared.')
             break
         
-        ints = predict_class(message)
-        res = get_response(ints, intents)
+        bundle = model_bundle.current()
+        ints = predict_class(message, bundle)
+        res = get_response(ints, bundle.intents)
         print('\nAssistant:', res, '\n')
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+import os
+import time
+from urllib.parse import urlsplit
+try:
+    import prometheus_client    # optional: /metrics is disabled without it
+    from prometheus_client import Counter, Gauge, Histogram
+except Exception:
+    prometheus_client = None
+
+# Prometheus metrics for routes, upstream calls, caches and inference.
+#
+# Under gunicorn every worker is a separate process, so when
+# PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py does this) each process
+# writes its samples to mmapped files in that directory and /metrics merges
+# them, whichever worker serves the scrape. Without prometheus_client all
+# helpers are no-ops.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+INFERENCE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+# every value model_bundle.Bundle.engine can take
+ENGINES = ('keras', 'pack', 'pack-int8', 'pack-float16', 'tfidf', 'rules')
+# see aio.upstream_url: simulated upstreams are labelled by the host they stand in for
+_SIM_BASE = os.environ.get('UPSTREAM_BASE_URL', '').rstrip('/')
+
+if prometheus_client is not None:
+    HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Route latency',
+                             ['route', 'method'], buckets=LATENCY_BUCKETS)
+    HTTP_REQUESTS = Counter('http_requests_total', 'Requests by route and status',
+                            ['route', 'method', 'status'])
+    UPSTREAM_LATENCY = Histogram('upstream_request_duration_seconds', 'Upstream latency to response headers',
+                                 ['host'], buckets=LATENCY_BUCKETS)
+    UPSTREAM_REQUESTS = Counter('upstream_requests_total', 'Upstream responses by status',
+                                ['host', 'status'])
+    UPSTREAM_ERRORS = Counter('upstream_errors_total', 'Upstream calls that got no response',
+                              ['host', 'kind'])
+    CACHE_LOOKUPS = Counter('cache_lookups_total', 'Cache lookups', ['cache', 'result'])
+    CACHE_ENTRIES = Gauge('cache_entries', 'Entries held per cache', ['cache'], multiprocess_mode='livesum')
+    INFERENCE_LATENCY = Histogram('intent_inference_seconds', 'predict_class latency',
+                                  ['engine'], buckets=INFERENCE_BUCKETS)
+    MODEL_ENGINE = Gauge('model_engine', '1 for the intent engine serving requests', ['engine'],
+                         multiprocess_mode='livemax')
+    FEED_LAST_SUCCESS = Gauge('feed_last_success_timestamp_seconds', 'Last successful fetch per feed',
+                              ['feed'], multiprocess_mode='max')
+    FEED_ERRORS = Counter('feed_errors_total', 'Feed responses that could not be used', ['feed', 'stage'])
+    MODEL_BUNDLE = Gauge('model_bundle_info', '1 for the intent model bundle version being served',
+                         ['version'], multiprocess_mode='livemax')
+    MODEL_RELOAD_SECONDS = Histogram('model_reload_seconds', 'Load + warm time of a model bundle',
+                                     buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+    MODEL_RELOADS = Counter('model_reloads_total', 'Model bundle reloads', ['result'])
+    ADMISSION_IN_FLIGHT = Gauge('admission_in_flight', 'Admitted requests per priority class', ['cls'],
+                                multiprocess_mode='livesum')
+    ADMISSION_QUEUE = Histogram('admission_queue_seconds', 'Time admitted requests waited for a slot',
+                                ['cls'], buckets=LATENCY_BUCKETS)
+    ADMISSION_SHED = Counter('admission_shed_total', 'Requests turned away by admission control',
+                             ['cls', 'reason', 'stale'])
+
+
+def enabled():
+    return prometheus_client is not None
+
+
+def host_of(url):
+    url = str(url)
+    if _SIM_BASE and url.startswith(_SIM_BASE + '/'):
+        return url[len(_SIM_BASE) + 1:].split('/', 1)[0].split(':')[0] or 'unknown'
+    return urlsplit(url).hostname or 'unknown'
+
+
+def observe_request(route, method, status, seconds):
+    if prometheus_client is None:
+        return
+    HTTP_LATENCY.labels(route, method).observe(seconds)
+    HTTP_REQUESTS.labels(route, method, str(status)).inc()
+
+
+def observe_upstream(url, seconds, status=None, error=None):
+    """Record one upstream call: a response `status`, or an `error` kind (timeout, connect, ...)."""
+    if prometheus_client is None:
+        return
+    host = host_of(url)
+    if error is not None:
+        UPSTREAM_ERRORS.labels(host, error).inc()
+        return
+    UPSTREAM_LATENCY.labels(host).observe(seconds)
+    UPSTREAM_REQUESTS.labels(host, str(status)).inc()
+
+
+def cache_lookup(cache, hit):
+    if prometheus_client is not None:
+        CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def cache_size(cache, n):
+    if prometheus_client is not None:
+        CACHE_ENTRIES.labels(cache).set(n)
+
+
+def observe_inference(engine, seconds):
+    if prometheus_client is None:
+        return
+    INFERENCE_LATENCY.labels(engine).observe(seconds)
+    for e in ENGINES:
+        MODEL_ENGINE.labels(e).set(1 if e == engine else 0)
+
+
+def model_bundle(version, engine, previous=None):
+    if prometheus_client is None:
+        return
+    if previous and previous != version:
+        MODEL_BUNDLE.labels(previous).set(0)
+    MODEL_BUNDLE.labels(version).set(1)
+    for e in ENGINES:
+        MODEL_ENGINE.labels(e).set(1 if e == engine else 0)
+
+
+def model_reload(seconds, result):
+    if prometheus_client is None:
+        return
+    MODEL_RELOADS.labels(result).inc()
+    if result == 'ok':
+        MODEL_RELOAD_SECONDS.observe(seconds)
+
+
+def feed_success(feed):
+    if prometheus_client is not None:
+        FEED_LAST_SUCCESS.labels(feed).set(time.time())
+
+
+def feed_error(feed, stage):
+    if prometheus_client is not None:
+        FEED_ERRORS.labels(feed, stage).inc()
+
+
+def admission_admitted(cls, waited, in_flight):
+    if prometheus_client is None:
+        return
+    ADMISSION_QUEUE.labels(cls).observe(waited)
+    ADMISSION_IN_FLIGHT.labels(cls).set(in_flight)
+
+
+def admission_released(cls, in_flight):
+    if prometheus_client is not None:
+        ADMISSION_IN_FLIGHT.labels(cls).set(in_flight)
+
+
+def admission_shed(cls, reason, stale):
+    if prometheus_client is not None:
+        ADMISSION_SHED.labels(cls, reason, 'yes' if stale else 'no').inc()
+
+
+def init_app(app):
+    """Time every request; the route label is the URL rule, not the raw path."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+        return response
+
+
+def render():
+    """Return (body, content_type) for a scrape."""
+    if prometheus_client is None:
+        return b'# prometheus_client is not installed\n', 'text/plain; charset=utf-8'
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """gunicorn child_exit hook: drop a dead worker's live gauges."""
+    if prometheus_client is not None and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
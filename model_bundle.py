@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+from threading import Lock
+
+import aio
+import metrics
+import model_pack
+import intent_tfidf
+
+# The intent model as one versioned, swappable bundle: intents.json, the
+# vocabulary and class list from training.py, and the Keras model.
+#
+# Every worker serves from current(). A request takes the bundle once and
+# uses that object throughout, so swapping in a new bundle never changes the
+# vocabulary or model under a request that is already running. Each worker
+# polls the artifacts' size and mtime every MODEL_WATCH_SECONDS. Once a
+# change has stayed put for one poll, so a half-written retrain is never
+# loaded, the worker loads the new bundle and warms it on a native
+# background thread. It is then swapped in with a single reference
+# assignment. A bundle whose model does not match its vocabulary or classes
+# is rejected and the old one kept.
+#
+# training.py swaps in a whole set of artifacts: it renames the new pickles,
+# model and pack into place together and then writes MANIFEST_FILE. Once
+# that file exists, the watcher keys on it (and on intents.json and the
+# trigger file) instead of on the individual artifacts. It therefore reloads
+# only after the last of them is in place, never between two renames.
+# model_pack.py rewrites the manifest when it rebuilds the pack.
+# Without a manifest, every artifact is watched as before. request_reload() (POST /admin/model/reload)
+# touches a trigger file in MODEL_DIR, so every worker process reloads, not
+# just the one that served the admin call.
+#
+# MODEL_FORMAT picks what is loaded. 'pack' uses the memory-mapped
+# model/bundle.pack (model_pack.py) alone. 'keras' uses the pickles and the
+# .keras model. 'auto', the default, uses the pack when it was built from
+# the artifacts now on disk and falls back to Keras when it is missing or
+# stale.
+#
+# INTENT_ENGINE=tfidf serves the sparse TF-IDF nearest-neighbour index
+# (intent_tfidf.py) instead of the MLP. It is built from intents.json alone
+# in milliseconds on every (re)load, so a bundle is just intents.json and
+# editing patterns needs no training run.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.environ.get('MODEL_DIR', os.path.join(ROOT, 'model'))
+INTENTS_PATH = os.environ.get('INTENTS_PATH', os.path.join(ROOT, 'intents.json'))
+MODEL_FILE = 'chatbot_model.keras'
+WATCH_SECONDS = float(os.environ.get('MODEL_WATCH_SECONDS', '5'))
+TRIGGER_FILE = '.reload'
+MANIFEST_FILE = 'bundle.json'
+MODEL_FORMAT = os.environ.get('MODEL_FORMAT', 'auto')
+ENGINE = os.environ.get('INTENT_ENGINE', 'mlp')
+
+_CURRENT = None
+_LOAD_LOCK = Lock()
+_STATUS = {'state': 'idle', 'last_reload_s': None, 'last_error': None, 'reloads': 0}
+_WATCHER_PID = None
+
+
+class Bundle:
+    """One consistent set of intents, vocabulary, classes and model."""
+
+    def __init__(self, intents, words, classes, model=None, version=None, variants=None):
+        self.intents = intents
+        self.words = words
+        self.classes = classes
+        self.model = model
+        # other precisions of the same model, from a quantized pack
+        self.variants = variants or {}
+        self.version = version or 'unversioned'
+        self.loaded_at = time.time()
+        self.load_seconds = 0.0
+
+    @property
+    def engine(self):
+        if self.model is None:
+            return 'rules'
+        return getattr(self.model, 'engine', 'keras')
+
+    def variant(self, precision):
+        """The model at `precision` ('float32', 'int8', 'float16')."""
+        if precision in self.variants:
+            return self.variants[precision]
+        if precision == 'float32' and self.model is not None and not self.variants:
+            return self.model
+        raise ValueError(f'bundle {self.version} has no {precision} weights;'
+                         f' rebuild it with python model_pack.py --quantize {precision}')
+
+    def info(self):
+        return {'version': self.version, 'engine': self.engine, 'words': len(self.words),
+                'classes': len(self.classes), 'intents': len(self.intents.get('intents', [])),
+                'precisions': sorted(self.variants),
+                'loaded_at': self.loaded_at, 'load_seconds': round(self.load_seconds, 3)}
+
+
+def _paths(model_dir=None, intents_path=None):
+    model_dir = model_dir or MODEL_DIR
+    return {
+        'intents': intents_path or INTENTS_PATH,
+        'words': os.path.join(model_dir, 'words.pkl'),
+        'classes': os.path.join(model_dir, 'classes.pkl'),
+        'model': os.path.join(model_dir, MODEL_FILE),
+        'pack': os.path.join(model_dir, model_pack.PACK_FILE),
+    }
+
+
+def _signature(paths):
+    """Cheap change detector: (size, mtime) of the manifest, or of every artifact
+    when there is none, plus intents.json and the trigger file."""
+    model_dir = os.path.dirname(paths['words'])
+    manifest = os.path.join(model_dir, MANIFEST_FILE)
+    watched = [paths['intents'], manifest] if os.path.exists(manifest) else list(paths.values())
+    sig = []
+    for p in watched + [os.path.join(model_dir, TRIGGER_FILE)]:
+        try:
+            st = os.stat(p)
+            sig.append((p, st.st_size, st.st_mtime_ns))
+        except OSError:
+            sig.append((p, None, None))
+    return tuple(sig)
+
+
+def _version(paths, names=('intents', 'words', 'classes', 'model')):
+    h = hashlib.sha256()
+    for name in names:
+        try:
+            with open(paths[name], 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        except OSError:
+            h.update(b'missing:' + name.encode())
+    return h.hexdigest()[:12]
+
+
+def write_manifest(model_dir=None, intents_path=None, version=None):
+    """Mark the artifacts in `model_dir` as one complete set; write it after all of them."""
+    paths = _paths(model_dir, intents_path)
+    path = os.path.join(os.path.dirname(paths['words']), MANIFEST_FILE)
+    manifest = {'version': version or _version(paths), 'written': time.time(),
+                'files': sorted(os.path.basename(p) for name, p in paths.items()
+                                if name != 'intents' and os.path.exists(p))}
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+    return manifest
+
+
+def _load_keras(path, strict):
+    # the first load falls back to keyword rules when this fails, as main.py
+    # always has; a reload must not replace a working model with the rules
+    try:
+        from tensorflow.keras.models import load_model
+        return load_model(path)
+    except Exception as e:
+        if strict and os.path.exists(path):
+            raise
+        print('Warning: could not load model', path, '-', e)
+        return None
+
+
+def _warm(bundle):
+    """Run one prediction so the first request does not pay for graph setup."""
+    if bundle.model is None:
+        return
+    import numpy as np
+    # same dtype as main.bag_of_words, or the first request traces predict again
+    bundle.model.predict(np.array([[0] * len(bundle.words)]), verbose=0)
+
+
+def _check(bundle):
+    if bundle.model is None:
+        return
+    n_in = bundle.model.input_shape[-1]
+    n_out = bundle.model.output_shape[-1]
+    if n_in != len(bundle.words) or n_out != len(bundle.classes):
+        raise ValueError(f'model expects {n_in} words / {n_out} classes, bundle has '
+                         f'{len(bundle.words)} / {len(bundle.classes)}')
+
+
+def _read_intents(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except OSError:
+        print('Warning: intents.json not found, using empty intents')
+        return {'intents': []}
+
+
+def _load_tfidf(paths):
+    intents = _read_intents(paths['intents'])
+    index = intent_tfidf.TfidfIndex.from_intents(intents)
+    index.similarities('')     # build the arrays now, not on the first request
+    return Bundle(intents, [], index.classes, index, version=_version(paths, ('intents',)))
+
+
+def _load_pack(paths, version):
+    """Bundle from the pack file, or None when MODEL_FORMAT says not to use it."""
+    if MODEL_FORMAT == 'keras' or not os.path.exists(paths['pack']):
+        if MODEL_FORMAT == 'pack':
+            raise FileNotFoundError(paths['pack'])
+        return None
+    pack = model_pack.Pack(paths['pack'])
+    if MODEL_FORMAT == 'auto' and pack.version != version:
+        print('Warning: model pack is older than the model files, loading Keras;'
+              ' run python model_pack.py to rebuild it')
+        return None
+    return Bundle(pack.intents, pack.words, pack.classes, pack.model, version=pack.version,
+                  variants=pack.models)
+
+
+def load(model_dir=None, intents_path=None, strict=False):
+    """Load, validate and warm a bundle from disk."""
+    start = time.perf_counter()
+    paths = _paths(model_dir, intents_path)
+    if ENGINE == 'tfidf':
+        bundle = _load_tfidf(paths)
+        bundle.load_seconds = time.perf_counter() - start
+        return bundle
+    # a pack-only deployment has nothing else to hash
+    version = _version(paths) if MODEL_FORMAT != 'pack' else None
+    bundle = _load_pack(paths, version)
+    if bundle is not None:
+        _check(bundle)
+        _warm(bundle)
+        bundle.load_seconds = time.perf_counter() - start
+        return bundle
+    intents = _read_intents(paths['intents'])
+    with open(paths['words'], 'rb') as f:
+        words = pickle.load(f)
+    with open(paths['classes'], 'rb') as f:
+        classes = pickle.load(f)
+    bundle = Bundle(intents, words, classes, _load_keras(paths['model'], strict), version=version)
+    _check(bundle)
+    _warm(bundle)
+    bundle.load_seconds = time.perf_counter() - start
+    return bundle
+
+
+def swap(bundle):
+    """Make `bundle` current; requests already holding the old one keep it."""
+    global _CURRENT
+    previous = _CURRENT
+    _CURRENT = bundle
+    metrics.model_bundle(bundle.version, bundle.engine, previous.version if previous else None)
+    return previous
+
+
+def current():
+    """The bundle to serve from; the first call in a process loads it."""
+    if _CURRENT is None:
+        with _LOAD_LOCK:
+            if _CURRENT is None:
+                swap(load())
+                _STATUS['last_reload_s'] = _CURRENT.load_seconds
+    _ensure_watcher()
+    return _CURRENT
+
+
+def reload():
+    """Load the artifacts on disk and swap them in; returns True if swapped."""
+    if not _LOAD_LOCK.acquire(blocking=False):
+        return False    # another reload is already running
+    _STATUS['state'] = 'loading'
+    try:
+        new = load(strict=True)
+        if _CURRENT is not None and new.version == _CURRENT.version:
+            return False
+        swap(new)
+        _STATUS['reloads'] += 1
+        _STATUS['last_reload_s'] = new.load_seconds
+        _STATUS['last_error'] = None
+        metrics.model_reload(new.load_seconds, 'ok')
+        print(f'Model bundle {new.version} loaded in {new.load_seconds:.2f}s')
+        return True
+    except Exception as e:
+        _STATUS['last_error'] = f'{type(e).__name__}: {e}'
+        metrics.model_reload(0, 'error')
+        print('Warning: model reload failed, keeping the current bundle:', e)
+        return False
+    finally:
+        _STATUS['state'] = 'idle'
+        _LOAD_LOCK.release()
+
+
+def request_reload():
+    """Ask every worker to reload (they all watch the trigger file)."""
+    if WATCH_SECONDS <= 0:
+        # nobody is watching: reload this process only
+        aio.start_native_thread(reload)
+        return
+    path = os.path.join(MODEL_DIR, TRIGGER_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(str(time.time()))
+
+
+def status():
+    out = dict(_STATUS)
+    out['watch_seconds'] = WATCH_SECONDS
+    if _CURRENT is not None:
+        out.update(_CURRENT.info())
+    return out
+
+
+def _watch():
+    sleep = aio.original_sleep()
+    paths = _paths()
+    seen = _signature(paths)
+    pending = None
+    while True:
+        sleep(WATCH_SECONDS)
+        sig = _signature(paths)
+        if sig == seen:
+            pending = None
+            continue
+        if sig != pending:
+            pending = sig   # still changing (or just changed): wait one more poll
+            continue
+        seen = sig
+        pending = None
+        reload()
+
+
+def _ensure_watcher():
+    # one watcher per process; gunicorn forks workers after import
+    global _WATCHER_PID
+    if WATCH_SECONDS <= 0 or _WATCHER_PID == os.getpid():
+        return
+    _WATCHER_PID = os.getpid()
+    aio.start_native_thread(_watch)
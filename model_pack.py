@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import pickle
+
+import numpy as np
+
+import _packfile
+
+# Packed intent model: one read-only binary file per model version.
+#
+# Holds everything model_bundle needs to serve: the vocabulary and class
+# list, the intents with their responses already normalized into tips (see
+# normalize_tip), and the weights of the Dense layers from training.py.
+# The file format is _packfile's, shared with poi_local.py: MAGIC, JSON
+# header, then flat arrays on 64-byte boundaries. The arrays are opened with
+# np.memmap, so every worker process shares the same pages in the OS page
+# cache. Opening the file costs a header parse, not a TensorFlow import or an
+# unpickle. The header stores a sha256 of the data region and the content
+# hash of the source artifacts. The checksum is verified right after a pack
+# is written (convert, training.py) and by Pack(path, verify=True); serving
+# skips it unless MODEL_PACK_VERIFY=1, so a worker or a hot reload does not
+# read the whole file before mapping it. model_bundle uses that hash to skip a pack older than its
+# source files. Forward passes run in numpy (DenseNet), and dropout is
+# skipped because it is a no-op at inference.
+#
+# A pack can also carry quantized copies of the weights (--quantize): int8
+# with one float32 scale per output unit, or float16. MODEL_PRECISION picks
+# the copy a bundle serves by default, and predict_class(precision=...) can
+# ask for another. The first layer's input is a sparse bag of words, so it
+# is computed by gathering only the kernel rows for the words present.
+# int8 then reads a quarter of the bytes that float32 does. Dense products
+# widen an int8/float16 kernel DEQUANT_ROWS rows at a time, so a forward pass
+# never holds a float32 copy of a whole kernel; the int8 scale is applied to
+# the product, not to the kernel.
+#
+# Convert the current artifacts with:
+#     python model_pack.py [--model-dir model] [--intents intents.json] [--out model/bundle.pack]
+#                          [--quantize int8,float16]
+# With --quantize, every training pattern is classified by each copy and
+# the command exits 1 if any top intent differs from float32.
+MAGIC = b'DPMODEL1'
+PACK_FILE = 'bundle.pack'
+VERIFY = os.environ.get('MODEL_PACK_VERIFY', '0') not in ('0', 'false', 'no')
+PRECISION = os.environ.get('MODEL_PRECISION', 'float32')
+PRECISIONS = ('float32', 'int8', 'float16')
+# gather rows instead of a dense matmul when fewer inputs than this are non-zero
+SPARSE_FRACTION = 0.25
+# kernel rows widened to float32 at a time for int8/float16 matmuls
+DEQUANT_ROWS = 1024
+_ACTIVATIONS = ('linear', 'relu', 'sigmoid', 'tanh', 'softmax')
+
+
+def _strings(items):
+    """(offsets, blob) arrays for a list of str."""
+    blob = bytearray()
+    off = np.zeros(len(items) + 1, dtype=np.uint64)
+    for i, s in enumerate(items):
+        blob += s.encode('utf-8')
+        off[i + 1] = len(blob)
+    return off, np.frombuffer(bytes(blob), dtype=np.uint8)
+
+
+def _unstrings(off, blob):
+    raw = bytes(blob)
+    return [raw[int(off[i]):int(off[i + 1])].decode('utf-8') for i in range(len(off) - 1)]
+
+
+def dense_layers(model):
+    """[(kernel, bias, activation)] for the Dense layers of a Keras model."""
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == 'Dropout':
+            continue
+        if kind != 'Dense':
+            raise ValueError(f'cannot pack a {kind} layer; only Dense and Dropout are supported')
+        act = layer.activation.__name__
+        if act not in _ACTIVATIONS:
+            raise ValueError(f'cannot pack activation {act!r}')
+        kernel, bias = layer.get_weights()
+        layers.append((kernel.astype(np.float32), bias.astype(np.float32), act))
+    return layers
+
+
+def quantize(kernel, precision):
+    """(kernel, scale) stored for `precision`; scale is None unless int8."""
+    if precision == 'float32':
+        return kernel.astype(np.float32), None
+    if precision == 'float16':
+        return kernel.astype(np.float16), None
+    if precision == 'int8':
+        # symmetric, per output unit: column j is q[:, j] * scale[j]
+        scale = np.abs(kernel).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        q = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+        return q, scale.astype(np.float32)
+    raise ValueError(f'unknown precision {precision!r}; expected one of {", ".join(PRECISIONS)}')
+
+
+def normalize_tip(resp):
+    """One response as a single-line tip: its first two sentences."""
+    parts = [p.strip() for p in resp.replace('\n', '. ').split('. ') if p.strip()]
+    if not parts:
+        return ''
+    return '. '.join(parts[:2]) if len(parts) > 1 else parts[0]
+
+
+def write_pack(path, intents, words, classes, layers, source=None, quantized=()):
+    """Write a pack (see _packfile) and return its header."""
+    intents = {'intents': [dict(i, tips=[t for t in (normalize_tip(r) for r in i.get('responses', [])) if t])
+                           for i in intents.get('intents', [])]}
+    arrays = {}
+    arrays['words_off'], arrays['words'] = _strings(words)
+    arrays['classes_off'], arrays['classes'] = _strings(classes)
+    arrays['intents'] = np.frombuffer(json.dumps(intents, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+    spec_layers = []
+    for n, (kernel, bias, act) in enumerate(layers):
+        arrays[f'kernel{n}'] = kernel
+        arrays[f'bias{n}'] = bias
+        spec_layers.append({'kernel': f'kernel{n}', 'bias': f'bias{n}', 'activation': act})
+    variants = {}
+    for precision in quantized:
+        if precision == 'float32':
+            continue
+        variants[precision] = []
+        for n, (kernel, bias, act) in enumerate(layers):
+            q, scale = quantize(kernel, precision)
+            arrays[f'kernel{n}.{precision}'] = q
+            spec = {'kernel': f'kernel{n}.{precision}', 'bias': f'bias{n}', 'activation': act}
+            if scale is not None:
+                arrays[f'scale{n}.{precision}'] = scale
+                spec['scale'] = f'scale{n}.{precision}'
+            variants[precision].append(spec)
+    header = {'source': source, 'created': time.time(), 'layers': spec_layers, 'variants': variants}
+    return _packfile.write(path, MAGIC, header, arrays, checksum=True)
+
+
+def read_header(path):
+    return _packfile.read_header(path, MAGIC, 'model pack')
+
+
+class DenseNet:
+    """numpy forward pass over memory-mapped Dense weights; a stand-in for
+    the parts of a Keras model that main.py and model_bundle use.
+
+    `layers` is [(kernel, scale, bias, activation)]; scale is None unless the
+    kernel is int8.
+    """
+
+    def __init__(self, layers, precision='float32'):
+        self.layers = layers
+        self.precision = precision
+        self.engine = 'pack' if precision == 'float32' else f'pack-{precision}'
+
+    @property
+    def input_shape(self):
+        return (None, self.layers[0][0].shape[0])
+
+    @property
+    def output_shape(self):
+        return (None, self.layers[-1][0].shape[1])
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for layer in self.layers for a in layer[:3] if a is not None)
+
+    @staticmethod
+    def _first(x, kernel):
+        """x @ kernel, reading only the kernel rows of non-zero inputs when x is sparse."""
+        rows, cols = np.nonzero(x)
+        if len(cols) > SPARSE_FRACTION * x.size:
+            return DenseNet._matmul(x, kernel)
+        h = np.zeros((x.shape[0], kernel.shape[1]), dtype=np.float32)
+        np.add.at(h, rows, kernel[cols].astype(np.float32) * x[rows, cols][:, None])
+        return h
+
+    @staticmethod
+    def _matmul(x, kernel):
+        """x @ kernel without a full float32 copy of an int8/float16 kernel."""
+        if kernel.dtype == np.float32:
+            return x @ kernel
+        h = np.zeros((x.shape[0], kernel.shape[1]), dtype=np.float32)
+        for i in range(0, kernel.shape[0], DEQUANT_ROWS):
+            xb = x[:, i:i + DEQUANT_ROWS]
+            if xb.any():
+                h += xb @ kernel[i:i + DEQUANT_ROWS].astype(np.float32)
+        return h
+
+    def predict(self, x, verbose=0):
+        h = np.asarray(x, dtype=np.float32)
+        if h.ndim == 1:
+            h = h[None, :]
+        for n, (kernel, scale, bias, act) in enumerate(self.layers):
+            if n == 0:
+                h = self._first(h, kernel)
+            else:
+                h = self._matmul(h, kernel)
+            if scale is not None:
+                h *= scale
+            h += bias
+            if act == 'relu':
+                np.maximum(h, 0, out=h)
+            elif act == 'softmax':
+                h = np.exp(h - h.max(axis=-1, keepdims=True))
+                h /= h.sum(axis=-1, keepdims=True)
+            elif act == 'sigmoid':
+                h = 1.0 / (1.0 + np.exp(-h))
+            elif act == 'tanh':
+                h = np.tanh(h)
+        return h
+
+    __call__ = predict
+
+
+class Pack:
+    """Read-only, memory-mapped view of a pack file."""
+
+    def __init__(self, path, verify=None):
+        hlen, self.header = read_header(path)
+        if (VERIFY if verify is None else verify) and not _packfile.verify(path, MAGIC, hlen, self.header):
+            raise ValueError(f'{path}: checksum mismatch, the pack is corrupt or truncated')
+        self.arrays = _packfile.open_arrays(path, MAGIC, hlen, self.header)
+        self.version = self.header.get('source') or self.header['sha256'][:12]
+        self.words = _unstrings(self.arrays['words_off'], self.arrays['words'])
+        self.classes = _unstrings(self.arrays['classes_off'], self.arrays['classes'])
+        self.intents = json.loads(bytes(self.arrays['intents']).decode('utf-8'))
+        variants = dict(self.header.get('variants') or {}, float32=self.header['layers'])
+        self.models = {precision: DenseNet([(self.arrays[l['kernel']], self.arrays.get(l.get('scale')),
+                                             self.arrays[l['bias']], l['activation']) for l in specs],
+                                           precision)
+                       for precision, specs in variants.items()}
+        if PRECISION not in self.models:
+            print(f'Warning: model pack has no {PRECISION} weights, serving float32;'
+                  f' rebuild with python model_pack.py --quantize {PRECISION}')
+        self.model = self.models.get(PRECISION, self.models['float32'])
+
+
+def check(pack, intents=None):
+    """Classify every training pattern with each precision in `pack`.
+
+    Returns {precision: {'patterns', 'top1_changed', 'max_abs_diff'}}, where
+    top1_changed counts patterns whose top intent differs from float32.
+    """
+    import main
+    intents = intents or pack.intents
+    patterns = [p for i in intents.get('intents', []) for p in i.get('patterns', [])]
+    if not patterns:
+        return {}
+    x = np.array([main.bag_of_words(p, pack.words) for p in patterns])
+    ref = pack.models['float32'].predict(x)
+    out = {}
+    for precision, model in pack.models.items():
+        if precision == 'float32':
+            continue
+        got = model.predict(x)
+        out[precision] = {'patterns': len(patterns),
+                          'top1_changed': int((got.argmax(axis=1) != ref.argmax(axis=1)).sum()),
+                          'max_abs_diff': float(np.abs(got - ref).max())}
+    return out
+
+
+def report(pack):
+    """Print check() for every quantized copy; False if any top intent changed."""
+    ok = True
+    for precision, res in check(pack).items():
+        print(f"  {precision}: {pack.models[precision].nbytes / 1024:.1f} KiB of weights (float32"
+              f" {pack.models['float32'].nbytes / 1024:.1f}), top intent changed on"
+              f" {res['top1_changed']}/{res['patterns']} training patterns,"
+              f" max probability error {res['max_abs_diff']:.4f}")
+        ok = ok and res['top1_changed'] == 0
+    if not ok:
+        print('Quantized weights change the top intent; keep MODEL_PRECISION=float32')
+    return ok
+
+
+def convert(model_dir=None, intents_path=None, out_path=None, quantized=()):
+    """Pack the artifacts training.py wrote; returns (out_path, verified Pack)."""
+    import model_bundle
+    from tensorflow.keras.models import load_model
+    paths = model_bundle._paths(model_dir, intents_path)
+    with open(paths['intents'], 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    with open(paths['words'], 'rb') as f:
+        words = pickle.load(f)
+    with open(paths['classes'], 'rb') as f:
+        classes = pickle.load(f)
+    layers = dense_layers(load_model(paths['model']))
+    out_path = out_path or paths['pack']
+    write_pack(out_path, intents, words, classes, layers, source=model_bundle._version(paths),
+               quantized=quantized)
+    pack = Pack(out_path, verify=True)
+    if os.path.abspath(out_path) == os.path.abspath(paths['pack']):
+        # running workers reload on the manifest, not on the pack itself
+        model_bundle.write_manifest(model_dir, intents_path, pack.header['source'])
+    return out_path, pack
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    def _opt(name):
+        return args[args.index(name) + 1] if name in args else None
+
+    quantized = [q for q in (_opt('--quantize') or '').split(',') if q]
+    for q in quantized:
+        quantize(np.zeros((1, 1), np.float32), q)   # reject unknown names before loading anything
+    out, pack = convert(_opt('--model-dir'), _opt('--intents'), _opt('--out'), quantized)
+    info = pack.header
+    size = os.path.getsize(out)
+    print(f"Packed model {info['source']} into {out} ({size / 1024:.1f} KiB, sha256 {info['sha256'][:12]})")
+    if quantized and not report(pack):
+        sys.exit(1)
@@ -8,10 +8,18 @@ try:
 	import pandas as pd     # optional: used by CLI CSV export helpers
 except Exception:
 	pd = None
+try:
+	import ijson            # optional: streaming parse of large Overpass responses
+except Exception:
+	ijson = None
 import json 						# to import json
-import requests					# to import requests
 from cache import ttl_cache
+import overpass_pool
+import asyncio
+import heapq
 import math
+import os
+import sys
 
 
 
@@ -109,10 +117,10 @@ def extract_nodes_data_from_OSM(built_query):
 
 # this function only extracts the raw  json data from overpass api through get request
 def extract_raw_data_from_OSM(built_query):
-	overpass_url = "http://overpass-api.de/api/interpreter" 					 #url of overpass api
-	response = requests.get(overpass_url,params={'data': built_query}) # sending a get request and passing the overpass query as data parameter in url
-	print(response.text)
-	json_data = response.json()
+	with overpass_pool.open_query(built_query, timeout=180) as response:  # best endpoint from the pool (OVERPASS_ENDPOINTS), with failover
+		response.read()                                                   # the pool streams; load the whole body here
+		print(response.text)
+		json_data = response.json()
 	with open("output_data.json", "w") as outfile:  									 # writing the json output to a file
 		json.dump(json_data, outfile)
 	print("Raw Data extraction successfull!  check 'output_data.json' file.")
@@ -122,6 +130,10 @@ def extract_raw_data_from_OSM(built_query):
 	
 
 
+if __name__ == '__main__' and sys.argv[1:2] == ['export']:  # batch mode: python overpass.py export <jobs file> [options]
+	import overpass_export
+	sys.exit(overpass_export.main(sys.argv[2:]))
+
 if __name__ == '__main__':  #main function to act accordingly to the user's input.
 
 	user_input=get_input()
@@ -145,10 +157,69 @@ if __name__ == '__main__':  #main function to act accordingly to the user's inpu
 
 
 
+# Canonical POI kinds as (element type, tag key, accepted values). Values of
+# None mean "any value"; a key of None means "any element of that type".
+# Aliases map the plural and synonym forms accepted by /map_pois onto these.
+_KINDS = {
+	'hospital': ('node', 'amenity', ('hospital',)),
+	'pharmacy': ('node', 'amenity', ('pharmacy',)),
+	'school': ('node', 'amenity', ('school', 'college', 'university')),
+	'fuel': ('node', 'amenity', ('fuel',)),
+	'police': ('node', 'amenity', ('police',)),
+	'fire_station': ('node', 'amenity', ('fire_station',)),
+	'roads': ('way', 'highway', None),
+	'power': ('node', 'power', None),
+	'all': ('node', None, None),
+}
+_KIND_ALIASES = {
+	'hospitals': 'hospital',
+	'pharmacies': 'pharmacy',
+	'schools': 'school',
+	'petrol': 'fuel', 'gas': 'fuel', 'fuelstation': 'fuel',
+	'firestation': 'fire_station', 'fire-station': 'fire_station',
+	'road': 'roads', 'highway': 'roads',
+	'electricity': 'power',
+	'amenity': 'all', 'node': 'all',
+}
+
+
+def _canonical_kind(kind):
+	"""Return the canonical kind key; unknown kinds are kept as-is (amenity=<kind>)."""
+	k = (kind or '').lower()
+	return _KIND_ALIASES.get(k, k)
+
+
+def _kind_spec(kind):
+	k = _canonical_kind(kind)
+	# treat unknown kinds as amenity=k where possible (common cases)
+	return _KINDS.get(k, ('node', 'amenity', (k.replace('"', ''),)))
+
+
+def _kind_selectors(kind):
+	el_type, key, values = _kind_spec(kind)
+	if key is None:
+		return [el_type]
+	if values is None:
+		return [f'{el_type}["{key}"]']
+	return [f'{el_type}["{key}"="{v}"]' for v in values]
+
+
+def _matches_kind(el, kind):
+	"""True if an Overpass element belongs to `kind` (used to split union results)."""
+	el_type, key, values = _kind_spec(kind)
+	if el.get('type') != el_type:
+		return False
+	if key is None:
+		return True
+	v = (el.get('tags') or {}).get(key)
+	return v is not None and (values is None or v in values)
+
+
 def _build_overpass_query(kind, lat, lon, radius_m=20000, limit=50):
 	"""Return an Overpass QL query for the requested kind.
 
-	kind: one of 'hospitals','schools','roads','electricity','all'
+	kind: one of 'hospitals','schools','roads','electricity','all', or a list
+	of kinds to fetch in a single union query
 	"""
 	# sanitize inputs
 	try:
@@ -158,32 +229,126 @@ def _build_overpass_query(kind, lat, lon, radius_m=20000, limit=50):
 	except Exception:
 		raise ValueError('Invalid lat/lon/radius')
 
-	# Normalize some common plural/synonym forms
-	k = (kind or '').lower()
-	if k in ('hospital', 'hospitals'):
-		q = f'[out:json][timeout:25];(node["amenity"="hospital"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('pharmacy', 'pharmacies'):
-		q = f'[out:json][timeout:25];(node["amenity"="pharmacy"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('school', 'schools'):
-		q = f'[out:json][timeout:25];(node["amenity"="school"](around:{radius_i},{lat_f},{lon_f});node["amenity"="college"](around:{radius_i},{lat_f},{lon_f});node["amenity"="university"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('fuel', 'petrol', 'gas', 'fuelstation'):
-		q = f'[out:json][timeout:25];(node["amenity"="fuel"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('police',):
-		q = f'[out:json][timeout:25];(node["amenity"="police"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('fire_station', 'firestation', 'fire-station'):
-		q = f'[out:json][timeout:25];(node["amenity"="fire_station"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k == 'roads' or k == 'road' or k == 'highway':
-		q = f'[out:json][timeout:25];(way["highway"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k in ('electricity', 'power'):
-		q = f'[out:json][timeout:25];(node["power"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	elif k == 'amenity' or k == 'all' or k == 'node':
-		# generic all nodes in area
-		q = f'[out:json][timeout:25];(node(around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	else:
-		# treat unknown kinds as amenity=k where possible (common cases)
-		# fall back to filtering by amenity tag
-		q = f'[out:json][timeout:25];(node["amenity"="{k}"](around:{radius_i},{lat_f},{lon_f}););out body;>;out skel qt;'
-	return q
+	try:
+		limit_i = max(1, int(limit))
+	except Exception:
+		limit_i = 50
+
+	kinds = [kind] if isinstance(kind, str) or kind is None else list(kind)
+	selectors = []
+	for k in kinds:
+		selectors.extend(sel for sel in _kind_selectors(k) if sel not in selectors)
+	around = f'(around:{radius_i},{lat_f},{lon_f});'
+	body = ''.join(sel + around for sel in selectors)
+	# Push the result size down to Overpass. It cannot sort by distance, so
+	# ask for an oversampled cap and pick the nearest `limit` locally; a
+	# capped (truncated) answer is an arbitrary subset, see _search_direct.
+	# `out center` gives ways a position without recursing into member nodes.
+	return f'[out:json][timeout:25];({body});out center {_server_cap(kinds, limit_i)};'
+
+
+def _server_cap(kinds, limit):
+	return min(MAX_SERVER_RESULTS, limit * OVERSAMPLE * len(kinds))
+
+
+def _iter_elements(resp):
+	"""Yield Overpass elements from a streamed httpx response (overpass_pool.open_query).
+
+	Uses ijson when installed so the body is never held in memory as a whole;
+	otherwise falls back to decoding the full JSON document.
+	"""
+	if ijson is not None:
+		yield from ijson.items(_Body(resp), 'elements.item', use_float=True)
+		return
+	resp.read()
+	data = resp.json()
+	yield from (data.get('elements', []) if isinstance(data, dict) else [])
+
+
+class _Body:
+	"""File-like adapter for ijson.items over an httpx streaming response."""
+
+	def __init__(self, resp):
+		self._chunks = resp.iter_bytes()
+
+	def read(self, n=-1):
+		if n == 0:
+			# ijson probes read(0) to tell bytes from str
+			return b''
+		return next(self._chunks, b'')
+
+
+class _AsyncBody:
+	"""File-like adapter for ijson.items_async over an httpx streaming response."""
+
+	def __init__(self, resp):
+		self._chunks = resp.aiter_bytes()
+
+	async def read(self, n=-1):
+		if n == 0:
+			# ijson probes read(0) to tell bytes from str
+			return b''
+		try:
+			return await self._chunks.__anext__()
+		except StopAsyncIteration:
+			return b''
+
+
+async def _aiter_elements(resp):
+	"""Async _iter_elements for httpx responses from overpass_pool.open_query_async."""
+	if ijson is not None:
+		async for el in ijson.items_async(_AsyncBody(resp), 'elements.item', use_float=True):
+			yield el
+		return
+	await resp.aread()
+	data = resp.json()
+	for el in (data.get('elements', []) if isinstance(data, dict) else []):
+		yield el
+
+
+def _haversine_km(a_lat, a_lon, b_lat, b_lon):
+	R = 6371.0
+	phi1 = math.radians(a_lat)
+	phi2 = math.radians(b_lat)
+	dphi = math.radians(b_lat - a_lat)
+	dlambda = math.radians(b_lon - a_lon)
+	x = math.sin(dphi/2.0)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2.0)**2
+	return 2 * R * math.asin(min(1, math.sqrt(x)))
+
+
+def _element_to_poi(el):
+	"""Convert an Overpass element to a POI dict, or None if it has no position."""
+	lat_v = el.get('lat') or (el.get('center') and el.get('center').get('lat'))
+	lon_v = el.get('lon') or (el.get('center') and el.get('center').get('lon'))
+	if not lat_v or not lon_v:
+		return None
+	tags = el.get('tags', {}) or {}
+	name = tags.get('name') or tags.get('official_name') or tags.get('ref') or ''
+	return {
+		'id': el.get('id'),
+		'osm_type': el.get('type'),
+		'lat': float(lat_v),
+		'lon': float(lon_v),
+		'name': name,
+		'tags': tags
+	}
+
+
+# POI backend: 'overpass' (live only), 'local' (offline index only, see
+# poi_local) or 'local_fallback' (offline index, Overpass when the index is
+# missing or does not cover the kind).
+POI_BACKEND = os.environ.get('POI_BACKEND', 'overpass').lower()
+
+# Kinds served through the tile cache (poi_tiles). The catch-all 'all' kind
+# would pull every node of every tile, so it keeps the direct around: query.
+USE_TILES = os.environ.get('OVERPASS_TILES', '1') not in ('0', 'false', 'no')
+
+# server-side result cap for direct queries: limit * OVERSAMPLE, bounded
+OVERSAMPLE = 10
+MAX_SERVER_RESULTS = 5000
+# re-queries with a smaller radius when a direct query hits the cap
+MAX_REFINE = 3
+MIN_REFINE_STEP_M = 50
 
 
 @ttl_cache(ttl_seconds=120)
@@ -191,55 +356,214 @@ def search_pois(lat, lon, radius_m=20000, kind='amenity', limit=100):
 	"""Query Overpass API and return a list of POIs with lat/lon, name, type, tags.
 
 	Results are cached for a short TTL to avoid repeated calls to Overpass for
-	identical queries.
+	identical queries. Specific kinds go through the tile cache in poi_tiles,
+	so overlapping map views reuse already downloaded tiles.
 	"""
-	q = _build_overpass_query(kind, lat, lon, radius_m=radius_m, limit=limit)
-	overpass_url = 'http://overpass-api.de/api/interpreter'
-	resp = requests.get(overpass_url, params={'data': q}, timeout=15)
-	resp.raise_for_status()
-	data = resp.json()
-	elements = data.get('elements', []) if isinstance(data, dict) else []
-	pois = []
-	for el in elements:
-		typ = el.get('type')
-		lat_v = el.get('lat') or (el.get('center') and el.get('center').get('lat'))
-		lon_v = el.get('lon') or (el.get('center') and el.get('center').get('lon'))
-		tags = el.get('tags', {}) or {}
-		name = tags.get('name') or tags.get('official_name') or tags.get('ref') or ''
-		poi = {
-			'id': el.get('id'),
-			'osm_type': typ,
-			'lat': float(lat_v) if lat_v else None,
-			'lon': float(lon_v) if lon_v else None,
-			'name': name,
-			'tags': tags
-		}
-		if poi['lat'] and poi['lon']:
-			pois.append(poi)
-		if len(pois) >= limit:
-			break
+	return _search_kinds(lat, lon, radius_m, [kind], limit)[kind]
 
-	# compute haversine distance (km) to sort nearest-first
-	def _haversine(a_lat, a_lon, b_lat, b_lon):
-		R = 6371.0
-		phi1 = math.radians(a_lat)
-		phi2 = math.radians(b_lat)
-		dphi = math.radians(b_lat - a_lat)
-		dlambda = math.radians(b_lon - a_lon)
-		x = math.sin(dphi/2.0)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2.0)**2
-		return 2 * R * math.asin(min(1, math.sqrt(x)))
-
-	for p in pois:
-		try:
-			p['distance_km'] = round(_haversine(float(lat), float(lon), float(p['lat']), float(p['lon'])), 3)
-		except Exception:
-			p['distance_km'] = None
 
-	# sort by distance (None values go to the end)
-	pois.sort(key=lambda x: (x['distance_km'] is None, x['distance_km']))
+def search_pois_multi(lat, lon, radius_m=20000, kinds=('amenity',), limit=100):
+	"""Return {kind: [poi, ...]} for several kinds, each nearest-first and capped.
+
+	All tiled kinds share one Overpass union query (and the catch-all kind a
+	second one at most). Each kind's result is also stored in the
+	search_pois cache, so later single-kind calls are cache hits.
+	"""
+	kinds = list(dict.fromkeys(kinds))
+	out = _search_kinds(lat, lon, radius_m, kinds, limit)
+	_prime_cache(out, lat, lon, radius_m, limit)
+	return out
+
 
-	# enforce limit after sorting
-	if len(pois) > limit:
-		pois = pois[:limit]
+async def search_pois_multi_async(lat, lon, radius_m=20000, kinds=('amenity',), limit=100):
+	"""Async search_pois_multi on the shared httpx client (aio.run it from sync code).
 
-	return pois
\ No newline at end of file
+	Shares the search_pois cache with the sync path: fully cached requests
+	never touch the network, and fresh results prime it.
+	"""
+	kinds = list(dict.fromkeys(kinds))
+	out = {}
+	for k in kinds:
+		hit, pois = search_pois.cache_lookup(lat=lat, lon=lon, radius_m=radius_m, kind=k, limit=limit)
+		if hit:
+			out[k] = pois
+	todo = [k for k in kinds if k not in out]
+	if todo:
+		fresh = await _search_kinds_async(lat, lon, radius_m, todo, limit)
+		_prime_cache(fresh, lat, lon, radius_m, limit)
+		out.update(fresh)
+	return {k: out[k] for k in kinds}
+
+
+async def search_pois_async(lat, lon, radius_m=20000, kind='amenity', limit=100):
+	return (await search_pois_multi_async(lat, lon, radius_m=radius_m, kinds=[kind], limit=limit))[kind]
+
+
+def _prime_cache(out, lat, lon, radius_m, limit):
+	for k, pois in out.items():
+		search_pois.cache_set(pois, lat=lat, lon=lon, radius_m=radius_m, kind=k, limit=limit)
+
+
+def _plan_kinds(lat, lon, radius_m, kinds, limit):
+	"""Serve what the local index can; return (out, tiled kinds, direct kinds)."""
+	out = {}
+	remote = []
+	for kind in kinds:
+		if POI_BACKEND in ('local', 'local_fallback'):
+			import poi_local
+			pois = poi_local.search_pois(lat, lon, radius_m=radius_m, kind=kind, limit=limit)
+			if pois is not None:
+				out[kind] = pois
+				continue
+			if POI_BACKEND == 'local':
+				out[kind] = []
+				continue
+		remote.append(kind)
+
+	tiled = [k for k in remote if USE_TILES and _canonical_kind(k) != 'all']
+	direct = [k for k in remote if k not in tiled]
+	return out, tiled, direct
+
+
+def _search_kinds(lat, lon, radius_m, kinds, limit):
+	out, tiled, direct = _plan_kinds(lat, lon, radius_m, kinds, limit)
+	if tiled:
+		import poi_tiles
+		out.update(poi_tiles.search_pois_multi(lat, lon, radius_m=radius_m, kinds=tiled, limit=limit))
+	if direct:
+		out.update(_search_direct(lat, lon, radius_m, direct, limit))
+	return out
+
+
+async def _search_kinds_async(lat, lon, radius_m, kinds, limit):
+	out, tiled, direct = _plan_kinds(lat, lon, radius_m, kinds, limit)
+	parts = []
+	if tiled:
+		import poi_tiles
+		parts.append(poi_tiles.search_pois_multi_async(lat, lon, radius_m=radius_m, kinds=tiled, limit=limit))
+	if direct:
+		parts.append(_search_direct_async(lat, lon, radius_m, direct, limit))
+	# the tiled and direct queries are independent, run them side by side
+	for part in await asyncio.gather(*parts):
+		out.update(part)
+	return out
+
+
+class _NearestSink:
+	"""Per kind, a bounded max-heap of the `limit` nearest POIs: (-distance, seq, poi)."""
+
+	def __init__(self, lat, lon, radius_m, kinds, limit):
+		self.lat = float(lat)
+		self.lon = float(lon)
+		self.radius_m = int(radius_m)
+		self.radius_km = self.radius_m / 1000.0
+		self.limit = limit
+		self.cap = _server_cap(kinds, limit)
+		self.heaps = {k: [] for k in kinds}
+		self.seq = 0
+
+	@property
+	def truncated(self):
+		"""True when Overpass stopped at the cap: the elements seen are an arbitrary subset."""
+		return self.seq >= self.cap
+
+	def full(self):
+		return all(len(heap) >= self.limit for heap in self.heaps.values())
+
+	def feed(self, el):
+		self.seq += 1
+		poi = _element_to_poi(el)
+		if not poi:
+			return
+		dist = _haversine_km(self.lat, self.lon, poi['lat'], poi['lon'])
+		if dist > self.radius_km:
+			return
+		for k, heap in self.heaps.items():
+			if not _matches_kind(el, k):
+				continue
+			if len(heap) < self.limit:
+				heapq.heappush(heap, (-dist, self.seq, poi))
+			elif dist < -heap[0][0]:
+				heapq.heapreplace(heap, (-dist, self.seq, poi))
+
+	def result(self):
+		out = {}
+		for k, heap in self.heaps.items():
+			pois = []
+			for neg_dist, _, poi in sorted(heap, key=lambda h: (-h[0], h[1])):
+				poi = dict(poi, distance_km=round(-neg_dist, 3))
+				pois.append(poi)
+			out[k] = pois
+		return out
+
+
+def _next_radius(sink, inner, outer):
+	"""Refine after one direct query; returns (next radius or None, inner, outer).
+
+	`inner` is the widest complete (untruncated) answer so far and `outer`
+	the narrowest truncated one. A complete answer holds every element of
+	its circle, so its nearest `limit` are exact once each kind has `limit`
+	of them (or when it covers the whole search radius).
+	"""
+	if sink.truncated:
+		outer = sink
+	else:
+		inner = sink
+		if outer is None or sink.full():
+			return None, inner, outer
+	if inner is not None:
+		radius = (inner.radius_m + outer.radius_m) // 2
+	else:
+		# the cap allows OVERSAMPLE * limit per kind: aim for about 2 * limit
+		radius = int(outer.radius_m * math.sqrt(2.0 / OVERSAMPLE))
+	if abs(radius - sink.radius_m) < MIN_REFINE_STEP_M:
+		return None, inner, outer
+	return radius, inner, outer
+
+
+def _refined_result(inner, outer):
+	"""Exact nearest from `inner`, topped up from the truncated `outer` beyond inner's radius."""
+	if inner is None:
+		return outer.result()
+	out = inner.result()
+	if outer is None:
+		return out
+	for k, extra in outer.result().items():
+		pois = out[k]
+		pois.extend(p for p in extra if p['distance_km'] > inner.radius_km)
+		del pois[inner.limit:]
+	return out
+
+
+def _search_direct(lat, lon, radius_m, kinds, limit):
+	"""Around: union query for `kinds`, split back per kind by tag, nearest-first.
+
+	When Overpass stops at the result cap the answer is an arbitrary subset
+	of the circle, so the nearest are re-queried with a smaller radius (at
+	most MAX_REFINE times) until a complete answer holds `limit` of them.
+	"""
+	radius, inner, outer = int(radius_m), None, None
+	for _ in range(MAX_REFINE + 1):
+		q = _build_overpass_query(kinds, lat, lon, radius_m=radius, limit=limit)
+		sink = _NearestSink(lat, lon, radius, kinds, limit)
+		with overpass_pool.open_query(q, timeout=15) as resp:
+			for el in _iter_elements(resp):
+				sink.feed(el)
+		radius, inner, outer = _next_radius(sink, inner, outer)
+		if radius is None:
+			break
+	return _refined_result(inner, outer)
+
+
+async def _search_direct_async(lat, lon, radius_m, kinds, limit):
+	radius, inner, outer = int(radius_m), None, None
+	for _ in range(MAX_REFINE + 1):
+		q = _build_overpass_query(kinds, lat, lon, radius_m=radius, limit=limit)
+		sink = _NearestSink(lat, lon, radius, kinds, limit)
+		async with overpass_pool.open_query_async(q, timeout=15) as resp:
+			async for el in _aiter_elements(resp):
+				sink.feed(el)
+		radius, inner, outer = _next_radius(sink, inner, outer)
+		if radius is None:
+			break
+	return _refined_result(inner, outer)
@@ -0,0 +1,298 @@
+import sys
+import csv
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import pyarrow as pa            # optional: only needed for --format parquet
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+import overpass
+import overpass_pool
+
+# Streaming bulk export for the overpass.py CLI.
+#
+# Reads many (lat, lon, radius_m, kind) jobs from a CSV or JSON-lines file,
+# runs their Overpass queries with bounded concurrency and streams every
+# element straight into a CSV / NDJSON / Parquet writer. Workers push rows
+# into a bounded queue drained by a single writer thread, so memory stays
+# flat no matter how large a road or terrain result is (with ijson
+# installed responses are parsed incrementally too).
+#
+#     python overpass.py export points.csv --format ndjson --out pois.ndjson --concurrency 4
+
+COLUMNS = ['query_id', 'kind', 'osm_type', 'id', 'lat', 'lon', 'name', 'tags', 'geometry']
+QUEUE_SIZE = 10000
+PARQUET_BATCH = 5000
+_DONE = object()
+
+
+def read_jobs(path, default_radius=20000, default_kinds=('hospital',)):
+    """Yield job dicts from a .csv (header lat,lon[,radius_m][,kind]) or .jsonl file.
+
+    A row that cannot be parsed yields one job with an `error` instead, which
+    run_export counts as failed without querying Overpass.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            rows = (line for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        n = 0
+        for line_no, row in enumerate(rows, 1):
+            try:
+                if isinstance(row, str):
+                    row = json.loads(row)
+                kinds = [row['kind']] if row.get('kind') else list(default_kinds)
+                point = {
+                    'lat': float(row['lat']),
+                    'lon': float(row['lon']),
+                    'radius_m': int(row.get('radius_m') or default_radius),
+                }
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                yield {'query_id': n, 'kind': None, 'lat': None, 'lon': None,
+                       'error': f'row {line_no}: {type(e).__name__}: {e}'}
+                n += 1
+                continue
+            for kind in kinds:
+                yield {'query_id': n, 'kind': kind, **point}
+                n += 1
+
+
+def build_export_query(job, geom=False):
+    """Around: query for one job without any result cap (this is a bulk export)."""
+    around = f"(around:{job['radius_m']},{job['lat']},{job['lon']});"
+    body = ''.join(sel + around for sel in overpass._kind_selectors(job['kind']))
+    out = 'out geom;' if geom else 'out center;'
+    return f'[out:json][timeout:180];({body});{out}'
+
+
+def _element_row(job, el):
+    lat = el.get('lat') or (el.get('center') or {}).get('lat')
+    lon = el.get('lon') or (el.get('center') or {}).get('lon')
+    tags = el.get('tags') or {}
+    return {
+        'query_id': job['query_id'],
+        'kind': job['kind'],
+        'osm_type': el.get('type'),
+        'id': el.get('id'),
+        'lat': float(lat) if lat is not None else None,
+        'lon': float(lon) if lon is not None else None,
+        'name': tags.get('name') or '',
+        'tags': tags,
+        'geometry': el.get('geometry'),
+    }
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w', newline='', encoding='utf-8')
+        self.w = csv.writer(self.f)
+        self.w.writerow(COLUMNS)
+
+    def write(self, row):
+        self.w.writerow([
+            row['query_id'], row['kind'], row['osm_type'], row['id'], row['lat'], row['lon'], row['name'],
+            json.dumps(row['tags'], ensure_ascii=False),
+            json.dumps(row['geometry']) if row['geometry'] is not None else '',
+        ])
+
+    def close(self):
+        self.f.close()
+
+
+class NdjsonWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8')
+
+    def write(self, row):
+        if row['geometry'] is None:
+            row = {k: v for k, v in row.items() if k != 'geometry'}
+        self.f.write(json.dumps(row, ensure_ascii=False))
+        self.f.write('\n')
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        if pa is None:
+            raise RuntimeError('pyarrow is required for --format parquet; install pyarrow or use csv/ndjson')
+        self.schema = pa.schema([
+            ('query_id', pa.int64()), ('kind', pa.string()), ('osm_type', pa.string()), ('id', pa.int64()),
+            ('lat', pa.float64()), ('lon', pa.float64()), ('name', pa.string()),
+            ('tags', pa.string()), ('geometry', pa.string()),
+        ])
+        self.w = pq.ParquetWriter(path, self.schema)
+        self.batch = {c: [] for c in COLUMNS}
+
+    def write(self, row):
+        for c in COLUMNS:
+            v = row[c]
+            if c == 'tags':
+                v = json.dumps(v, ensure_ascii=False)
+            elif c == 'geometry' and v is not None:
+                v = json.dumps(v)
+            self.batch[c].append(v)
+        if len(self.batch['id']) >= PARQUET_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self.batch['id']:
+            self.w.write_table(pa.Table.from_pydict(self.batch, schema=self.schema))
+            self.batch = {c: [] for c in COLUMNS}
+
+    def close(self):
+        self._flush()
+        self.w.close()
+
+
+WRITERS = {'csv': CsvWriter, 'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+def run_export(jobs, writer, concurrency=4, geom=False, dedupe=False, progress_every=5.0, log=sys.stderr):
+    """Run jobs with bounded concurrency, streaming rows into `writer`.
+
+    Returns a stats dict: jobs, failed, rows, seconds, rows_per_s.
+    """
+    rows_q = queue.Queue(maxsize=QUEUE_SIZE)
+    jobs = iter(jobs)
+    # the executor's own queue is unbounded, so hand out jobs through a
+    # semaphore instead of submitting them all up front
+    slots = threading.Semaphore(concurrency)
+    stats = {'jobs': 0, 'failed': 0, 'rows': 0}
+    # set when the writer side fails: workers and the feeder stop instead of
+    # blocking forever on the full queue or a free slot
+    stop = threading.Event()
+    futures = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                rows_q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker(job):
+        if job.get('error'):
+            put((_DONE, f"query {job['query_id']}: bad input {job['error']}"))
+            slots.release()
+            return
+        try:
+            q = build_export_query(job, geom=geom)
+            with overpass_pool.open_query(q, timeout=180) as resp:
+                for el in overpass._iter_elements(resp):
+                    if not put(_element_row(job, el)):
+                        return
+            put((_DONE, None))
+        except Exception as e:
+            put((_DONE, f"query {job['query_id']} ({job['kind']} @ {job['lat']},{job['lon']}): {e}"))
+        finally:
+            slots.release()
+
+    def feeder(pool):
+        n = 0
+        try:
+            for job in jobs:
+                while not slots.acquire(timeout=0.5):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                futures.append(pool.submit(worker, job))
+                n += 1
+        except BaseException as e:
+            # e.g. an unreadable jobs file: stop after the submitted jobs, raise below
+            feed_error.append(e)
+        finally:
+            stats['jobs'] = n
+            feeding.clear()
+
+    seen = set() if dedupe else None
+    start = last = time.time()
+    finished = 0
+    feed_error = []
+    feeding = threading.Event()
+    feeding.set()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        t = threading.Thread(target=feeder, args=(pool,), daemon=True)
+        t.start()
+        try:
+            while feeding.is_set() or finished < stats['jobs']:
+                try:
+                    item = rows_q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if isinstance(item, tuple) and item[0] is _DONE:
+                    finished += 1
+                    if item[1]:
+                        stats['failed'] += 1
+                        print(f'error: {item[1]}', file=log)
+                    continue
+                if seen is not None:
+                    ident = (item['kind'], item['osm_type'], item['id'])
+                    if ident in seen:
+                        continue
+                    seen.add(ident)
+                writer.write(item)
+                stats['rows'] += 1
+                now = time.time()
+                if now - last >= progress_every:
+                    last = now
+                    print(f"{stats['rows']} rows, {finished} queries done, {stats['rows'] / (now - start):.0f} rows/s", file=log)
+        except BaseException:
+            # the writer failed (disk full, closed pipe, Ctrl-C): stop the feeder
+            # and the workers, and drain the queue until they have exited, so
+            # leaving the executor does not wait forever
+            stop.set()
+            t.join()
+            while not all(f.done() for f in futures):
+                try:
+                    rows_q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        t.join()
+    if feed_error:
+        raise feed_error[0]
+
+    stats['seconds'] = round(time.time() - start, 3)
+    stats['rows_per_s'] = round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='overpass.py export', description='Bulk Overpass export for many points/kinds.')
+    ap.add_argument('jobs', help='CSV (lat,lon[,radius_m][,kind]) or JSON-lines file of query points')
+    ap.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    ap.add_argument('--out', help='output file (default output_data.<format>)')
+    ap.add_argument('--concurrency', type=int, default=4)
+    ap.add_argument('--radius', type=int, default=20000, help='default radius_m for rows without one')
+    ap.add_argument('--kinds', default='hospital', help='comma separated kinds for rows without a kind')
+    ap.add_argument('--geom', action='store_true', help='include full way geometry (out geom)')
+    ap.add_argument('--dedupe', action='store_true', help='drop elements already written for the same kind')
+    args = ap.parse_args(argv)
+
+    out = args.out or f'output_data.{args.format}'
+    jobs = read_jobs(args.jobs, default_radius=args.radius, default_kinds=[k for k in args.kinds.split(',') if k])
+    writer = WRITERS[args.format](out)
+    try:
+        stats = run_export(jobs, writer, concurrency=max(1, args.concurrency), geom=args.geom, dedupe=args.dedupe)
+    finally:
+        writer.close()
+    print(f"Exported {stats['rows']} rows from {stats['jobs']} queries ({stats['failed']} failed) "
+          f"to '{out}' in {stats['seconds']}s - {stats['rows_per_s']} rows/s")
+    return 0 if not stats['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
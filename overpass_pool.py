@@ -0,0 +1,309 @@
+import os
+import re
+import time
+from contextlib import contextmanager, asynccontextmanager
+from threading import Lock
+
+import httpx
+
+import aio
+
+# Pool of Overpass API endpoints with latency-aware selection and failover.
+#
+# Endpoints come from OVERPASS_ENDPOINTS (comma separated interpreter URLs,
+# e.g. public mirrors or our own instance). Each one keeps an EWMA of its
+# response latency and a count of in-flight requests; requests go to the
+# endpoint with the lowest ewma * (1 + in_flight) that is not cooling down.
+# A 429 or 5xx moves on to the next endpoint; after a 429 the endpoint's
+# /api/status is read to learn when its next query slot frees up. For
+# RATE_LIMIT_MEMORY seconds after a 429 the status page is read again before
+# each query sent there, and the endpoint is skipped while it has no slot.
+DEFAULT_ENDPOINTS = 'http://overpass-api.de/api/interpreter'
+EWMA_ALPHA = 0.3
+INITIAL_LATENCY = 1.0
+BASE_COOLDOWN = 5.0
+MAX_COOLDOWN = 300.0
+STATUS_TIMEOUT = 3
+RATE_LIMIT_MEMORY = 300.0
+
+_SLOTS_NOW = re.compile(r'(\d+)\s+slots? available now')
+_SLOT_AFTER = re.compile(r'in\s+(\d+)\s+seconds')
+
+
+class OverpassUnavailable(Exception):
+    """Every endpoint failed or is rate limited; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.ewma = INITIAL_LATENCY
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.rate_limited_at = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def status_url(self):
+        return self.url.rsplit('/', 1)[0] + '/status'
+
+    def score(self):
+        return self.ewma * (1 + self.in_flight)
+
+    def record_success(self, latency):
+        self.ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.rate_limited_at = 0.0
+
+    def rate_limited_recently(self):
+        return time.time() - self.rate_limited_at < RATE_LIMIT_MEMORY
+
+    def record_failure(self, cooldown=None):
+        self.errors += 1
+        self.failures += 1
+        if cooldown is None:
+            cooldown = min(MAX_COOLDOWN, BASE_COOLDOWN * (2 ** (self.failures - 1)))
+        self.cooldown_until = time.time() + cooldown
+
+    def snapshot(self):
+        return {
+            'url': self.url,
+            'ewma_s': round(self.ewma, 3),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'cooling_down_s': max(0.0, round(self.cooldown_until - time.time(), 1)),
+        }
+
+
+_LOCK = Lock()
+_ENDPOINTS = []
+
+
+def configure(urls=None):
+    """(Re)build the pool; defaults to OVERPASS_ENDPOINTS from the environment."""
+    global _ENDPOINTS
+    if urls is None:
+        urls = os.environ.get('OVERPASS_ENDPOINTS', aio.upstream_url(DEFAULT_ENDPOINTS)).split(',')
+    with _LOCK:
+        _ENDPOINTS = [Endpoint(u.strip()) for u in urls if u.strip()]
+
+
+def _ordered():
+    """Endpoints to try, best first; cooling-down ones last (soonest first)."""
+    now = time.time()
+    with _LOCK:
+        ready = [e for e in _ENDPOINTS if e.cooldown_until <= now]
+        cooling = [e for e in _ENDPOINTS if e.cooldown_until > now]
+    ready.sort(key=lambda e: e.score())
+    cooling.sort(key=lambda e: e.cooldown_until)
+    return ready, cooling
+
+
+def slot_wait(endpoint):
+    """Seconds until `endpoint` has a free query slot per /api/status (0 = now).
+
+    Returns None when the status page cannot be read.
+    """
+    try:
+        r = aio.sync_client().get(endpoint.status_url, timeout=STATUS_TIMEOUT)
+        if r.status_code != 200:
+            return None
+        return _parse_status(r.text)
+    except Exception:
+        return None
+
+
+async def slot_wait_async(endpoint):
+    try:
+        r = await aio.get(endpoint.status_url, timeout=STATUS_TIMEOUT)
+        if r.status_code != 200:
+            return None
+        return _parse_status(r.text)
+    except Exception:
+        return None
+
+
+def _parse_status(text):
+    m = _SLOTS_NOW.search(text)
+    if m and int(m.group(1)) > 0:
+        return 0.0
+    waits = [int(w) for w in _SLOT_AFTER.findall(text)]
+    return float(min(waits)) if waits else None
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get('Retry-After'))
+    except Exception:
+        return None
+
+
+def _candidates():
+    if not _ENDPOINTS:
+        configure()
+    ready, cooling = _ordered()
+    # if everything is cooling down still try the one that frees up first
+    return ready or cooling[:1]
+
+
+def _acquire(ep):
+    with _LOCK:
+        ep.in_flight += 1
+        ep.requests += 1
+
+
+def _release(ep):
+    with _LOCK:
+        ep.in_flight -= 1
+
+
+def _failed(ep, cooldown=None, rate_limited=False):
+    with _LOCK:
+        # None backs off exponentially; 0.0 (a slot is free now) must not
+        ep.record_failure(cooldown)
+        if rate_limited:
+            ep.rate_limited_at = time.time()
+
+
+def _no_slot(ep, wait):
+    """After a recent 429: True (and cool down) when /api/status says no slot is free yet."""
+    if not wait:
+        # free now, or the status page is unreadable: try the query
+        return False
+    with _LOCK:
+        ep.cooldown_until = time.time() + wait
+    return True
+
+
+def _succeeded(ep, latency):
+    with _LOCK:
+        ep.record_success(latency)
+
+
+def _should_fail_over(status):
+    return status == 429 or status >= 500
+
+
+def _unavailable(last_error):
+    waits = [e.cooldown_until - time.time() for e in _ENDPOINTS if e.cooldown_until > time.time()]
+    return OverpassUnavailable(last_error or 'no Overpass endpoint available',
+                               retry_after=max(1, int(min(waits))) if waits else None)
+
+
+@contextmanager
+def open_query(query, timeout=25):
+    """POST an Overpass QL query to the best endpoint, failing over on 429/5xx.
+
+    Yields a streaming httpx.Response with a 200 status (read it in the
+    calling thread). Raises OverpassUnavailable when no endpoint could serve
+    the query.
+    """
+    last_error = None
+    for ep in _candidates():
+        if ep.rate_limited_recently() and _no_slot(ep, slot_wait(ep)):
+            last_error = f'{ep.url} has no free query slot'
+            continue
+        _acquire(ep)
+        start = time.time()
+        try:
+            req = aio.sync_client().build_request('POST', ep.url, data={'data': query}, timeout=timeout)
+            try:
+                resp = aio.sync_client().send(req, stream=True)
+            except httpx.HTTPError as e:
+                last_error = str(e) or type(e).__name__
+                _failed(ep)
+                continue
+            if _should_fail_over(resp.status_code):
+                last_error = f'{ep.url} returned {resp.status_code}'
+                cooldown = _retry_after(resp)
+                resp.close()
+                if resp.status_code == 429 and cooldown is None:
+                    cooldown = slot_wait(ep)
+                _failed(ep, cooldown, rate_limited=resp.status_code == 429)
+                continue
+            try:
+                resp.raise_for_status()
+            except httpx.HTTPStatusError:
+                resp.close()
+                raise
+            # latency to response headers; body time depends on result size
+            latency = time.time() - start
+            try:
+                yield resp
+            except httpx.HTTPError:
+                # connection dropped or timed out mid-stream
+                _failed(ep)
+                raise
+            else:
+                _succeeded(ep, latency)
+            finally:
+                resp.close()
+            return
+        finally:
+            _release(ep)
+
+    raise _unavailable(last_error)
+
+
+@asynccontextmanager
+async def open_query_async(query, timeout=25):
+    """Async open_query on the shared httpx client; yields a streaming httpx.Response.
+
+    Must run on the shared loop (see aio.run).
+    """
+    last_error = None
+    for ep in _candidates():
+        if ep.rate_limited_recently() and _no_slot(ep, await slot_wait_async(ep)):
+            last_error = f'{ep.url} has no free query slot'
+            continue
+        _acquire(ep)
+        start = time.time()
+        try:
+            req = aio.client().build_request('POST', ep.url, data={'data': query}, timeout=timeout)
+            try:
+                resp = await aio.client().send(req, stream=True)
+            except httpx.HTTPError as e:
+                last_error = str(e) or type(e).__name__
+                _failed(ep)
+                continue
+            if _should_fail_over(resp.status_code):
+                last_error = f'{ep.url} returned {resp.status_code}'
+                cooldown = _retry_after(resp)
+                await resp.aclose()
+                if resp.status_code == 429 and cooldown is None:
+                    cooldown = await slot_wait_async(ep)
+                _failed(ep, cooldown, rate_limited=resp.status_code == 429)
+                continue
+            try:
+                resp.raise_for_status()
+            except httpx.HTTPStatusError:
+                await resp.aclose()
+                raise
+            latency = time.time() - start
+            try:
+                yield resp
+            except httpx.HTTPError:
+                _failed(ep)
+                raise
+            else:
+                _succeeded(ep, latency)
+            finally:
+                await resp.aclose()
+            return
+        finally:
+            _release(ep)
+
+    raise _unavailable(last_error)
+
+
+def stats():
+    with _LOCK:
+        return [e.snapshot() for e in _ENDPOINTS]
@@ -0,0 +1,96 @@
+import json
+try:
+    import orjson           # optional: much faster JSON encoding on large list routes
+except Exception:
+    orjson = None
+
+# Shaping helpers for the list routes (/nearby_disasters, /map_pois):
+# field projection, compact mode, offset pagination and a fast serializer.
+
+# OSM tags the map UI actually reads; compact mode keeps only these
+POI_TAG_WHITELIST = (
+    'name', 'amenity', 'healthcare', 'emergency', 'power',
+    'addr:full', 'addr:street', 'addr:city', 'phone', 'website', 'opening_hours'
+)
+
+MAX_PAGE_SIZE = 500
+
+
+def parse_fields(value):
+    """Accept 'a,b,c' or ['a', 'b'] and return a tuple of field names (or None)."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = tuple(str(f).strip() for f in value if str(f).strip())
+    return fields or None
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def compact_event(ev):
+    """Drop the upstream `raw` payload from a normalized disaster event."""
+    return {k: v for k, v in ev.items() if k != 'raw'}
+
+
+def compact_poi(poi):
+    """Trim a POI's OSM tags to POI_TAG_WHITELIST."""
+    out = dict(poi)
+    tags = poi.get('tags') or {}
+    out['tags'] = {k: tags[k] for k in POI_TAG_WHITELIST if k in tags}
+    return out
+
+
+def project(items, fields):
+    """Keep only `fields` in each dict; no-op when fields is None."""
+    if not fields:
+        return items
+    return [{f: it[f] for f in fields if f in it} for it in items]
+
+
+def paginate(items, offset=0, page_size=None):
+    """Return (page, next_offset); next_offset is None on the last page."""
+    try:
+        offset = max(0, int(offset or 0))
+    except Exception:
+        offset = 0
+    if page_size is None:
+        page = items[offset:]
+        return page, None
+    try:
+        page_size = min(MAX_PAGE_SIZE, max(1, int(page_size)))
+    except Exception:
+        page_size = MAX_PAGE_SIZE
+    page = items[offset:offset + page_size]
+    nxt = offset + page_size
+    return page, (nxt if nxt < len(items) else None)
+
+
+def shape(items, data, compact_fn):
+    """Apply compact / fields / pagination options from a request body.
+
+    Returns (items, next_offset).
+    """
+    if parse_bool(data.get('compact')):
+        items = [compact_fn(it) for it in items]
+    items = project(items, parse_fields(data.get('fields')))
+    return paginate(items, data.get('offset'), data.get('page_size'))
+
+
+def dumps(payload):
+    """Serialize to JSON bytes, preferring orjson when installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    from flask import Response
+    return Response(dumps(payload), status=status, mimetype='application/json')
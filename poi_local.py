@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import math
+from threading import Lock
+
+import numpy as np
+
+import _packfile
+try:
+    import osmium           # optional: only needed to build from .osm.pbf extracts
+except Exception:
+    osmium = None
+
+# Offline POI engine: a regional OSM extract packed into a static R-tree.
+#
+# The index is a single binary file (format in _packfile) holding flat numpy
+# arrays: point coordinates, OSM ids, a tags blob and, per kind, an STR
+# (sort-tile-recursive) packed R-tree whose node boxes are stored level by
+# level. It is opened with np.memmap, so loading is instant and all worker
+# processes share the pages through the OS page cache.
+#
+# Build one with:
+#     python poi_local.py build region.geojson|region.osm.pbf [--out path]
+INDEX_PATH = os.environ.get(
+    'POI_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pois.idx')
+)
+
+# kinds supported offline (canonical names from overpass._KINDS)
+LOCAL_KINDS = ('hospital', 'pharmacy', 'school', 'fuel', 'police', 'fire_station', 'power')
+_AMENITY_KIND = {
+    'hospital': 'hospital', 'pharmacy': 'pharmacy',
+    'school': 'school', 'college': 'school', 'university': 'school',
+    'fuel': 'fuel', 'police': 'police', 'fire_station': 'fire_station',
+}
+_OSM_TYPES = ('node', 'way', 'relation')
+
+MAGIC = b'POIIDX01'
+FANOUT = 16
+LEAF_SIZE = 32
+
+_INDEX = None
+_INDEX_LOCK = Lock()
+
+
+def classify(tags):
+    """Return the LOCAL_KINDS entry for a tag dict, or None."""
+    kind = _AMENITY_KIND.get(tags.get('amenity'))
+    if kind:
+        return kind
+    if tags.get('power'):
+        return 'power'
+    return None
+
+
+# -------------------------
+# BUILD
+# -------------------------
+def _centroid(coords):
+    pts = coords
+    # unwrap Polygon / MultiPolygon rings down to a list of [lon, lat]
+    while pts and isinstance(pts[0], list) and pts[0] and isinstance(pts[0][0], list):
+        pts = pts[0]
+    if not pts:
+        return None
+    lon = sum(p[0] for p in pts) / len(pts)
+    lat = sum(p[1] for p in pts) / len(pts)
+    return lat, lon
+
+
+def _iter_geojson(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for feat in data.get('features', []):
+        geom = feat.get('geometry') or {}
+        props = feat.get('properties') or {}
+        tags = props.get('tags') if isinstance(props.get('tags'), dict) else props
+        if geom.get('type') == 'Point':
+            lon, lat = geom['coordinates'][:2]
+        else:
+            c = _centroid(geom.get('coordinates') or [])
+            if not c:
+                continue
+            lat, lon = c
+        ref = str(feat.get('id') or props.get('@id') or props.get('osm_id') or '')
+        osm_type, _, osm_id = ref.rpartition('/')
+        try:
+            osm_id = int(osm_id)
+        except Exception:
+            osm_id = 0
+        yield osm_type or 'node', osm_id, float(lat), float(lon), {k: v for k, v in tags.items() if not k.startswith('@')}
+
+
+def _iter_pbf(path):
+    if osmium is None:
+        raise RuntimeError('pyosmium is required to read .pbf extracts; install osmium or convert to GeoJSON')
+    out = []
+
+    class _Handler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = dict(n.tags)
+            if classify(tags):
+                out.append(('node', n.id, n.location.lat, n.location.lon, tags))
+
+        def way(self, w):
+            tags = dict(w.tags)
+            if not classify(tags):
+                return
+            pts = [(nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()]
+            if pts:
+                out.append(('way', w.id, sum(p[0] for p in pts) / len(pts), sum(p[1] for p in pts) / len(pts), tags))
+
+    _Handler().apply_file(path, locations=True)
+    return out
+
+
+def _str_order(lat, lon, idx):
+    """Sort-tile-recursive ordering of point indices `idx`."""
+    n = len(idx)
+    leaves = max(1, math.ceil(n / LEAF_SIZE))
+    slices = max(1, math.ceil(math.sqrt(leaves)))
+    per_slice = slices * LEAF_SIZE
+    idx = idx[np.argsort(lon[idx], kind='stable')]
+    parts = []
+    for start in range(0, n, per_slice):
+        s = idx[start:start + per_slice]
+        parts.append(s[np.argsort(lat[s], kind='stable')])
+    return np.concatenate(parts) if parts else idx
+
+
+def _pack_levels(lat, lon):
+    """Build node boxes bottom-up for STR-ordered points.
+
+    Returns a list of (n, 4) float32 arrays [min_lat, min_lon, max_lat, max_lon],
+    leaves first; leaf i covers points [i * LEAF_SIZE, (i + 1) * LEAF_SIZE) and
+    inner node j of a level covers children [j * FANOUT, (j + 1) * FANOUT).
+    """
+    def group(boxes, size):
+        n = len(boxes)
+        m = math.ceil(n / size)
+        pad = m * size - n
+        lo = np.vstack([boxes[:, :2], np.full((pad, 2), np.inf, dtype=boxes.dtype)]).reshape(m, size, 2)
+        hi = np.vstack([boxes[:, 2:], np.full((pad, 2), -np.inf, dtype=boxes.dtype)]).reshape(m, size, 2)
+        return np.hstack([lo.min(axis=1), hi.max(axis=1)]).astype(np.float32)
+
+    pts = np.stack([lat, lon, lat, lon], axis=1).astype(np.float32)
+    levels = [group(pts, LEAF_SIZE)]
+    while len(levels[-1]) > 1:
+        levels.append(group(levels[-1], FANOUT))
+    return levels
+
+
+def build_index(source, out_path=INDEX_PATH):
+    """Build the POI index file from a GeoJSON or .osm.pbf extract."""
+    rows = _iter_pbf(source) if source.endswith('.pbf') else _iter_geojson(source)
+    recs = []
+    for osm_type, osm_id, lat, lon, tags in rows:
+        kind = classify(tags)
+        if kind:
+            recs.append((LOCAL_KINDS.index(kind), osm_type, osm_id, lat, lon, tags))
+
+    kinds = np.array([r[0] for r in recs], dtype=np.uint8)
+    lat = np.array([r[3] for r in recs], dtype=np.float64)
+    lon = np.array([r[4] for r in recs], dtype=np.float64)
+
+    order = []
+    header = {'kinds': {}, 'count': len(recs)}
+    boxes = []
+    box_count = 0
+    for k, name in enumerate(LOCAL_KINDS):
+        idx = _str_order(lat, lon, np.nonzero(kinds == k)[0])
+        start = len(order)
+        order.extend(idx.tolist())
+        levels = _pack_levels(lat[idx], lon[idx]) if len(idx) else []
+        offsets = []
+        for lv in levels:
+            offsets.append([box_count, len(lv)])
+            boxes.append(lv)
+            box_count += len(lv)
+        header['kinds'][name] = {'start': start, 'end': len(order), 'levels': offsets}
+
+    order = np.array(order, dtype=np.int64)
+    tags_blob = bytearray()
+    tags_off = np.zeros(len(order) + 1, dtype=np.uint64)
+    for i, src in enumerate(order):
+        tags_blob += json.dumps(recs[src][5], separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        tags_off[i + 1] = len(tags_blob)
+
+    arrays = {
+        'lat': lat[order].astype(np.float32) if len(order) else np.zeros(0, np.float32),
+        'lon': lon[order].astype(np.float32) if len(order) else np.zeros(0, np.float32),
+        'osm_id': np.array([recs[i][2] for i in order], dtype=np.int64),
+        'osm_type': np.array([_OSM_TYPES.index(recs[i][1]) if recs[i][1] in _OSM_TYPES else 0 for i in order], dtype=np.uint8),
+        'boxes': np.vstack(boxes).astype(np.float32) if boxes else np.zeros((0, 4), np.float32),
+        'tags_off': tags_off,
+        'tags': np.frombuffer(bytes(tags_blob), dtype=np.uint8),
+    }
+    _packfile.write(out_path, MAGIC, header, arrays)
+    return header
+
+
+# -------------------------
+# QUERY
+# -------------------------
+class PoiIndex:
+    """Read-only, memory-mapped view of an index file."""
+
+    def __init__(self, path):
+        hlen, self.header = _packfile.read_header(path, MAGIC, 'POI index file')
+        self.arrays = _packfile.open_arrays(path, MAGIC, hlen, self.header)
+
+    def _candidates(self, kind, lat, lon, radius_km):
+        info = self.header['kinds'].get(kind)
+        if not info or not info['levels']:
+            return np.zeros(0, dtype=np.int64)
+        dlat = radius_km / 111.32
+        dlon = radius_km / max(1e-6, 111.32 * math.cos(math.radians(lat)))
+        q = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        boxes = self.arrays['boxes']
+        levels = info['levels']
+        # walk from the root level down to the leaves, vectorized per level
+        nodes = np.arange(levels[-1][1])
+        for depth in range(len(levels) - 1, -1, -1):
+            off, count = levels[depth]
+            nodes = nodes[nodes < count]
+            b = boxes[off + nodes]
+            hit = (b[:, 0] <= q[2]) & (b[:, 2] >= q[0]) & (b[:, 1] <= q[3]) & (b[:, 3] >= q[1])
+            nodes = nodes[hit]
+            if depth:
+                nodes = (nodes[:, None] * FANOUT + np.arange(FANOUT)).ravel()
+        pts = (nodes[:, None] * LEAF_SIZE + np.arange(LEAF_SIZE)).ravel()
+        pts = pts[pts < info['end'] - info['start']]
+        return pts + info['start']
+
+    def search(self, lat, lon, radius_m, kind, limit):
+        radius_km = radius_m / 1000.0
+        idx = self._candidates(kind, lat, lon, radius_km)
+        if not len(idx):
+            return []
+        plat = np.radians(self.arrays['lat'][idx].astype(np.float64))
+        plon = np.radians(self.arrays['lon'][idx].astype(np.float64))
+        phi = math.radians(lat)
+        x = np.sin((plat - phi) / 2.0) ** 2 + math.cos(phi) * np.cos(plat) * np.sin((plon - math.radians(lon)) / 2.0) ** 2
+        dist = 2 * 6371.0 * np.arcsin(np.minimum(1, np.sqrt(x)))
+        keep = dist <= radius_km
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')[:limit]
+        tags_off = self.arrays['tags_off']
+        blob = self.arrays['tags']
+        out = []
+        for j in order:
+            i = int(idx[j])
+            tags = json.loads(bytes(blob[int(tags_off[i]):int(tags_off[i + 1])]).decode('utf-8'))
+            out.append({
+                'id': int(self.arrays['osm_id'][i]),
+                'osm_type': _OSM_TYPES[int(self.arrays['osm_type'][i])],
+                'lat': float(self.arrays['lat'][i]),
+                'lon': float(self.arrays['lon'][i]),
+                'name': tags.get('name') or tags.get('official_name') or tags.get('ref') or '',
+                'tags': tags,
+                'distance_km': round(float(dist[j]), 3)
+            })
+        return out
+
+
+def get_index():
+    """Return the process-wide index, or None when no index file exists."""
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None and os.path.exists(INDEX_PATH):
+                _INDEX = PoiIndex(INDEX_PATH)
+    return _INDEX
+
+
+def search_pois(lat, lon, radius_m=20000, kind='hospital', limit=100):
+    """Search the local index. Returns None if the kind or index is unavailable."""
+    import overpass
+    kind = overpass._canonical_kind(kind)
+    idx = get_index()
+    if idx is None or kind not in LOCAL_KINDS:
+        return None
+    return idx.search(float(lat), float(lon), int(radius_m), kind, int(limit))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'build':
+        print('usage: python poi_local.py build <extract.geojson|extract.osm.pbf> [--out path]')
+        sys.exit(1)
+    out = sys.argv[sys.argv.index('--out') + 1] if '--out' in sys.argv else INDEX_PATH
+    info = build_index(sys.argv[2], out)
+    print(f"Indexed {info['count']} POIs into {out}")
+    for name, k in info['kinds'].items():
+        print(f"  {name}: {k['end'] - k['start']}")
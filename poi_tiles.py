@@ -0,0 +1,251 @@
+import os
+import math
+import asyncio
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import overpass
+import overpass_pool
+import metrics
+
+# Tile-based POI cache in front of Overpass.
+#
+# A search circle is covered by fixed slippy-map tiles (z/x/y) and POIs are
+# cached per (kind, tile). Only tiles missing from the cache are downloaded,
+# batched (across kinds too) into one Overpass union query of bbox
+# selectors; the response is split back by tag and element position. Overlapping map views therefore
+# reuse each other's tiles, and the final distance filter / sort / limit is
+# done locally.
+TILE_ZOOM = int(os.environ.get('POI_TILE_ZOOM', '12'))
+TILE_TTL = int(os.environ.get('POI_TILE_TTL', str(24 * 3600)))
+CACHE_SIZE = int(os.environ.get('POI_TILE_CACHE_SIZE', '4096'))
+MAX_TILES_PER_SEARCH = 256
+MAX_TILES_PER_QUERY = 32
+# Batches of one search fetched at once by the async path.
+FETCH_CONCURRENCY = int(os.environ.get('POI_TILE_FETCH_CONCURRENCY', '2'))
+# Server-side cap on elements per tiles query; a batch that hits it is
+# incomplete, so it is used for the current answer but not cached.
+MAX_TILE_RESULTS = int(os.environ.get('POI_TILE_MAX_RESULTS', '10000'))
+
+_TILES = OrderedDict()
+_LOCK = Lock()
+
+
+def lonlat_to_tile(lat, lon, z):
+    n = 2 ** z
+    lat = max(-85.05112878, min(85.05112878, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return (min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+def tile_bbox(x, y, z):
+    """Return (south, west, north, east) of a tile."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return (south, west, north, east)
+
+
+def _tile_touches_circle(bbox, lat, lon, radius_km):
+    south, west, north, east = bbox
+    # nearest point of the tile to the centre
+    near_lat = min(max(lat, south), north)
+    near_lon = min(max(lon, west), east)
+    return overpass._haversine_km(lat, lon, near_lat, near_lon) <= radius_km
+
+
+def covering_tiles(lat, lon, radius_m, z=None):
+    """Return (z, [(x, y), ...]) for the tiles intersecting the search circle.
+
+    Starts at TILE_ZOOM and zooms out while the circle would need more than
+    MAX_TILES_PER_SEARCH tiles.
+    """
+    z = TILE_ZOOM if z is None else z
+    radius_km = radius_m / 1000.0
+    dlat = radius_km / 111.32
+    dlon = radius_km / max(1e-6, 111.32 * math.cos(math.radians(lat)))
+    while True:
+        x0, y0 = lonlat_to_tile(lat + dlat, lon - dlon, z)
+        x1, y1 = lonlat_to_tile(lat - dlat, lon + dlon, z)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_TILES_PER_SEARCH or z <= 1:
+            break
+        z -= 1
+    tiles = []
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            if _tile_touches_circle(tile_bbox(x, y, z), lat, lon, radius_km):
+                tiles.append((x, y))
+    return z, tiles
+
+
+def _cache_get(key, now):
+    with _LOCK:
+        rec = _TILES.get(key)
+        if rec and rec[0] <= now:
+            del _TILES[key]
+            rec = None
+        if rec:
+            _TILES.move_to_end(key)
+    metrics.cache_lookup('poi_tiles', rec is not None)
+    return rec[1] if rec else None
+
+
+def _cache_put(key, pois, expires):
+    with _LOCK:
+        _TILES[key] = (expires, pois)
+        _TILES.move_to_end(key)
+        while len(_TILES) > CACHE_SIZE:
+            _TILES.popitem(last=False)
+        n = len(_TILES)
+    metrics.cache_size('poi_tiles', n)
+
+
+def _build_tiles_query(z, pairs):
+    parts = []
+    for kind, (x, y) in pairs:
+        south, west, north, east = tile_bbox(x, y, z)
+        bbox = f'({south:.7f},{west:.7f},{north:.7f},{east:.7f});'
+        parts.extend(sel + bbox for sel in overpass._kind_selectors(kind))
+    # `out center` gives ways a position so they can be assigned to a tile
+    return f'[out:json][timeout:25];({"".join(parts)});out center {MAX_TILE_RESULTS};'
+
+
+class _TileSplitter:
+    """Splits a tiles-query response back into {(kind, (x, y)): [poi, ...]}.
+
+    Elements are assigned by tag (overpass._matches_kind) and by position.
+    """
+
+    def __init__(self, z, pairs):
+        self.z = z
+        self.by_key = {p: [] for p in pairs}
+        self.kinds = sorted({k for k, _ in pairs})
+        self.seen = set()
+        self.count = 0
+
+    @property
+    def complete(self):
+        return self.count < MAX_TILE_RESULTS
+
+    def feed(self, el):
+        self.count += 1
+        poi = overpass._element_to_poi(el)
+        if not poi:
+            return
+        ident = (poi['osm_type'], poi['id'])
+        if ident in self.seen:
+            return
+        self.seen.add(ident)
+        t = lonlat_to_tile(poi['lat'], poi['lon'], self.z)
+        for kind in self.kinds:
+            # ways can intersect a tile while their centre lies outside the batch
+            key = (kind, t)
+            if key in self.by_key and overpass._matches_kind(el, kind):
+                self.by_key[key].append(poi)
+
+
+def _fetch_tiles(z, pairs):
+    """Download (kind, tile) pairs in one union query.
+
+    Returns ({(kind, (x, y)): [poi, ...]}, complete).
+    """
+    splitter = _TileSplitter(z, pairs)
+    with overpass_pool.open_query(_build_tiles_query(z, pairs), timeout=25) as resp:
+        for el in overpass._iter_elements(resp):
+            splitter.feed(el)
+    return splitter.by_key, splitter.complete
+
+
+async def _fetch_tiles_async(z, pairs):
+    splitter = _TileSplitter(z, pairs)
+    async with overpass_pool.open_query_async(_build_tiles_query(z, pairs), timeout=25) as resp:
+        async for el in overpass._aiter_elements(resp):
+            splitter.feed(el)
+    return splitter.by_key, splitter.complete
+
+
+def search_pois(lat, lon, radius_m=20000, kind='amenity', limit=100):
+    """Return POIs of `kind` within radius_m of (lat, lon), nearest first."""
+    return search_pois_multi(lat, lon, radius_m=radius_m, kinds=[kind], limit=limit)[kind]
+
+
+def _lookup_tiles(lat, lon, radius_m, kinds, now):
+    """Return (z, tiles, canonical kinds, cached {(kind, tile): pois}, missing batches)."""
+    z, tiles = covering_tiles(lat, lon, radius_m)
+    canonical = {k: overpass._canonical_kind(k) for k in kinds}
+    found = {}
+    missing = []
+    for ck in sorted(set(canonical.values())):
+        for t in tiles:
+            pois = _cache_get((ck, z) + t, now)
+            if pois is None:
+                missing.append((ck, t))
+            else:
+                found[(ck, t)] = pois
+    batches = [missing[i:i + MAX_TILES_PER_QUERY] for i in range(0, len(missing), MAX_TILES_PER_QUERY)]
+    return z, tiles, canonical, found, batches
+
+
+def _store_tiles(z, fetched, complete, found, now):
+    for (ck, t), pois in fetched.items():
+        if complete:
+            _cache_put((ck, z) + t, pois, now + TILE_TTL)
+        found[(ck, t)] = pois
+
+
+def _assemble(lat, lon, radius_m, tiles, canonical, found, limit):
+    radius_km = radius_m / 1000.0
+    out = {}
+    for kind, ck in canonical.items():
+        res = []
+        for t in tiles:
+            for p in found[(ck, t)]:
+                # copy: distance depends on the query point, tiles are shared
+                p = dict(p)
+                p['distance_km'] = round(overpass._haversine_km(lat, lon, p['lat'], p['lon']), 3)
+                if p['distance_km'] <= radius_km:
+                    res.append(p)
+        res.sort(key=lambda x: x['distance_km'])
+        out[kind] = res[:limit]
+    return out
+
+
+def search_pois_multi(lat, lon, radius_m=20000, kinds=('amenity',), limit=100):
+    """Return {kind: [poi, ...]}; tiles missing for any kind share one query."""
+    lat, lon, radius_m = float(lat), float(lon), int(radius_m)
+    now = time.time()
+    z, tiles, canonical, found, batches = _lookup_tiles(lat, lon, radius_m, kinds, now)
+    for batch in batches:
+        _store_tiles(z, *_fetch_tiles(z, batch), found, now)
+    return _assemble(lat, lon, radius_m, tiles, canonical, found, limit)
+
+
+async def search_pois_multi_async(lat, lon, radius_m=20000, kinds=('amenity',), limit=100):
+    """Async search_pois_multi; up to FETCH_CONCURRENCY batches are in flight.
+
+    Each batch is cached as soon as it arrives, so a failing batch does not
+    discard the others; the first failure is raised once all have settled.
+    """
+    lat, lon, radius_m = float(lat), float(lon), int(radius_m)
+    now = time.time()
+    z, tiles, canonical, found, batches = _lookup_tiles(lat, lon, radius_m, kinds, now)
+    slots = asyncio.Semaphore(max(1, FETCH_CONCURRENCY))
+
+    async def fetch(batch):
+        async with slots:
+            fetched, complete = await _fetch_tiles_async(z, batch)
+        _store_tiles(z, fetched, complete, found, now)
+
+    for res in await asyncio.gather(*(fetch(b) for b in batches), return_exceptions=True):
+        if isinstance(res, BaseException):
+            raise res
+    return _assemble(lat, lon, radius_m, tiles, canonical, found, limit)
+
+
+def stats():
+    with _LOCK:
+        return {'tiles': len(_TILES), 'max_tiles': CACHE_SIZE}
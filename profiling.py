@@ -0,0 +1,213 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import itertools
+from collections import Counter
+from threading import Lock
+
+import aio
+
+# Opt-in sampling profiler for individual requests.
+#
+# A sampled request registers its thread with a background sampler that
+# reads sys._current_frames() every PROFILE_INTERVAL_MS and counts stacks.
+# Upstream coroutines execute on the shared aio loop thread, so that thread
+# is sampled too (under an "aio-loop" root frame; it may include other
+# requests' work). When the request finishes its stacks are written to
+# PROFILE_DIR/<route>/ as a collapsed-stack file (flamegraph.pl, speedscope)
+# and a speedscope JSON file.
+#
+# Requests are picked at PROFILE_SAMPLE_RATE (0..1), or individually with an
+# `X-Profile: <ADMIN_TOKEN>` header. The rate can be changed at runtime via
+# POST /admin/profiling; the state is kept in a file in PROFILE_DIR so every
+# gunicorn worker picks it up. When disabled the per-request cost is one
+# clock read and a header lookup. Under gevent all greenlets share the
+# worker's OS thread, so samples there also include other requests.
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000.0
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+HEADER = 'X-Profile'
+STATE_REFRESH = 2.0
+MAX_DEPTH = 128
+
+_STATE = {'rate': float(os.environ.get('PROFILE_SAMPLE_RATE', '0') or 0)}
+_STATE_PATH = os.path.join(PROFILE_DIR, '_state.json')
+_next_refresh = 0.0
+_ACTIVE = {}
+_LOCK = Lock()
+_SAMPLER_RUNNING = False
+_SEQ = itertools.count()
+
+
+class _Profile:
+    def __init__(self, route, thread_id, loop_thread_id):
+        self.route = route
+        self.thread_id = thread_id
+        self.loop_thread_id = loop_thread_id
+        self.start = time.time()
+        self.stacks = Counter()
+
+
+def _refresh_state():
+    global _next_refresh
+    _next_refresh = time.monotonic() + STATE_REFRESH
+    try:
+        with open(_STATE_PATH, 'r', encoding='utf-8') as f:
+            _STATE['rate'] = float(json.load(f).get('rate', 0))
+    except (OSError, ValueError):
+        pass
+
+
+def state():
+    _refresh_state()
+    return {'rate': _STATE['rate'], 'active': len(_ACTIVE), 'dir': PROFILE_DIR,
+            'interval_ms': INTERVAL * 1000}
+
+
+def set_rate(rate):
+    """Set the sampling rate for every worker (0 disables)."""
+    rate = min(1.0, max(0.0, float(rate)))
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp = f'{_STATE_PATH}.{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'rate': rate}, f)
+    os.replace(tmp, _STATE_PATH)
+    _STATE['rate'] = rate
+
+
+def authorized(token):
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+def should_profile(headers):
+    if time.monotonic() >= _next_refresh:
+        _refresh_state()
+    rate = _STATE['rate']
+    if rate > 0 and random.random() < rate:
+        return True
+    token = headers.get(HEADER)
+    return token is not None and authorized(token)
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _stack(frame):
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def _sample_loop():
+    global _SAMPLER_RUNNING
+    sleep = aio.original_sleep()
+    me = aio.native_ident()
+    while True:
+        with _LOCK:
+            profiles = list(_ACTIVE.values())
+            if not profiles:
+                _SAMPLER_RUNNING = False
+                return
+        frames = sys._current_frames()
+        for p in profiles:
+            f = frames.get(p.thread_id)
+            if f is not None and p.thread_id != me:
+                p.stacks[_stack(f)] += 1
+            if p.loop_thread_id is not None:
+                f = frames.get(p.loop_thread_id)
+                if f is not None:
+                    p.stacks[('aio-loop',) + _stack(f)] += 1
+        del frames
+        sleep(INTERVAL)
+
+
+def start(route):
+    """Begin sampling the calling request; returns a handle for stop()."""
+    global _SAMPLER_RUNNING
+    p = _Profile(route, aio.native_ident(), aio.loop_thread_id())
+    with _LOCK:
+        _ACTIVE[id(p)] = p
+        launch = not _SAMPLER_RUNNING
+        _SAMPLER_RUNNING = True
+    if launch:
+        aio.start_native_thread(_sample_loop)
+    return p
+
+
+def stop(p, status=None):
+    """Stop sampling and write the profile files; returns the collapsed file path."""
+    with _LOCK:
+        _ACTIVE.pop(id(p), None)
+    duration = time.time() - p.start
+    if not p.stacks:
+        return None
+    route_dir = os.path.join(PROFILE_DIR, re.sub(r'[^A-Za-z0-9_.-]+', '_', p.route).strip('_') or 'root')
+    os.makedirs(route_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(p.start))
+    base = os.path.join(route_dir, f'{stamp}-{os.getpid()}-{next(_SEQ)}')
+    with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+        for stack, n in p.stacks.most_common():
+            f.write(';'.join(stack) + f' {n}\n')
+    with open(base + '.speedscope.json', 'w', encoding='utf-8') as f:
+        json.dump(_speedscope(p, duration, status), f)
+    return base + '.collapsed'
+
+
+def _speedscope(p, duration, status):
+    index = {}
+    frames = []
+    samples = []
+    weights = []
+    for stack, n in p.stacks.items():
+        ids = []
+        for name in stack:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            ids.append(index[name])
+        samples.append(ids)
+        weights.append(n * INTERVAL)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f'{p.route} ({status}, {duration * 1000:.0f} ms)',
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': p.route,
+        'exporter': 'disaster-chatbot profiling.py',
+    }
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _maybe_start():
+        if should_profile(request.headers):
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            g._profile = start(route)
+
+    @app.teardown_request
+    def _maybe_stop(exc):
+        p = g.pop('_profile', None)
+        if p is not None:
+            try:
+                stop(p, status='error' if exc else 'ok')
+            except OSError as e:
+                print('Warning: could not write profile:', e)
@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import secrets
+from collections import OrderedDict
+from threading import Lock
+
+import metrics
+
+# Per-session conversation context, so follow-up requests from the same
+# browser reuse what the session already has instead of fanning out to the
+# upstreams again:
+#
+#   location      last detected or browser-supplied location (/detect_location,
+#                 /bootstrap); also used by an IP-only /bootstrap
+#   last_intent   tag of the last chat answer, and `context` from its
+#                 intents.json `context_set`. Intents with a `context_filter`
+#                 only match while the session is in one of those contexts.
+#   updates       latest updates per intent tag, shared by /handle_message and
+#                 /latest_updates, fresh for SESSION_RESULT_TTL
+#   results       last body of /nearby_disasters and /map_pois; the identical
+#                 request (same admission.stale_key) within SESSION_RESULT_TTL
+#                 is answered from it with `X-Session-Cache: hit`
+#
+# A session is keyed by the `sid` cookie (set on the first request) or an
+# X-Session-Id header from non-browser clients, and expires SESSION_TTL
+# seconds after its last write. Records are compact JSON; result bodies over
+# SESSION_RESULT_BYTES are not kept. Sessions live in a per-worker LRU of at
+# most SESSION_MAX entries, or in Redis (SESSION_REDIS_URL, else REDIS_URL)
+# so every worker sees the same session. The store belongs to the application
+# (app.extensions['session_store']).
+ENABLED = os.environ.get('SESSION_ENABLED', '1') not in ('0', 'false', 'no')
+TTL = int(os.environ.get('SESSION_TTL', '1800'))
+RESULT_TTL = int(os.environ.get('SESSION_RESULT_TTL', '120'))
+MAX_SESSIONS = int(os.environ.get('SESSION_MAX', '2000'))
+RESULT_BYTES = int(os.environ.get('SESSION_RESULT_BYTES', '32768'))
+COOKIE = os.environ.get('SESSION_COOKIE', 'sid')
+HEADER = 'X-Session-Id'
+MAX_TAGS = 8
+ROUTES = ('/handle_message', '/latest_updates', '/detect_location', '/nearby_disasters', '/map_pois',
+          '/bootstrap')
+RESULT_ROUTES = ('/nearby_disasters', '/map_pois')
+
+_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class MemoryStore:
+    """LRU of encoded sessions with a sliding TTL, per worker process."""
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size or MAX_SESSIONS
+        self.ttl = ttl or TTL
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, sid):
+        now = time.time()
+        with self._lock:
+            rec = self._data.get(sid)
+            if rec is None:
+                return None
+            if rec[0] <= now:
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return rec[1]
+
+    def put(self, sid, raw):
+        with self._lock:
+            self._data[sid] = (time.time() + self.ttl, raw)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+            n = len(self._data)
+        metrics.cache_size('session', n)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class RedisStore:
+    """Sessions shared by every worker, expired by Redis."""
+
+    def __init__(self, client, ttl=None):
+        self.client = client
+        self.ttl = ttl or TTL
+
+    def get(self, sid):
+        return self.client.get('session:' + sid)
+
+    def put(self, sid, raw):
+        self.client.setex('session:' + sid, self.ttl, raw)
+
+    def delete(self, sid):
+        self.client.delete('session:' + sid)
+
+
+def _make_store():
+    url = os.environ.get('SESSION_REDIS_URL') or os.environ.get('REDIS_URL')
+    if url:
+        try:
+            import redis
+            return RedisStore(redis.Redis.from_url(url))
+        except Exception as e:
+            print('Warning: session Redis unavailable, keeping sessions in memory:', e)
+    return MemoryStore()
+
+
+def _store():
+    from flask import current_app
+    return current_app.extensions['session_store']
+
+
+def new_id():
+    return secrets.token_urlsafe(18)
+
+
+def valid_id(sid):
+    return bool(sid) and bool(_ID.match(sid))
+
+
+def load(sid):
+    """The session dict for `sid`, or {} when it is unknown, expired or unreadable."""
+    try:
+        raw = _store().get(sid)
+    except Exception as e:
+        print('Warning: session read failed:', e)
+        raw = None
+    metrics.cache_lookup('session', raw is not None)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {}
+
+
+def save(sid, data):
+    try:
+        _store().put(sid, json.dumps(data, separators=(',', ':')))
+    except Exception as e:
+        print('Warning: session write failed:', e)
+
+
+def _active():
+    from flask import g, has_request_context
+    return g.get('_session') if has_request_context() else None
+
+
+def _changed():
+    from flask import g
+    g._session_dirty = True
+
+
+def current():
+    """This request's session dict ({} outside a session route)."""
+    sess = _active()
+    return {} if sess is None else sess
+
+
+def _fresh(rec):
+    return rec is not None and time.time() - rec.get('at', 0) < RESULT_TTL
+
+
+def location():
+    """The session's last location, or None."""
+    rec = current().get('location')
+    metrics.cache_lookup('session_location', rec is not None)
+    return rec['value'] if rec else None
+
+
+def set_location(loc):
+    sess = _active()
+    if sess is None or not loc or sess.get('location', {}).get('value') == loc:
+        return
+    sess['location'] = {'at': int(time.time()), 'value': loc}
+    _changed()
+
+
+def recall_updates(tag):
+    """Updates fetched for `tag` within SESSION_RESULT_TTL, or None."""
+    rec = current().get('updates', {}).get(tag)
+    hit = _fresh(rec)
+    metrics.cache_lookup('session_updates', hit)
+    return rec['items'] if hit else None
+
+
+def remember_updates(tag, items):
+    sess = _active()
+    if sess is None or items is None:
+        return
+    by_tag = sess.setdefault('updates', {})
+    by_tag.pop(tag, None)
+    by_tag[tag] = {'at': int(time.time()), 'items': list(items)}
+    # dicts keep insertion order: drop the least recently fetched tags
+    for old in list(by_tag)[:-MAX_TAGS]:
+        del by_tag[old]
+    _changed()
+
+
+def updates_for(tag, fetch):
+    """fetch(tag), unless this session fetched `tag` recently."""
+    items = recall_updates(tag)
+    if items is None:
+        items = fetch(tag)
+        remember_updates(tag, items)
+    return items
+
+
+def _contexts(value):
+    if not value:
+        return ()
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+def _intent(intents_json, tag):
+    for i in intents_json.get('intents', []):
+        if i.get('tag') == tag:
+            return i
+    return {}
+
+
+def filter_by_context(intents_list, intents_json):
+    """Drop intents whose `context_filter` does not include the session's context."""
+    context = current().get('context')
+    out = []
+    for item in intents_list:
+        allowed = _contexts(_intent(intents_json, item['intent']).get('context_filter'))
+        if not allowed or context in allowed:
+            out.append(item)
+    return out
+
+
+def note_intent(intents_list, intents_json):
+    """Record the answered intent and enter its `context_set`, leaving any previous context."""
+    sess = _active()
+    if sess is None or not intents_list:
+        return
+    tag = intents_list[0]['intent']
+    sess['last_intent'] = tag
+    sess['context'] = (_contexts(_intent(intents_json, tag).get('context_set')) or (None,))[0]
+    _changed()
+
+
+def init_app(app, store=None):
+    from flask import Response, g, request
+    import admission
+
+    app.extensions['session_store'] = store or _make_store()
+
+    def _rule():
+        return request.url_rule.rule if request.url_rule else None
+
+    def _result_key():
+        rule = _rule()
+        if rule not in RESULT_ROUTES:
+            return None
+        return admission.stale_key(rule, request.get_json(silent=True))
+
+    @app.before_request
+    def _open():
+        if not ENABLED or _rule() not in ROUTES:
+            return None
+        sid = request.headers.get(HEADER) or request.cookies.get(COOKIE)
+        if valid_id(sid):
+            g._session_id, g._session = sid, load(sid)
+        else:
+            g._session_id, g._session = new_id(), {}
+            g._session_new = True
+        g._session_dirty = False
+
+        key = _result_key()
+        rec = g._session.get('results', {}).get(_rule()) if key else None
+        hit = _fresh(rec) and rec.get('key') == key
+        if key:
+            metrics.cache_lookup('session_result', hit)
+        if not hit:
+            return None
+        resp = Response(rec['body'], content_type=rec['content_type'])
+        resp.headers['X-Session-Cache'] = 'hit'
+        resp.headers['Age'] = str(int(time.time() - rec['at']))
+        return resp
+
+    @app.after_request
+    def _close(response):
+        if '_session' not in g:
+            return response
+        key = _result_key()
+        if (key and response.status_code == 200 and not response.is_streamed
+                and 'X-Session-Cache' not in response.headers):
+            body = response.get_data()
+            if len(body) <= RESULT_BYTES:
+                g._session.setdefault('results', {})[_rule()] = {
+                    'key': key, 'at': int(time.time()), 'body': body.decode('utf-8'),
+                    'content_type': response.content_type}
+                g._session_dirty = True
+        if g._session_dirty:
+            save(g._session_id, g._session)
+        if g.get('_session_new'):
+            # browsers keep the cookie; header clients read the new id back
+            response.set_cookie(COOKIE, g._session_id, httponly=True, samesite='Lax')
+            response.headers[HEADER] = g._session_id
+        return response
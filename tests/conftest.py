@@ -0,0 +1,33 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# no background model watcher or cache snapshot writer in tests
+os.environ.setdefault('MODEL_WATCH_SECONDS', '0')
+os.environ.setdefault('CACHE_SNAPSHOT_PATH', '')
+os.environ.setdefault('CACHE_SNAPSHOT_SECONDS', '0')
+
+
+import pytest
+
+
+@pytest.fixture
+def app():
+    import app as app_module
+    return app_module.create_app({'TESTING': True})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def events(tmp_path, monkeypatch):
+    """event_store on a fresh database file."""
+    import event_store
+    monkeypatch.setattr(event_store, 'STORE_PATH', str(tmp_path / 'events.db'))
+    monkeypatch.setattr(event_store, '_CONN', None)
+    return event_store
@@ -0,0 +1,81 @@
+import time
+import threading
+
+import pytest
+
+import admission
+import bootstrap
+
+
+@pytest.fixture
+def geo_app():
+    import app as app_module
+    return app_module.create_app({'TESTING': True, 'ADMISSION_LIMITS': 'geo=1/0/0.2'})
+
+
+def _geo(app):
+    return app.extensions['admission'].limiters['geo']
+
+
+def test_parse_limits():
+    assert admission.parse_limits('chat=4/8/2.5, geo=2') == {'chat': (4, 8, 2.5), 'geo': (2, 0, 1.0)}
+
+
+def test_limiter_sheds_when_queue_is_full_and_after_budget():
+    lim = admission.Limiter('t', limit=1, queue=1, budget=0.1)
+    assert lim.acquire()[0]
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(lim.acquire()))
+    waiter.start()
+    time.sleep(0.02)
+    # the one queue place is taken
+    assert lim.acquire() == (False, 0.0, 'queue_full')
+    waiter.join()
+    admitted, waited, reason = results[0]
+    assert not admitted and reason == 'timeout' and waited >= 0.1
+    lim.release(0.5)
+    assert lim.acquire()[0]
+
+
+def test_shed_request_gets_503_with_retry_after(geo_app):
+    slot = _geo(geo_app).acquire()
+    assert slot[0]
+    resp = geo_app.test_client().post('/map_pois', json={'lat': 'x'})
+    assert resp.status_code == 503
+    assert int(resp.headers['Retry-After']) >= 1
+    _geo(geo_app).release(0.1)
+
+
+def test_shed_request_gets_last_good_response_as_stale(geo_app, monkeypatch):
+    import overpass
+
+    async def search_pois_async(**kwargs):
+        return [{'name': 'Stub', 'lat': 1.0, 'lon': 2.0}]
+
+    monkeypatch.setattr(overpass, 'search_pois_async', search_pois_async)
+    body = {'lat': 1.0, 'lon': 2.0, 'kind': 'hospital'}
+    client = geo_app.test_client()
+    assert client.post('/map_pois', json=body, headers={'X-Session-Id': 'a' * 24}).status_code == 200
+    _geo(geo_app).acquire()
+    resp = client.post('/map_pois', json=body, headers={'X-Session-Id': 'b' * 24})
+    assert resp.status_code == 503
+    assert resp.headers['X-Cache'] == 'stale'
+    assert resp.json['pois'][0]['name'] == 'Stub'
+    _geo(geo_app).release(0.1)
+
+
+def test_streamed_bootstrap_holds_its_slot_until_closed(geo_app, monkeypatch):
+    def stream(loc, opts):
+        yield b'{"part": "location"}\n'
+        yield b'{"part": "done"}\n'
+
+    monkeypatch.setattr(bootstrap, 'stream', stream)
+    client = geo_app.test_client()
+    resp = client.post('/bootstrap', json={'lat': 1.0, 'lon': 2.0, 'stream': True}, buffered=False)
+    assert resp.status_code == 200
+    assert _geo(geo_app).active == 1
+    # while the body is still being sent, the geo class is full
+    assert client.post('/map_pois', json={'lat': 'x'}).status_code == 503
+    assert b''.join(resp.response).count(b'\n') == 2
+    resp.close()
+    assert _geo(geo_app).active == 0
@@ -0,0 +1,59 @@
+import os
+import runpy
+
+import pytest
+
+import alerts
+import disasters
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _store(events, n, lat=10.0, lon=20.0):
+    return events.upsert_events([{'id': f'ev{i}', 'lat': lat + i * 0.001, 'lon': lon, 'title': f'quake {i}'}
+                                 for i in range(n)])
+
+
+def test_backlog_replays_every_page(events, monkeypatch):
+    monkeypatch.setattr(alerts, 'PAGE_SIZE', 3)
+    _store(events, 8)
+    sub = alerts._Subscriber(10.0, 20.0, 50, '0')
+    frames = [f for f in alerts.stream(sub, max_seconds=0.01) if f.startswith('id:')]
+    assert [f.split('\n', 1)[0] for f in frames] == [f'id: {i}' for i in range(1, 9)]
+    assert sub.cursor == '8'
+
+
+def test_poll_delivers_past_one_page(events, monkeypatch):
+    monkeypatch.setattr(alerts, 'PAGE_SIZE', 3)
+    monkeypatch.setattr(disasters, 'get_nearby_disasters', lambda **kw: [])
+    cell = alerts._Cell(alerts._cell_key(10.0, 20.0), events.current_cursor())
+    near, far = alerts._Subscriber(10.0, 20.0, 50, '0'), alerts._Subscriber(10.9, 20.9, 1, '0')
+    cell.subscribers.update((near, far))
+    _store(events, 7)
+    alerts._poll_cell(cell)
+    assert cell.cursor == '7'
+    assert [near.queue.get_nowait()['_seq'] for _ in range(7)] == list(range(1, 8))
+    assert far.queue.empty()
+
+
+def test_stream_unavailable_without_gevent(client):
+    resp = client.get('/alerts/stream?lat=10&lon=20')
+    assert resp.status_code == 503
+    assert alerts.open_stream(10, 20, 5) is None
+
+
+def _load_gunicorn_conf(monkeypatch, **env):
+    # the config sets these with setdefault; keep them out of the test process
+    monkeypatch.setenv('ADMISSION_LIMITS', 'chat=1/1/1')
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', os.path.join(ROOT, '.prom-test'))
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    return runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+
+
+def test_gunicorn_requires_gevent_for_streams(monkeypatch):
+    with pytest.raises(RuntimeError, match='gevent'):
+        _load_gunicorn_conf(monkeypatch, WORKER_CLASS='gthread', ALERTS_STREAM='1')
+    conf = _load_gunicorn_conf(monkeypatch, WORKER_CLASS='gthread', ALERTS_STREAM='0')
+    assert conf['worker_class'] == 'gthread'
+    assert _load_gunicorn_conf(monkeypatch, WORKER_CLASS='gevent')['worker_class'] == 'gevent'
@@ -0,0 +1,23 @@
+import app as app_module
+import wsgi
+
+
+def test_importing_app_builds_no_application():
+    assert not hasattr(app_module, 'app')
+    assert wsgi.app.name == 'app'
+
+
+def test_each_app_keeps_its_own_state():
+    a = app_module.create_app({'ADMISSION_LIMITS': 'geo=1/0/1'})
+    b = app_module.create_app()
+    assert a.extensions['admission'] is not b.extensions['admission']
+    assert a.extensions['admission'].limiters['geo'].limit == 1
+    assert b.extensions['admission'].limiters['geo'].limit != 1
+    assert a.extensions['session_store'] is not b.extensions['session_store']
+
+
+def test_sessions_do_not_leak_between_apps():
+    a = app_module.create_app()
+    b = app_module.create_app()
+    a.extensions['session_store'].put('s' * 24, '{"last_intent": "flood"}')
+    assert b.extensions['session_store'].get('s' * 24) is None
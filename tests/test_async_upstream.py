@@ -0,0 +1,42 @@
+import inspect
+
+import aio
+import overpass
+import payloads
+
+
+def test_views_are_sync(app):
+    for name, view in app.view_functions.items():
+        assert not inspect.iscoroutinefunction(view), name
+
+
+def test_only_the_upstream_call_runs_on_the_shared_loop(client, monkeypatch):
+    threads = {}
+
+    async def search_pois_async(**kwargs):
+        threads['upstream'] = aio.native_ident()
+        return [{'name': 'Stub', 'lat': 1.0, 'lon': 2.0, 'distance_km': 0.1}]
+
+    shape = payloads.shape
+
+    def recording_shape(*args, **kwargs):
+        threads['shape'] = aio.native_ident()
+        return shape(*args, **kwargs)
+
+    monkeypatch.setattr(overpass, 'search_pois_async', search_pois_async)
+    monkeypatch.setattr(payloads, 'shape', recording_shape)
+    resp = client.post('/map_pois', json={'lat': 1.0, 'lon': 2.0, 'kind': 'hospital'})
+    assert resp.status_code == 200
+    assert resp.json['pois'][0]['name'] == 'Stub'
+    assert threads['upstream'] == aio.loop_thread_id()
+    assert threads['shape'] != aio.loop_thread_id()
+
+
+def test_gather_settled_turns_failures_into_none():
+    async def ok():
+        return 1
+
+    async def boom():
+        raise RuntimeError('upstream down')
+
+    assert aio.run(aio.gather_settled(ok(), boom())) == [1, None]
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import bench_inference  # noqa: E402
+
+
+def test_corpus_covers_the_vocabulary():
+    intents, messages, rules = bench_inference.make_corpus(200, 10, seed=3)
+    tags = [it['tag'] for it in intents['intents']]
+    assert len(tags) == 10 and set(rules) == set(tags)
+    used = {w.strip('?!') for it in intents['intents'] for p in it['patterns'] for w in p.split()}
+    assert len(used) == 200
+    assert all(tag in tags and 'unknownword' in text.split() for text, tag in messages)
+    # same seed, same corpus
+    assert bench_inference.make_corpus(200, 10, seed=3)[0] == intents
+
+
+def test_summary_percentiles():
+    s = bench_inference._summary([i / 1000 for i in range(1, 101)], per=2)
+    assert s == {'p50_ms': 25.5, 'p95_ms': 48.0, 'mean_ms': 25.25}
+    assert bench_inference._summary([]) is None
+
+
+def test_compare_flags_p50_regressions_only():
+    base = {'results': {'pack@100x10': {'stages': {'predict': {'p50_ms': 1.0}, 'encode': {'p50_ms': 0.1},
+                                                   'add': None}}}}
+    results = {'pack@100x10': {'stages': {'predict': {'p50_ms': 1.5}, 'encode': {'p50_ms': 0.105},
+                                          'add': {'p50_ms': 9.0}}},
+               'tfidf@100x10': {'stages': {'predict': {'p50_ms': 50.0}}}}
+    assert bench_inference.compare(base, results, 0.2) == [('pack@100x10', 'predict', 1.0, 1.5)]
+    assert bench_inference.compare(base, results, 0.2, min_delta_ms=1.0) == []
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import aio
+import bootstrap
+import overpass_pool
+
+LOC = {'lat': 1.0, 'lon': 2.0, 'display_name': 'here'}
+
+
+@pytest.fixture
+def parts(monkeypatch):
+    """Replace the three lookups with timed fakes; `fail` names a part that raises."""
+    state = {'delays': {'disasters': 0.2, 'pois': 0.1, 'updates': 0.05}, 'fail': None}
+
+    def fake(name):
+        async def part(loc, opts):
+            await asyncio.sleep(state['delays'][name])
+            if state['fail'] == name:
+                raise overpass_pool.OverpassUnavailable('busy', retry_after=7)
+            return {'part': name}
+        return part
+
+    monkeypatch.setattr(bootstrap, 'part_coros', lambda loc, opts: {n: fake(n)(loc, opts) for n in bootstrap.PARTS})
+    return state
+
+
+def test_parse_options():
+    opts = bootstrap.parse_options({'lat': '1.5', 'lon': 2, 'kinds': 'hospital, fuel', 'compact': True})
+    assert (opts['lat'], opts['lon'], opts['kinds'], opts['limit']) == (1.5, 2.0, ['hospital', 'fuel'], bootstrap.POI_LIMIT)
+    assert opts['shape']['compact'] is True
+    assert bootstrap.parse_options({})['kinds'] == bootstrap.POI_KINDS
+    with pytest.raises(ValueError):
+        bootstrap.parse_options({'radius_km': 'far'})
+
+
+def test_build_runs_parts_concurrently_and_isolates_failures(parts):
+    parts['fail'] = 'pois'
+    start = time.perf_counter()
+    out = aio.run(bootstrap.build(LOC, {}))
+    assert time.perf_counter() - start < 0.3
+    assert out['disasters'] == {'part': 'disasters'} and out['updates'] == {'part': 'updates'}
+    assert out['errors'] == {'pois': {'error': 'busy', 'retry_after': 7}}
+
+
+def test_build_without_location():
+    out = aio.run(bootstrap.build(None, {}))
+    assert out['errors']['location'] and 'disasters' not in out
+
+
+def test_stream_emits_parts_as_they_complete(parts):
+    lines = [json.loads(l) for l in bootstrap.stream(LOC, {})]
+    assert [l['part'] for l in lines] == ['location', 'updates', 'pois', 'disasters', 'done']
+    assert lines[0]['data'] == LOC
+
+
+def test_route_with_coordinates(client, parts):
+    resp = client.post('/bootstrap', json={'lat': 1.0, 'lon': 2.0, 'label': 'home'})
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert body['location'] == {'lat': 1.0, 'lon': 2.0, 'display_name': 'home'}
+    assert set(bootstrap.PARTS) <= set(body)
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import cache
+import cache_snapshot
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(cache, '_CACHE', {})
+
+
+class Usgs:
+    calls = 0
+
+    @staticmethod
+    @cache.ttl_cache(60)
+    def fetch(region):
+        Usgs.calls += 1
+        return f'usgs {region}'
+
+
+class Reliefweb:
+    @staticmethod
+    @cache.ttl_cache(60)
+    def fetch(region):
+        return f'reliefweb {region}'
+
+
+def test_same_named_functions_do_not_share_entries():
+    assert Usgs.fetch('eu') == 'usgs eu'
+    assert Reliefweb.fetch('eu') == 'reliefweb eu'
+    assert {k[0] for k in cache._CACHE} == {f'{__name__}.Usgs.fetch', f'{__name__}.Reliefweb.fetch'}
+
+
+def test_cache_put_reports_whether_it_stored():
+    key = (f'{__name__}.Usgs.fetch', (('region', 'us'),))
+    assert cache._cache_put(key, 'restored', time.time() + 60) is True
+    assert Usgs.fetch.cache_lookup('us') == (True, 'restored')
+    assert cache._cache_put(('nowhere.fetch', ()), 'x', time.time() + 60) is False
+
+
+def test_snapshot_restores_entries(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.snapshot')
+    monkeypatch.setattr(cache_snapshot, 'CACHES', {'ttl_cache': cache_snapshot.CACHES['ttl_cache']})
+    Usgs.fetch('asia')
+    stale = (f'{__name__}.Usgs.fetch', (('region', 'old'),))
+    cache._CACHE[stale] = (time.time() - 1, 'expired')
+    assert cache_snapshot.save(path) == 1
+
+    monkeypatch.setattr(cache, '_CACHE', {})
+    assert cache_snapshot.restore(path) == 1
+    calls = Usgs.calls
+    assert Usgs.fetch('asia') == 'usgs asia'
+    assert Usgs.calls == calls
+    assert stale not in cache._CACHE
+
+
+def test_snapshot_of_another_format_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.snapshot')
+    monkeypatch.setattr(cache_snapshot, 'FORMAT', cache_snapshot.FORMAT - 1)
+    cache_snapshot.write(path, {'ttl_cache': [((f'{__name__}.Usgs.fetch', ()), time.time() + 60, 'x')]})
+    monkeypatch.undo()
+    monkeypatch.setattr(cache, '_CACHE', {})
+    assert cache_snapshot.restore(path) == 0
+    assert cache._CACHE == {}
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+
+
+def _ev(i, lat=10.0, lon=20.0, **extra):
+    return dict({'id': f'ev{i}', 'lat': lat, 'lon': lon, 'title': f'quake {i}'}, **extra)
+
+
+def test_only_new_or_changed_events_get_a_sequence(events):
+    assert events.upsert_events([_ev(1), _ev(2)]) == ['ev1', 'ev2']
+    cursor = events.current_cursor()
+    # unchanged content (and query-dependent keys) keep their seq
+    assert events.upsert_events([_ev(1, _distance_km=3.2), _ev(2)]) == []
+    assert events.current_cursor() == cursor
+    assert events.upsert_events([_ev(2, title='quake 2, revised'), _ev(3)]) == ['ev2', 'ev3']
+    assert events.changed_ids_since(cursor, ['ev1', 'ev2', 'ev3']) == {'ev2', 'ev3'}
+
+
+def test_changes_nearby_returns_deltas_and_a_cursor(events):
+    events.upsert_events([_ev(1), _ev(2, lat=40.0)])
+    res, cursor = events.changes_nearby(10.0, 20.0, 50, since='0')
+    assert [e['id'] for e in res] == ['ev1'] and cursor == '2'
+    assert events.changes_nearby(10.0, 20.0, 50, since=cursor) == ([], '2')
+    events.upsert_events([_ev(3)])
+    res, cursor = events.changes_nearby(10.0, 20.0, 50, since=cursor)
+    assert [e['id'] for e in res] == ['ev3'] and cursor == '3'
+
+
+def test_limited_delta_resumes_where_it_stopped(events):
+    events.upsert_events([_ev(i) for i in range(5)])
+    first, cursor = events.changes_nearby(10.0, 20.0, 50, since='0', limit=3)
+    rest, cursor = events.changes_nearby(10.0, 20.0, 50, since=cursor, limit=3)
+    assert [e['id'] for e in first + rest] == [f'ev{i}' for i in range(5)]
+
+
+def test_unknown_cursor_means_from_scratch(events):
+    events.upsert_events([_ev(1)])
+    assert events.parse_cursor('999') == 0
+    assert events.parse_cursor('junk') == 0
+    assert events.parse_cursor('1') == 1
+
+
+def test_prune_drops_old_events(events):
+    now = datetime.now(timezone.utc)
+    events.upsert_events([_ev(1, time=(now - timedelta(days=10)).isoformat()), _ev(2, time=now.isoformat())])
+    assert events.prune((now - timedelta(days=1)).timestamp()) == 1
+    assert [e['id'] for e in events.query_nearby(10.0, 20.0, 50)] == ['ev2']
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+import intent_tfidf
+
+INTENTS = {'intents': [
+    {'tag': 'flood', 'patterns': ['what to do in a flood', 'the river is flooding', 'flood water rising']},
+    {'tag': 'fire', 'patterns': ['there is a wildfire nearby', 'smoke and fire', 'forest fire evacuation']},
+    {'tag': 'greeting', 'patterns': ['hello', 'hi there']},
+]}
+
+
+def _dense_cosine(index, text):
+    # the same weighting, computed densely over every feature
+    n = len(index)
+    feats = list(index._features)
+    tf = np.zeros((n, len(feats)))
+    row = 0
+    for intent in INTENTS['intents']:
+        for pattern in intent['patterns']:
+            for f, c in intent_tfidf.features(pattern).items():
+                tf[row, feats.index(f)] = 1 + math.log(c)
+            row += 1
+    df = (tf > 0).sum(axis=0)
+    idf = np.log((1 + n) / (1 + df)) + 1
+    m = tf * idf
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    q = np.zeros(len(feats))
+    extra = 0.0
+    for f, c in intent_tfidf.features(text).items():
+        w = 1 + math.log(c)
+        if f in index._features:
+            q[feats.index(f)] = w * idf[feats.index(f)]
+        else:
+            extra += (w * (math.log(1 + n) + 1)) ** 2
+    return m @ q / math.sqrt((q ** 2).sum() + extra)
+
+
+def test_similarities_match_dense_tfidf():
+    index = intent_tfidf.TfidfIndex.from_intents(INTENTS)
+    for text in ('flooded river', 'is there a fire?', 'helo zzz'):
+        assert np.allclose(index.similarities(text), _dense_cosine(index, text), atol=1e-5)
+
+
+def test_classify_tolerates_typos_and_rejects_noise():
+    index = intent_tfidf.TfidfIndex.from_intents(INTENTS)
+    assert index.classify('the rivers are floodng')[0]['intent'] == 'flood'
+    assert index.classify('wildfires near me')[0]['intent'] == 'fire'
+    assert index.classify('qqq xyzzy') == []
+    assert intent_tfidf.TfidfIndex().classify('hello') == []
+
+
+def test_add_is_visible_to_the_next_query():
+    index = intent_tfidf.TfidfIndex.from_intents(INTENTS)
+    assert index.classify('earthquake tremor') == []
+    frozen = index._freeze()
+    index.add('earthquake', 'earthquake tremor shaking')
+    # a snapshot taken before add() still scores the old patterns only
+    assert len(index._similarities('earthquake', frozen)) == 8
+    assert index.classify('earthquake tremor')[0]['intent'] == 'earthquake'
+    assert index.classes[-1] == 'earthquake' and len(index) == 9
+
+
+def test_cosine_mode_and_bad_mode():
+    index = intent_tfidf.TfidfIndex.from_intents(INTENTS, mode='cosine')
+    best = index.classify('flood water')[0]
+    assert best['intent'] == 'flood' and float(best['probability']) == pytest.approx(
+        index.similarities('flood water').max(), abs=1e-5)
+    with pytest.raises(ValueError):
+        intent_tfidf.TfidfIndex(mode='bm25')
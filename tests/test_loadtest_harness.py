@@ -0,0 +1,52 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+import overpass
+import overpass_pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import loadgen          # noqa: E402
+import upstream_sim     # noqa: E402
+
+
+@pytest.fixture
+def sim():
+    srv, base = upstream_sim.start('fast', seed=1)
+    yield base
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_overpass_answers_are_recentred_on_the_query(sim):
+    overpass_pool.configure([f'{sim}/overpass-api.de/api/interpreter'])
+    try:
+        q = overpass._build_overpass_query('hospital', 40.0, -3.0, radius_m=5000, limit=5)
+        with overpass_pool.open_query(q, timeout=5) as resp:
+            pois = [overpass._element_to_poi(el) for el in overpass._iter_elements(resp)]
+    finally:
+        overpass_pool.configure([])
+    assert pois and all(abs(p['lat'] - 40.0) < 0.5 and abs(p['lon'] + 3.0) < 0.5 for p in pois)
+    assert httpx.get(f'{sim}/_sim/stats').json() == {'overpass-api.de': {'200': 1}}
+    assert httpx.post(f'{sim}/_sim/reset').json() == {}
+
+
+def test_profile_injects_429_and_errors():
+    sim = upstream_sim.Simulator({'default': {'rate_429': 1.0, 'retry_after': 3}}, upstream_sim.load_fixtures())
+    status, headers, _ = sim.handle('GET', '/ip-api.com/json', b'')
+    assert status == 429 and headers['Retry-After'] == '3'
+    sim = upstream_sim.Simulator({'default': {'error_rate': 1.0}}, upstream_sim.load_fixtures())
+    assert sim.handle('GET', '/ip-api.com/json', b'')[0] == 500
+    assert sim.handle('GET', '/unknown.example/x', b'')[0] == 404
+
+
+def test_loadgen_mix_and_summary():
+    assert loadgen.parse_mix('/map_pois=2,latest_updates') == [('map_pois', 2.0), ('latest_updates', 1.0)]
+    with pytest.raises(SystemExit):
+        loadgen.parse_mix('nope=1')
+    results = [(i / 1000.0, 200) for i in range(1, 100)] + [(0.5, 503), (1.0, 'error')]
+    s = loadgen.summarize(results, elapsed=2.0)
+    assert (s['requests'], s['ok'], s['errors']) == (101, 99, {'503': 1, 'error': 1})
+    assert s['rps'] == 50.5 and s['p50_ms'] == 51.0 and s['max_ms'] == 1000.0
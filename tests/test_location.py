@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+
+import pytest
+
+import location
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(location, '_CACHE', OrderedDict())
+
+
+class FakeReader:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, ip):
+        self.calls.append(ip)
+        if ip.startswith('10.'):
+            return None
+        return {'location': {'latitude': 48.1, 'longitude': 11.6}, 'city': {'names': {'en': 'Munich'}},
+                'country': {'names': {'en': 'Germany'}}}
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    r = FakeReader()
+    monkeypatch.setattr(location, '_get_reader', lambda: r)
+    return r
+
+
+def test_cache_key_is_the_network_prefix():
+    assert location._cache_key('203.0.113.77') == '203.0.113.0/24'
+    assert location._cache_key('2001:db8:1:2::5') == '2001:db8:1::/48'
+    assert location._cache_key('::1') == 'self'
+    assert location._cache_key('not-an-ip') == 'not-an-ip'
+
+
+def test_mmdb_lookup_is_cached_per_prefix(reader, monkeypatch):
+    async def no_ip_api(ip):
+        pytest.fail('went to ip-api')
+    monkeypatch.setattr(location, '_lookup_ip_api', no_ip_api)
+    loc = location.lookup_ip('203.0.113.7')
+    assert loc == {'lat': 48.1, 'lon': 11.6, 'display_name': 'Munich, Germany'}
+    assert location.lookup_ip('203.0.113.200') == loc
+    assert reader.calls == ['203.0.113.7']
+
+
+def test_ip_api_fallback_and_short_negative_cache(reader, monkeypatch):
+    answers = iter([None, {'lat': 1.0, 'lon': 2.0, 'display_name': 'x'}])
+
+    async def ip_api(ip):
+        return next(answers)
+    monkeypatch.setattr(location, '_lookup_ip_api', ip_api)
+    assert location.lookup_ip('10.0.0.1') is None
+    expires, value = location._CACHE['10.0.0.0/24']
+    assert value is None and expires <= time.time() + location.NEGATIVE_TTL
+    # once the negative entry expires the next lookup tries again
+    location._CACHE['10.0.0.0/24'] = (time.time() - 1, None)
+    assert location.lookup_ip('10.0.0.2') == {'lat': 1.0, 'lon': 2.0, 'display_name': 'x'}
+
+
+def test_cache_is_lru_bounded(monkeypatch):
+    monkeypatch.setattr(location, 'CACHE_SIZE', 2)
+    for key in ('a', 'b'):
+        location._cache_put(key, {'k': key})
+    location._cache_get('a')
+    location._cache_put('c', {'k': 'c'})
+    assert list(location._CACHE) == ['a', 'c']
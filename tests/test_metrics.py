@@ -0,0 +1,41 @@
+import pytest
+
+import metrics
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+
+def _value(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_host_label(monkeypatch):
+    assert metrics.host_of('https://earthquake.usgs.gov/fdsnws/event/1/query?x=1') == 'earthquake.usgs.gov'
+    monkeypatch.setattr(metrics, '_SIM_BASE', 'http://127.0.0.1:9000')
+    assert metrics.host_of('http://127.0.0.1:9000/api.reliefweb.int/v1/disasters') == 'api.reliefweb.int'
+
+
+def test_routes_are_labelled_by_url_rule(client):
+    labels = {'route': '/alerts/stream', 'method': 'GET', 'status': '400'}
+    before = _value('http_requests_total', **labels)
+    assert client.get('/alerts/stream?lat=x&lon=1').status_code == 400
+    assert client.get('/alerts/stream?lat=y&lon=2').status_code == 400
+    assert _value('http_requests_total', **labels) == before + 2
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_bucket{' in body
+
+
+def test_upstream_and_cache_helpers():
+    before = _value('upstream_errors_total', host='overpass.example', kind='timeout')
+    metrics.observe_upstream('https://overpass.example/api/interpreter', 0, error='timeout')
+    assert _value('upstream_errors_total', host='overpass.example', kind='timeout') == before + 1
+    metrics.observe_upstream('https://overpass.example/api/interpreter', 0.2, status=200)
+    assert _value('upstream_requests_total', host='overpass.example', status='200') >= 1
+    metrics.cache_size('test_cache', 3)
+    assert _value('cache_entries', cache='test_cache') == 3
+
+
+def test_engine_gauge_marks_one_engine():
+    metrics.observe_inference('pack-int8', 0.001)
+    assert [_value('model_engine', engine=e) for e in metrics.ENGINES].count(1.0) == 1
+    assert _value('model_engine', engine='pack-int8') == 1
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+import model_bundle
+import model_pack
+
+
+def _artifacts(tmp_path):
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    intents = tmp_path / 'intents.json'
+    intents.write_text('{"intents": []}')
+    for name in ('words.pkl', 'classes.pkl', model_bundle.MODEL_FILE):
+        (model_dir / name).write_bytes(b'v1')
+    return str(model_dir), str(intents), model_bundle._paths(str(model_dir), str(intents))
+
+
+def _bump(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_without_manifest_every_artifact_is_watched(tmp_path):
+    _, _, paths = _artifacts(tmp_path)
+    before = model_bundle._signature(paths)
+    _bump(paths['words'], b'v2')
+    assert model_bundle._signature(paths) != before
+
+
+def test_manifest_gates_reload_until_the_set_is_complete(tmp_path):
+    model_dir, intents, paths = _artifacts(tmp_path)
+    manifest = model_bundle.write_manifest(model_dir, intents)
+    assert manifest['files'] == ['chatbot_model.keras', 'classes.pkl', 'words.pkl']
+    assert manifest['version'] == model_bundle._version(paths)
+    before = model_bundle._signature(paths)
+    # artifacts renamed into place one by one: no reload yet
+    _bump(paths['words'], b'v2')
+    _bump(paths['model'], b'v2')
+    assert model_bundle._signature(paths) == before
+    # the manifest is written last and releases the whole set
+    model_bundle.write_manifest(model_dir, intents)
+    assert model_bundle._signature(paths) != before
+
+
+def _write_pack(model_dir, n_words, source):
+    rng = np.random.default_rng(0)
+    layers = [(rng.normal(size=(8, 4)).astype(np.float32), np.zeros(4, np.float32), 'relu'),
+              (rng.normal(size=(4, 3)).astype(np.float32), np.zeros(3, np.float32), 'softmax')]
+    model_pack.write_pack(os.path.join(model_dir, model_pack.PACK_FILE), {'intents': []},
+                          [f'w{i}' for i in range(n_words)], ['a', 'b', 'c'], layers, source=source)
+
+
+@pytest.fixture
+def packed(tmp_path, monkeypatch):
+    model_dir, intents, _ = _artifacts(tmp_path)
+    monkeypatch.setattr(model_bundle, 'MODEL_DIR', model_dir)
+    monkeypatch.setattr(model_bundle, 'INTENTS_PATH', intents)
+    monkeypatch.setattr(model_bundle, 'MODEL_FORMAT', 'pack')
+    monkeypatch.setattr(model_bundle, '_CURRENT', None)
+    monkeypatch.setattr(model_bundle, '_STATUS', dict(model_bundle._STATUS, reloads=0, last_error=None))
+    _write_pack(model_dir, 8, 'v1')
+    model_bundle.swap(model_bundle.load())
+    return model_dir
+
+
+def test_reload_swaps_a_new_version(packed):
+    old = model_bundle._CURRENT
+    assert not model_bundle.reload()     # nothing changed
+    _write_pack(packed, 8, 'v2')
+    assert model_bundle.reload()
+    assert model_bundle._CURRENT.version == 'v2' and old.version == 'v1'
+    assert model_bundle.status()['reloads'] == 1
+
+
+def test_reload_rejects_mismatched_vocabulary(packed):
+    old = model_bundle._CURRENT
+    _write_pack(packed, 5, 'v2')
+    assert not model_bundle.reload()
+    assert model_bundle._CURRENT is old
+    st = model_bundle.status()
+    assert st['version'] == 'v1' and st['reloads'] == 0
+    assert 'expects 8 words' in st['last_error']
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import model_pack
+
+
+def _layers(rng, sizes=(300, 16, 5)):
+    layers = []
+    for n, (a, b) in enumerate(zip(sizes, sizes[1:])):
+        act = 'softmax' if n == len(sizes) - 2 else 'relu'
+        layers.append((rng.normal(size=(a, b)).astype(np.float32), rng.normal(size=b).astype(np.float32), act))
+    return layers
+
+
+def _reference(x, layers):
+    h = x
+    for kernel, bias, act in layers:
+        h = h @ kernel + bias
+        if act == 'relu':
+            h = np.maximum(h, 0)
+        else:
+            h = np.exp(h - h.max(axis=-1, keepdims=True))
+            h /= h.sum(axis=-1, keepdims=True)
+    return h
+
+
+@pytest.fixture
+def pack(tmp_path):
+    rng = np.random.default_rng(0)
+    layers = _layers(rng)
+    path = str(tmp_path / 'bundle.pack')
+    intents = {'intents': [{'tag': 'flood', 'patterns': ['flood'], 'responses': ['Move to higher ground. Now. Really.']}]}
+    model_pack.write_pack(path, intents, [f'w{i}' for i in range(300)], ['a', 'b', 'c', 'd', 'e'], layers,
+                          source='v1', quantized=('int8', 'float16'))
+    return path, layers
+
+
+def test_pack_round_trip(pack):
+    path, layers = pack
+    p = model_pack.Pack(path, verify=True)
+    assert p.version == 'v1'
+    assert p.words[:2] == ['w0', 'w1'] and len(p.classes) == 5
+    assert p.intents['intents'][0]['tips'] == ['Move to higher ground. Now']
+    assert set(p.models) == {'float32', 'int8', 'float16'}
+
+
+@pytest.mark.parametrize('precision,tol', [('float32', 1e-5), ('float16', 1e-2), ('int8', 5e-2)])
+@pytest.mark.parametrize('density', [0.02, 0.6])
+def test_precisions_match_float32(pack, monkeypatch, precision, tol, density):
+    # small blocks so the dense path widens the kernel in several pieces
+    monkeypatch.setattr(model_pack, 'DEQUANT_ROWS', 64)
+    path, layers = pack
+    rng = np.random.default_rng(1)
+    x = (rng.random((8, 300)) < density).astype(np.float32)
+    got = model_pack.Pack(path).models[precision].predict(x)
+    ref = _reference(x, layers)
+    assert np.abs(got - ref).max() < tol
+    assert (got.argmax(axis=1) == ref.argmax(axis=1)).all()
+
+
+def test_blockwise_matmul_skips_nothing(monkeypatch):
+    monkeypatch.setattr(model_pack, 'DEQUANT_ROWS', 7)
+    rng = np.random.default_rng(2)
+    kernel = rng.normal(size=(50, 4)).astype(np.float16)
+    x = rng.random((3, 50)).astype(np.float32)
+    x[:, 7:21] = 0
+    assert np.allclose(model_pack.DenseNet._matmul(x, kernel), x @ kernel.astype(np.float32), atol=1e-4)
+
+
+def test_verify_rejects_corrupt_pack(pack):
+    path, _ = pack
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xFF]))
+    model_pack.Pack(path)
+    with pytest.raises(ValueError, match='checksum'):
+        model_pack.Pack(path, verify=True)
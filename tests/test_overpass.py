@@ -0,0 +1,93 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+
+import cache
+import overpass
+import overpass_pool
+
+LAT, LON = 10.0, 20.0
+
+
+def _node(i, tags=None):
+    # 0.001 degrees of latitude apart, about 111 m
+    return {'type': 'node', 'id': i, 'lat': LAT + 0.001 * i, 'lon': LON, 'tags': tags or {'name': f'n{i}'}}
+
+
+class FakeOverpass:
+    """Answers around: queries with the elements in the circle, farthest first, stopping at the cap."""
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.queries = []
+
+    @contextmanager
+    def open_query(self, query, timeout=25):
+        self.queries.append(query)
+        yield query
+
+    def iter_elements(self, query):
+        radius, lat, lon = re.search(r'around:(\d+),([-\d.]+),([-\d.]+)', query).groups()
+        cap = int(re.search(r'out center (\d+);', query).group(1))
+        inside = [el for el in self.elements
+                  if overpass._haversine_km(float(lat), float(lon), el['lat'], el['lon']) <= int(radius) / 1000.0]
+        return iter(sorted(inside, key=lambda el: -el['lat'])[:cap])
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(cache, '_CACHE', {})
+    monkeypatch.setattr(overpass, 'USE_TILES', False)
+    server = FakeOverpass([])
+    monkeypatch.setattr(overpass_pool, 'open_query', server.open_query)
+    monkeypatch.setattr(overpass, '_iter_elements', server.iter_elements)
+    return server
+
+
+def test_query_pushes_an_oversampled_cap_down():
+    q = overpass._build_overpass_query(['hospital', 'pharmacy'], LAT, LON, radius_m=1000, limit=7)
+    assert q.endswith(f'out center {7 * overpass.OVERSAMPLE * 2};')
+    assert overpass._server_cap(['all'], 10 ** 6) == overpass.MAX_SERVER_RESULTS
+
+
+def test_truncated_answer_is_refined_to_the_exact_nearest(fake):
+    fake.elements = [_node(i) for i in range(200)]
+    out = overpass.search_pois(LAT, LON, radius_m=20000, kind='all', limit=5)
+    assert [p['id'] for p in out] == [0, 1, 2, 3, 4]
+    assert out == sorted(out, key=lambda p: p['distance_km'])
+    assert 1 < len(fake.queries) <= overpass.MAX_REFINE + 1
+    assert 'out center 50;' in fake.queries[0]
+
+
+def test_complete_answer_needs_one_query(fake):
+    fake.elements = [_node(i) for i in range(20)]
+    out = overpass.search_pois(LAT, LON, radius_m=20000, kind='all', limit=5)
+    assert [p['id'] for p in out] == [0, 1, 2, 3, 4]
+    assert len(fake.queries) == 1
+
+
+def test_multi_kind_is_one_round_trip_split_by_tag(fake):
+    fake.elements = [_node(i, {'amenity': 'hospital' if i % 2 else 'pharmacy', 'name': f'n{i}'}) for i in range(10)]
+    out = overpass.search_pois_multi(LAT, LON, radius_m=5000, kinds=['hospitals', 'pharmacy'], limit=3)
+    assert len(fake.queries) == 1
+    assert '"amenity"="hospital"' in fake.queries[0] and '"amenity"="pharmacy"' in fake.queries[0]
+    assert [p['id'] for p in out['hospitals']] == [1, 3, 5]
+    assert [p['id'] for p in out['pharmacy']] == [0, 2, 4]
+    # each kind primes the single-kind cache
+    assert overpass.search_pois(LAT, LON, radius_m=5000, kind='pharmacy', limit=3) == out['pharmacy']
+    assert len(fake.queries) == 1
+
+
+def test_tiles_query_splits_kinds_and_tiles():
+    import poi_tiles
+    z = 12
+    t = poi_tiles.lonlat_to_tile(LAT, LON, z)
+    pairs = [('hospital', t), ('pharmacy', t)]
+    q = poi_tiles._build_tiles_query(z, pairs)
+    assert q.count('"amenity"="hospital"') == 1 and q.count('"amenity"="pharmacy"') == 1
+    splitter = poi_tiles._TileSplitter(z, pairs)
+    for el in (_node(1, {'amenity': 'hospital'}), _node(2, {'amenity': 'pharmacy'}), _node(1, {'amenity': 'hospital'})):
+        splitter.feed(el)
+    assert [p['id'] for p in splitter.by_key[('hospital', t)]] == [1]
+    assert [p['id'] for p in splitter.by_key[('pharmacy', t)]] == [2]
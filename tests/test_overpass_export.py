@@ -0,0 +1,96 @@
+import io
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import overpass
+import overpass_export
+import overpass_pool
+
+
+def _element(n):
+    return {'type': 'node', 'id': n, 'lat': 1.0, 'lon': 2.0, 'tags': {'name': f'p{n}'}}
+
+
+@pytest.fixture
+def fake_overpass(monkeypatch):
+    """Every query returns `per_query` elements; ids repeat across queries."""
+    state = {'per_query': 3, 'fail': set()}
+
+    @contextmanager
+    def open_query(q, timeout=25):
+        if any(f'{lat},' in q for lat in state['fail']):
+            raise overpass_pool.OverpassUnavailable('stub down')
+        yield object()
+
+    monkeypatch.setattr(overpass_pool, 'open_query', open_query)
+    monkeypatch.setattr(overpass, '_iter_elements', lambda resp: (_element(n) for n in range(state['per_query'])))
+    return state
+
+
+class ListWriter:
+    def __init__(self, fail_after=None):
+        self.rows = []
+        self.fail_after = fail_after
+
+    def write(self, row):
+        if self.fail_after is not None and len(self.rows) >= self.fail_after:
+            raise OSError('No space left on device')
+        self.rows.append(row)
+
+
+def _jobs(n):
+    return [{'query_id': i, 'kind': 'hospital', 'lat': 10.0 + i, 'lon': 20.0, 'radius_m': 1000} for i in range(n)]
+
+
+def test_export_streams_every_row(fake_overpass):
+    writer = ListWriter()
+    stats = overpass_export.run_export(_jobs(4), writer, concurrency=2, log=io.StringIO())
+    assert stats['jobs'] == 4 and stats['failed'] == 0 and stats['rows'] == 12
+    assert {r['query_id'] for r in writer.rows} == {0, 1, 2, 3}
+
+
+def test_export_dedupe_drops_repeated_elements(fake_overpass):
+    writer = ListWriter()
+    stats = overpass_export.run_export(_jobs(4), writer, concurrency=2, dedupe=True, log=io.StringIO())
+    assert stats['rows'] == 3
+    assert sorted(r['id'] for r in writer.rows) == [0, 1, 2]
+
+
+def test_export_counts_failed_queries_and_bad_rows(fake_overpass, tmp_path):
+    fake_overpass['fail'].add(11.0)
+    path = tmp_path / 'jobs.csv'
+    path.write_text('lat,lon,kind\n10,20,hospital\n11,20,hospital\nnot-a-number,20,hospital\n')
+    log = io.StringIO()
+    stats = overpass_export.run_export(overpass_export.read_jobs(str(path)), ListWriter(), log=log)
+    assert stats['jobs'] == 3 and stats['failed'] == 2 and stats['rows'] == 3
+    assert 'bad input row 3' in log.getvalue()
+
+
+def test_export_reraises_feeder_errors(fake_overpass):
+    def jobs():
+        yield from _jobs(2)
+        raise ValueError('unreadable jobs file')
+
+    with pytest.raises(ValueError, match='unreadable'):
+        overpass_export.run_export(jobs(), ListWriter(), log=io.StringIO())
+
+
+def test_export_writer_error_does_not_hang(fake_overpass, monkeypatch):
+    # a small queue and big results: workers block on put() once the writer dies
+    monkeypatch.setattr(overpass_export, 'QUEUE_SIZE', 4)
+    fake_overpass['per_query'] = 200
+    result = {}
+
+    def run():
+        try:
+            overpass_export.run_export(_jobs(50), ListWriter(fail_after=10), concurrency=4, log=io.StringIO())
+        except OSError as e:
+            result['error'] = e
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    t.join(20)
+    assert not t.is_alive(), 'run_export hung after the writer failed'
+    assert 'No space left' in str(result['error'])
@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import aio
+import overpass
+import overpass_pool
+
+BODY = json.dumps({'elements': [{'type': 'node', 'id': 1, 'lat': 1.0, 'lon': 2.0, 'tags': {'amenity': 'hospital'}}]})
+
+
+class Stub:
+    """Local Overpass stand-in: `status`, `headers`, `delay` and `slots` are set per test."""
+
+    def __init__(self):
+        self.status = 200
+        self.headers = {}
+        self.delay = 0.0
+        self.slots = 'Rate limit: 2\n0 slots available now.\nSlot available after: 2030-01-01T00:00:00Z, in 12 seconds.\n'
+        self.queries = 0
+        self.status_reads = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                self.send_response(status)
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.status_reads += 1
+                self._send(200, stub.slots.encode())
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.queries += 1
+                time.sleep(stub.delay)
+                body = BODY.encode() if stub.status == 200 else b'busy'
+                self._send(stub.status, body, stub.headers.items())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/interpreter'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    a, b = Stub(), Stub()
+    overpass_pool.configure([a.url, b.url])
+    yield a, b
+    a.close()
+    b.close()
+    overpass_pool.configure([])
+
+
+def _ids(q='[out:json];node;out;'):
+    with overpass_pool.open_query(q, timeout=5) as resp:
+        return [el['id'] for el in overpass._iter_elements(resp)]
+
+
+async def _ids_async(q='[out:json];node;out;'):
+    async with overpass_pool.open_query_async(q, timeout=5) as resp:
+        return [el['id'] async for el in overpass._aiter_elements(resp)]
+
+
+def _endpoint(url):
+    return next(e for e in overpass_pool._ENDPOINTS if e.url == url)
+
+
+@pytest.mark.parametrize('run', [_ids, lambda: aio.run(_ids_async())], ids=['sync', 'async'])
+def test_fails_over_on_5xx(stubs, run):
+    a, b = stubs
+    a.status = 503
+    assert run() == [1]
+    assert (a.queries, b.queries) == (1, 1)
+    assert _endpoint(a.url).cooldown_until > time.time()
+    assert not _endpoint(a.url).rate_limited_recently()
+
+
+def test_429_backs_off_for_retry_after(stubs):
+    a, b = stubs
+    a.status, a.headers = 429, {'Retry-After': '30'}
+    assert _ids() == [1]
+    ep = _endpoint(a.url)
+    assert 25 < ep.cooldown_until - time.time() <= 30
+    assert ep.rate_limited_recently() and a.status_reads == 0
+    # cooling down: the next query goes straight to b
+    assert _ids() == [1]
+    assert (a.queries, b.queries) == (1, 2)
+
+
+def test_429_without_retry_after_reads_status(stubs):
+    a, b = stubs
+    a.status = 429
+    assert _ids() == [1]
+    assert a.status_reads == 1
+    assert 10 < _endpoint(a.url).cooldown_until - time.time() <= 12
+
+
+def test_all_rate_limited_raises_unavailable(stubs):
+    a, b = stubs
+    a.status = b.status = 429
+    a.headers = b.headers = {'Retry-After': '20'}
+    with pytest.raises(overpass_pool.OverpassUnavailable) as exc:
+        _ids()
+    assert 15 <= exc.value.retry_after <= 20
+
+
+def test_ewma_prefers_the_faster_endpoint(stubs):
+    a, b = stubs
+    for e in overpass_pool._ENDPOINTS:
+        e.ewma = 0.05
+    a.delay = 0.3
+    _ids()
+    assert a.queries == 1 and _endpoint(a.url).ewma > _endpoint(b.url).ewma
+    for _ in range(3):
+        _ids()
+    assert (a.queries, b.queries) == (1, 3)
+    assert all(e.in_flight == 0 for e in overpass_pool._ENDPOINTS)
+
+
+def test_4xx_closes_the_response_and_raises(stubs, monkeypatch):
+    a, b = stubs
+    a.status = 400
+    sent = []
+    client = aio.sync_client()
+    send = client.send
+    monkeypatch.setattr(client, 'send', lambda *args, **kw: sent.append(send(*args, **kw)) or sent[-1])
+    with pytest.raises(httpx.HTTPStatusError):
+        _ids()
+    assert sent and sent[0].is_closed
+    assert b.queries == 0 and _endpoint(a.url).in_flight == 0
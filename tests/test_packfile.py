@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+import _packfile
+import poi_local
+
+MAGIC = b'TESTPK01'
+
+
+def test_round_trip_aligned_and_verified(tmp_path):
+    path = str(tmp_path / 'x.bin')
+    arrays = {'a': np.arange(5, dtype=np.int16), 'b': np.ones((3, 2), np.float32), 'empty': np.zeros(0, np.int64)}
+    header = _packfile.write(path, MAGIC, {'kind': 'test'}, arrays, checksum=True)
+    hlen, read = _packfile.read_header(path, MAGIC)
+    assert read == header and read['kind'] == 'test'
+    start = _packfile.data_start(MAGIC, hlen)
+    assert start % _packfile.ALIGN == 0
+    assert all(spec['offset'] % _packfile.ALIGN == 0 for spec in read['arrays'].values())
+    got = _packfile.open_arrays(path, MAGIC, hlen, read)
+    for name, arr in arrays.items():
+        assert got[name].dtype == arr.dtype and np.array_equal(got[name], arr)
+    assert _packfile.verify(path, MAGIC, hlen, read)
+
+
+def test_verify_and_magic_failures(tmp_path):
+    path = str(tmp_path / 'x.bin')
+    _packfile.write(path, MAGIC, {}, {'a': np.arange(100, dtype=np.uint8)}, checksum=True)
+    hlen, header = _packfile.read_header(path, MAGIC)
+    with open(path, 'r+b') as f:
+        f.seek(_packfile.data_start(MAGIC, hlen) + 10)
+        f.write(b'\xff')
+    assert not _packfile.verify(path, MAGIC, hlen, header)
+    with pytest.raises(ValueError, match='not a widget'):
+        _packfile.read_header(path, b'OTHER001', 'widget')
+
+
+def test_poi_index_build_and_search(tmp_path):
+    src = tmp_path / 'region.geojson'
+    feats = [{'type': 'Feature', 'id': f'node/{i}', 'geometry': {'type': 'Point', 'coordinates': [13.4 + i * 0.01, 52.5]},
+              'properties': {'amenity': 'hospital' if i % 2 == 0 else 'pharmacy', 'name': f'p{i}'}} for i in range(40)]
+    src.write_text(json.dumps({'type': 'FeatureCollection', 'features': feats}))
+    out = str(tmp_path / 'pois.idx')
+    poi_local.build_index(str(src), out)
+    index = poi_local.PoiIndex(out)
+    res = index.search(52.5, 13.4, 5000, 'hospital', limit=3)
+    assert [p['id'] for p in res] == [0, 2, 4]
+    assert res[0]['distance_km'] == 0.0 and res[1]['name'] == 'p2'
+    assert index.search(52.5, 13.4, 5000, 'fuel', limit=3) == []
@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import payloads
+
+POIS = [{'id': i, 'name': f'p{i}', 'tags': {'name': f'p{i}', 'amenity': 'hospital', 'wikidata': 'Q1'}} for i in range(7)]
+
+
+def test_compact_projection_and_pages():
+    page, nxt = payloads.shape(POIS, {'compact': 'true', 'fields': 'id,tags', 'page_size': 3, 'offset': 3},
+                               payloads.compact_poi)
+    assert page == [{'id': i, 'tags': {'name': f'p{i}', 'amenity': 'hospital'}} for i in (3, 4, 5)]
+    assert nxt == 6
+    last, nxt = payloads.shape(POIS, {'page_size': 3, 'offset': nxt}, payloads.compact_poi)
+    assert [p['id'] for p in last] == [6] and nxt is None
+    # without options the list passes through whole
+    assert payloads.shape(POIS, {}, payloads.compact_poi) == (POIS, None)
+
+
+def test_bad_paging_values_are_clamped():
+    assert payloads.paginate(list(range(10)), offset='x', page_size=2) == ([0, 1], 2)
+    page, nxt = payloads.paginate(list(range(1000)), page_size=10 ** 6)
+    assert len(page) == payloads.MAX_PAGE_SIZE and nxt == payloads.MAX_PAGE_SIZE
+    assert payloads.parse_fields(['a', ' ', 'b ']) == ('a', 'b')
+
+
+def test_compact_event_drops_raw():
+    assert payloads.compact_event({'id': 1, 'raw': {'big': True}}) == {'id': 1}
+
+
+@pytest.mark.parametrize('fast', [True, False], ids=['orjson', 'json'])
+def test_dumps_handles_non_json_values(monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(payloads, 'orjson', None)
+    out = json.loads(payloads.dumps({'t': datetime(2024, 1, 2), 1: 'x'}))
+    assert out['1'] == 'x' and out['t'].startswith('2024-01-02')
@@ -0,0 +1,77 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+import cache
+import overpass
+import poi_local
+
+KINDS = ('hospital', 'pharmacy', 'fuel')
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    feats = []
+    for i in range(3000):
+        lon, lat = 13.0 + rng.random(), 52.0 + rng.random()
+        feats.append({'type': 'Feature', 'id': f'node/{i}', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                      'properties': {'amenity': KINDS[i % 3], 'name': f'p{i}'}})
+    feats.append({'type': 'Feature', 'id': 'way/9', 'properties': {'power': 'substation'},
+                  'geometry': {'type': 'Polygon', 'coordinates': [[[13.5, 52.5], [13.6, 52.5], [13.6, 52.6], [13.5, 52.5]]]}})
+    src = tmp_path / 'region.geojson'
+    src.write_text(json.dumps({'type': 'FeatureCollection', 'features': feats}))
+    path = str(tmp_path / 'pois.idx')
+    poi_local.build_index(str(src), path)
+    monkeypatch.setattr(poi_local, 'INDEX_PATH', path)
+    monkeypatch.setattr(poi_local, '_INDEX', None)
+    return feats
+
+
+def _brute(feats, lat, lon, radius_km, kind, limit):
+    hits = []
+    for f in feats:
+        if f['properties'].get('amenity') != kind:
+            continue
+        flon, flat = f['geometry']['coordinates']
+        # the index stores float32 coordinates
+        d = overpass._haversine_km(lat, lon, float(np.float32(flat)), float(np.float32(flon)))
+        if d <= radius_km:
+            hits.append((d, int(f['id'].split('/')[1])))
+    return [i for _, i in sorted(hits)[:limit]]
+
+
+def test_classify():
+    assert poi_local.classify({'amenity': 'university'}) == 'school'
+    assert poi_local.classify({'power': 'tower'}) == 'power'
+    assert poi_local.classify({'amenity': 'bench'}) is None
+
+
+@pytest.mark.parametrize('radius_m', [2000, 15000, 60000])
+def test_rtree_search_matches_a_full_scan(index, radius_m):
+    got = poi_local.search_pois(52.4, 13.3, radius_m=radius_m, kind='pharmacy', limit=25)
+    assert [p['id'] for p in got] == _brute(index, 52.4, 13.3, radius_m / 1000.0, 'pharmacy', 25)
+    assert all(p['tags']['amenity'] == 'pharmacy' for p in got)
+
+
+def test_polygons_are_indexed_at_their_centroid(index):
+    (sub,) = poi_local.search_pois(52.53, 13.55, radius_m=2000, kind='power', limit=5)
+    assert (sub['osm_type'], sub['id']) == ('way', 9)
+    assert math.isclose(sub['lat'], 52.525, abs_tol=1e-4)
+
+
+def test_unsupported_kind_or_missing_index_is_none(index, monkeypatch):
+    assert poi_local.search_pois(52.4, 13.3, kind='roads') is None
+    monkeypatch.setattr(poi_local, 'INDEX_PATH', '/nonexistent/pois.idx')
+    monkeypatch.setattr(poi_local, '_INDEX', None)
+    assert poi_local.search_pois(52.4, 13.3, kind='hospital') is None
+
+
+def test_local_backend_serves_without_overpass(index, monkeypatch):
+    monkeypatch.setattr(cache, '_CACHE', {})
+    monkeypatch.setattr(overpass, 'POI_BACKEND', 'local')
+    monkeypatch.setattr(overpass, '_search_direct', lambda *a: pytest.fail('went to Overpass'))
+    out = overpass.search_pois_multi(52.4, 13.3, radius_m=5000, kinds=['hospitals', 'roads'], limit=3)
+    assert len(out['hospitals']) == 3 and out['roads'] == []
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import poi_tiles
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(poi_tiles, '_TILES', poi_tiles.OrderedDict())
+    monkeypatch.setattr(poi_tiles, 'MAX_TILES_PER_QUERY', 1)
+
+
+def _node(i, lat, lon):
+    return {'type': 'node', 'id': i, 'lat': lat, 'lon': lon, 'tags': {'amenity': 'hospital', 'name': f'h{i}'}}
+
+
+def test_tiles_query_is_capped():
+    q = poi_tiles._build_tiles_query(12, [('amenity', (0, 0))])
+    assert q.endswith(f'out center {poi_tiles.MAX_TILE_RESULTS};')
+
+
+def test_async_batches_are_bounded_and_partially_cached(monkeypatch):
+    monkeypatch.setattr(poi_tiles, 'FETCH_CONCURRENCY', 2)
+    state = {'active': 0, 'peak': 0, 'calls': 0}
+
+    async def fake_fetch(z, pairs):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        state['calls'] += 1
+        first = state['calls'] == 1
+        try:
+            await asyncio.sleep(0.01)
+            if first:
+                raise RuntimeError('upstream down')
+            return {p: [] for p in pairs}, True
+        finally:
+            state['active'] -= 1
+
+    monkeypatch.setattr(poi_tiles, '_fetch_tiles_async', fake_fetch)
+    z, tiles = poi_tiles.covering_tiles(52.5, 13.4, 20000)
+    assert len(tiles) > 2
+    with pytest.raises(RuntimeError):
+        asyncio.run(poi_tiles.search_pois_multi_async(52.5, 13.4, 20000, kinds=['amenity']))
+    assert state['peak'] == 2
+    assert state['calls'] == len(tiles)
+    # every batch but the failed one is cached
+    assert poi_tiles.stats()['tiles'] == len(tiles) - 1
+
+
+def test_truncated_batch_is_used_but_not_cached(monkeypatch):
+    monkeypatch.setattr(poi_tiles, 'MAX_TILE_RESULTS', 1)
+    monkeypatch.setattr(poi_tiles, 'MAX_TILES_PER_QUERY', 1024)
+    z, tiles = poi_tiles.covering_tiles(52.5, 13.4, 1000)
+
+    async def fake_fetch(z, pairs):
+        splitter = poi_tiles._TileSplitter(z, pairs)
+        splitter.feed(_node(1, 52.5, 13.4))
+        return splitter.by_key, splitter.complete
+
+    monkeypatch.setattr(poi_tiles, '_fetch_tiles_async', fake_fetch)
+    out = asyncio.run(poi_tiles.search_pois_multi_async(52.5, 13.4, 1000, kinds=['amenity']))
+    assert [p['id'] for p in out['amenity']] == [1]
+    assert poi_tiles.stats()['tiles'] == 0
@@ -0,0 +1,57 @@
+import json
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, '_STATE_PATH', str(tmp_path / '_state.json'))
+    monkeypatch.setattr(profiling, '_STATE', {'rate': 0.0})
+    monkeypatch.setattr(profiling, '_next_refresh', 0.0)
+    return tmp_path
+
+
+def _spin_for_profile(seconds):
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def test_sampled_request_writes_collapsed_and_speedscope(profile_dir):
+    p = profiling.start('/handle_message')
+    _spin_for_profile(0.2)
+    path = profiling.stop(p, status='ok')
+    assert path.startswith(str(profile_dir / 'handle_message'))
+    lines = open(path, encoding='utf-8').read().splitlines()
+    assert any('_spin_for_profile (test_profiling.py' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    doc = json.load(open(path.replace('.collapsed', '.speedscope.json'), encoding='utf-8'))
+    prof = doc['profiles'][0]
+    assert prof['type'] == 'sampled' and len(prof['samples']) == len(prof['weights'])
+    assert max(i for s in prof['samples'] for i in s) < len(doc['shared']['frames'])
+
+
+def test_selection_by_rate_or_admin_header(profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', 'secret')
+    assert not profiling.should_profile({})
+    assert not profiling.should_profile({'X-Profile': 'wrong'})
+    assert profiling.should_profile({'X-Profile': 'secret'})
+    profiling.set_rate(1)
+    # another worker picks the rate up from the state file
+    monkeypatch.setattr(profiling, '_STATE', {'rate': 0.0})
+    monkeypatch.setattr(profiling, '_next_refresh', 0.0)
+    assert profiling.should_profile({})
+    assert profiling.state()['rate'] == 1.0
+
+
+def test_admin_route_needs_the_token(client, monkeypatch, profile_dir):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/profiling', json={'rate': 0.5}).status_code == 403
+    resp = client.post('/admin/profiling', json={'rate': 0.5}, headers={'X-Admin-Token': 'secret'})
+    assert resp.get_json()['rate'] == 0.5
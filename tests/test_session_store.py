@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import location
+import session_store
+import updates
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    calls = []
+
+    def fetch(tag):
+        calls.append(tag)
+        return [f'{tag} update {len(calls)}']
+
+    monkeypatch.setattr(updates, 'fetch_latest_disaster_updates', fetch)
+    return calls
+
+
+def test_session_reuses_updates(client, fetches):
+    first = client.post('/latest_updates', json={'tag': 'flood'})
+    assert session_store.COOKIE in first.headers.get('Set-Cookie', '')
+    second = client.post('/latest_updates', json={'tag': 'flood'})
+    assert first.get_json() == second.get_json() and fetches == ['flood']
+    # another tag, or a client without the session, fetches again
+    client.post('/latest_updates', json={'tag': 'fire'})
+    client.delete_cookie(session_store.COOKIE)
+    client.post('/latest_updates', json={'tag': 'flood'})
+    assert fetches == ['flood', 'fire', 'flood']
+
+
+def test_header_clients_get_the_id_back(app, fetches):
+    client = app.test_client(use_cookies=False)
+    sid = client.post('/latest_updates', json={'tag': 'flood'}).headers[session_store.HEADER]
+    assert session_store.valid_id(sid)
+    client.post('/latest_updates', json={'tag': 'flood'}, headers={session_store.HEADER: sid})
+    client.post('/latest_updates', json={'tag': 'flood'})
+    assert fetches == ['flood', 'flood']
+
+
+def test_detected_location_is_kept(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(location, 'detect_location',
+                        lambda req: calls.append(1) or {'latitude': 1.0, 'longitude': 2.0, 'name': 'X'})
+    for _ in range(2):
+        assert client.get('/detect_location').get_json()['location']['name'] == 'X'
+    assert len(calls) == 1
+
+
+def test_memory_store_lru_and_ttl(monkeypatch):
+    store = session_store.MemoryStore(size=2, ttl=10)
+    for sid in 'abc':
+        store.put(sid, sid)
+    assert store.get('a') is None and store.get('c') == 'c'
+    now = time.time()
+    monkeypatch.setattr(session_store.time, 'time', lambda: now + 11)
+    assert store.get('c') is None
+
+
+def test_context_filter(app):
+    intents = {'intents': [{'tag': 'flood', 'context_set': 'flood'},
+                           {'tag': 'flood_yes', 'context_filter': ['flood']},
+                           {'tag': 'greeting'}]}
+    ranked = [{'intent': 'flood_yes'}, {'intent': 'greeting'}]
+    with app.test_request_context('/handle_message'):
+        from flask import g
+        g._session = {}
+        assert session_store.filter_by_context(ranked, intents) == [{'intent': 'greeting'}]
+        session_store.note_intent([{'intent': 'flood'}], intents)
+        assert g._session['context'] == 'flood' and g._session_dirty
+        assert session_store.filter_by_context(ranked, intents) == ranked
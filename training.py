@@ -1,72 +1,278 @@
 import os
-import numpy as np
+import sys
+import time
+import json
 import pickle
 import random
-import json
+import hashlib
+import argparse
+
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+
+import numpy as np
 import nltk
 from nltk.stem import WordNetLemmatizer
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Dropout
-from tensorflow.keras.optimizers import SGD
+
+import model_bundle
+import model_pack
 
 # nltk.download('punkt')
 # nltk.download('wordnet')
 
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+# Trains the intent MLP and writes every deployable artifact in one step:
+# words.pkl, classes.pkl, chatbot_model.keras and the memory-mapped
+# bundle.pack, plus training_report.json. Each file is written to a temp
+# name and renamed once training has finished, so the hot-reload watcher
+# (model_bundle.py) never sees a new vocabulary next to an old model.
+#
+# Patterns are tokenized and lemmatized once. The documents, together with
+# the augmented copies made for training (each pattern with one word
+# dropped), are cached in model/.train_cache.json, keyed by a hash of
+# intents.json and the settings, so retraining on an unchanged corpus skips
+# NLTK entirely. Bags are built in one numpy scatter through the vocabulary
+# index. A stratified hold-out split (--val-split, by original pattern, so
+# augmented copies never leak into it) drives early stopping, which keeps
+# the best epoch's weights. The model is then refit on every pattern for
+# that many epochs (--no-refit keeps the early-stopped one), so the deployed
+# model has seen the held-out patterns too. --seed makes the split,
+# augmentation, initialisation and shuffling repeatable.
+#
+#     python training.py [--epochs 200] [--batch-size 16] [--val-split 0.15]
+#                        [--patience 20] [--seed 42] [--augment 3] [--no-cache] [--no-refit]
+IGNORE_SYMBOLS = ['?', '!', '.', ',']
+CACHE_FILE = '.train_cache.json'
+REPORT_FILE = 'training_report.json'
+CACHE_VERSION = 1
 
 lemmatizer = WordNetLemmatizer()
-intents = json.load(open('intents.json'))
 
-words, classes, documents = [], [], []
-ignore_symbols = ['?', '!', '.', ',']
 
+def tokenize(pattern):
+    words = nltk.word_tokenize(pattern)
+    return [lemmatizer.lemmatize(w.lower()) for w in words if w not in IGNORE_SYMBOLS]
+
+
+def split_patterns(intents, val_split, rng):
+    """[(tokens, tag, held_out)] with about `val_split` of each tag's patterns held out.
+
+    A tag keeps at least one training pattern; held-out patterns are never augmented.
+    """
+    docs = []
+    for intent in intents['intents']:
+        patterns = list(intent['patterns'])
+        n_val = min(len(patterns) - 1, int(round(len(patterns) * val_split)))
+        held = set(rng.sample(range(len(patterns)), max(0, n_val)))
+        for i, pattern in enumerate(patterns):
+            docs.append((pattern, intent['tag'], i in held))
+    return docs
+
+
+def augment(tokens, rng, n):
+    """Up to `n` copies of `tokens` with one word dropped each."""
+    if len(tokens) < 3 or n <= 0:
+        return []
+    drops = rng.sample(range(len(tokens)), min(n, len(tokens)))
+    return [tokens[:i] + tokens[i + 1:] for i in drops]
+
+
+def prepare(intents, args, cache_path):
+    """(documents, words, classes); documents are (tokens, tag, held_out, augmented)."""
+    key = hashlib.sha256(json.dumps([CACHE_VERSION, intents, args.val_split, args.augment, args.seed],
+                                    sort_keys=True).encode('utf-8')).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                return [tuple(d) for d in cached['documents']], cached['words'], cached['classes'], True
+        except (OSError, ValueError):
+            pass
+
+    rng = random.Random(args.seed)
+    documents = []
+    for pattern, tag, held_out in split_patterns(intents, args.val_split, rng):
+        tokens = tokenize(pattern)
+        documents.append((tokens, tag, held_out, False))
+        if not held_out:
+            documents.extend((t, tag, False, True) for t in augment(tokens, rng, args.augment))
+    # the vocabulary comes from the original patterns, held-out ones included,
+    # so the deployed model knows every word in intents.json
+    words = sorted(set(w for tokens, _, _, aug in documents if not aug for w in tokens))
+    classes = sorted(set(i['tag'] for i in intents['intents']))
+    if cache_path:
+        tmp = cache_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'documents': documents, 'words': words, 'classes': classes}, f)
+        os.replace(tmp, cache_path)
+    return documents, words, classes, False
+
+
+def build_matrix(documents, words, classes):
+    """Dense 0/1 bags (float32) and one-hot labels, built with one scatter each."""
+    word_index = {w: i for i, w in enumerate(words)}
+    class_index = {c: i for i, c in enumerate(classes)}
+    rows, cols = [], []
+    for r, (tokens, _, _, _) in enumerate(documents):
+        idx = {word_index[w] for w in tokens if w in word_index}
+        rows.extend([r] * len(idx))
+        cols.extend(idx)
+    x = np.zeros((len(documents), len(words)), dtype=np.float32)
+    x[np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)] = 1.0
+    y = np.zeros((len(documents), len(classes)), dtype=np.float32)
+    y[np.arange(len(documents)), [class_index[d[1]] for d in documents]] = 1.0
+    return x, y
+
+
+def build_model(n_words, n_classes):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Dropout
+    from tensorflow.keras.optimizers import SGD
+    model = Sequential()
+    model.add(Dense(128, input_shape=(n_words,), activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(64, activation='relu'))
+    model.add(Dropout(0.5))
+    model.add(Dense(n_classes, activation='softmax'))
+    sgd = SGD(learning_rate=0.01, momentum=0.9, nesterov=True)
+    model.compile(loss='categorical_crossentropy', optimizer=sgd, metrics=['accuracy'])
+    return model
+
+
+def held_out_callback(xv, yv):
+    """Keras callback adding val_loss / val_accuracy to each epoch's logs.
+
+    One direct model call on the held-out bags; much cheaper per epoch than
+    fit(validation_data=...), which sets up a whole evaluate() every time.
+    """
+    from tensorflow.keras.callbacks import Callback
+
+    class HeldOut(Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            p = np.clip(self.model(xv, training=False).numpy(), 1e-7, 1.0)
+            logs['val_loss'] = float(-np.mean(np.sum(yv * np.log(p), axis=1)))
+            logs['val_accuracy'] = float(np.mean(p.argmax(axis=1) == yv.argmax(axis=1)))
+
+    return HeldOut()
 
-for intent in intents['intents']:
-    for pattern in intent['patterns']:
-        word_list = nltk.word_tokenize(pattern)
-        words.extend(word_list)
-        documents.append((word_list, intent['tag']))
-        if intent['tag'] not in classes:
-            classes.append(intent['tag'])
 
-words = [lemmatizer.lemmatize(w.lower()) for w in words if w not in ignore_symbols]
-words = sorted(set(words))
-classes = sorted(set(classes))
+def _replace_later(path, pending):
+    """A temp path next to `path`; renamed over it by _commit()."""
+    tmp = path + '.tmp'
+    pending.append((tmp, path))
+    return tmp
 
-os.makedirs('model', exist_ok=True)
-pickle.dump(words, open('model/words.pkl', 'wb'))
-pickle.dump(classes, open('model/classes.pkl', 'wb'))
 
+def _commit(pending, model_dir, intents_path, version):
+    """Rename every artifact into place, then write the manifest the watchers key on."""
+    for tmp, path in pending:
+        os.replace(tmp, path)
+    model_bundle.write_manifest(model_dir, intents_path, version)
 
-training = []
-output_empty = [0] * len(classes)
 
-for doc in documents:
-    bag = []
-    word_patterns = [lemmatizer.lemmatize(w.lower()) for w in doc[0] if w not in ignore_symbols]
+def main():
+    ap = argparse.ArgumentParser(description='Train the intent model and write the deployable artifacts.')
+    ap.add_argument('--intents', default=model_bundle.INTENTS_PATH)
+    ap.add_argument('--model-dir', default=model_bundle.MODEL_DIR)
+    ap.add_argument('--epochs', type=int, default=int(os.environ.get('TRAIN_EPOCHS', '200')),
+                    help='upper bound; early stopping usually ends sooner')
+    ap.add_argument('--batch-size', type=int, default=int(os.environ.get('TRAIN_BATCH_SIZE', '16')))
+    ap.add_argument('--val-split', type=float, default=float(os.environ.get('TRAIN_VAL_SPLIT', '0.15')),
+                    help='share of each tag\'s patterns held out for early stopping (0 disables)')
+    ap.add_argument('--patience', type=int, default=int(os.environ.get('TRAIN_PATIENCE', '20')))
+    ap.add_argument('--seed', type=int, default=int(os.environ.get('TRAIN_SEED', '42')))
+    ap.add_argument('--augment', type=int, default=int(os.environ.get('TRAIN_AUGMENT', '3')),
+                    help='word-dropout copies per training pattern (0 disables)')
+    ap.add_argument('--no-cache', action='store_true', help='ignore and do not write the token cache')
+    ap.add_argument('--no-refit', action='store_true', help='deploy the early-stopped model as is')
+    ap.add_argument('--verbose', type=int, default=0, help='Keras fit verbosity')
+    args = ap.parse_args()
 
-    for w in words:
-        bag.append(1 if w in word_patterns else 0)
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    random.seed(args.seed)
+    # seeds Python, numpy and TensorFlow; op determinism fixes the kernels too
+    tf.keras.utils.set_random_seed(args.seed)
+    tf.config.experimental.enable_op_determinism()
 
-    output_row = list(output_empty)
-    output_row[classes.index(doc[1])] = 1
-    training.append([bag, output_row])
+    report = {'seed': args.seed, 'batch_size': args.batch_size, 'max_epochs': args.epochs,
+              'val_split': args.val_split, 'augment': args.augment, 'seconds': {}}
+    start = time.perf_counter()
+    with open(args.intents, 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    os.makedirs(args.model_dir, exist_ok=True)
+    cache_path = None if args.no_cache else os.path.join(args.model_dir, CACHE_FILE)
+    documents, words, classes, cached = prepare(intents, args, cache_path)
+    report['seconds']['prepare'] = round(time.perf_counter() - start, 3)
+    report['cache_hit'] = cached
 
-random.shuffle(training)
+    t = time.perf_counter()
+    train_docs = [d for d in documents if not d[2]]
+    val_docs = [d for d in documents if d[2]]
+    x, y = build_matrix(train_docs, words, classes)
+    xv, yv = build_matrix(val_docs, words, classes) if val_docs else (None, None)
+    report['seconds']['matrix'] = round(time.perf_counter() - t, 3)
+    report.update(words=len(words), classes=len(classes), train_rows=len(x),
+                  augmented_rows=sum(1 for d in train_docs if d[3]), val_rows=len(val_docs))
 
-train_x = np.array([t[0] for t in training])
-train_y = np.array([t[1] for t in training])
+    t = time.perf_counter()
+    model = build_model(len(words), len(classes))
+    monitor = 'val_loss' if val_docs else 'loss'
+    callbacks = [held_out_callback(xv, yv)] if val_docs else []
+    # after the held-out callback, so it sees that epoch's val_loss
+    callbacks.append(EarlyStopping(monitor=monitor, patience=args.patience, restore_best_weights=True))
+    hist = model.fit(x, y, epochs=args.epochs, batch_size=args.batch_size, shuffle=True,
+                     callbacks=callbacks, verbose=args.verbose)
+    report['seconds']['fit'] = round(time.perf_counter() - t, 3)
+    report['epochs_run'] = len(hist.history['loss'])
+    report['best_epoch'] = int(np.argmin(hist.history[monitor])) + 1
+    if val_docs:
+        report['val_accuracy'] = round(hist.history['val_accuracy'][report['best_epoch'] - 1], 4)
+        if not args.no_refit:
+            t = time.perf_counter()
+            tf.keras.utils.set_random_seed(args.seed)
+            x, y = np.vstack([x, xv]), np.vstack([y, yv])
+            model = build_model(len(words), len(classes))
+            model.fit(x, y, epochs=report['best_epoch'], batch_size=args.batch_size, shuffle=True,
+                      verbose=args.verbose)
+            report['seconds']['refit'] = round(time.perf_counter() - t, 3)
+    report['train_accuracy'] = round(float(model.evaluate(x, y, verbose=0)[1]), 4)
 
+    t = time.perf_counter()
+    paths = model_bundle._paths(args.model_dir, args.intents)
+    pending = []
+    staged = dict(paths)
+    with open(_replace_later(paths['words'], pending), 'wb') as f:
+        pickle.dump(words, f)
+        staged['words'] = f.name
+    with open(_replace_later(paths['classes'], pending), 'wb') as f:
+        pickle.dump(classes, f)
+        staged['classes'] = f.name
+    # Keras picks the format from the extension, so the temp name keeps it
+    staged['model'] = paths['model'][:-len('.keras')] + '.tmp.keras'
+    model.save(staged['model'])
+    pending.append((staged['model'], paths['model']))
+    # the pack records the hash of the new artifacts, read from their temp files
+    version = model_bundle._version(staged)
+    model_pack.write_pack(_replace_later(paths['pack'], pending), intents, words, classes,
+                          model_pack.dense_layers(model), source=version, quantized=('int8', 'float16'))
+    _commit(pending, args.model_dir, args.intents, version)
+    report['seconds']['export'] = round(time.perf_counter() - t, 3)
+    report['seconds']['total'] = round(time.perf_counter() - start, 3)
+    report['version'] = version
+    with open(os.path.join(args.model_dir, REPORT_FILE), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
 
-model = Sequential()
-model.add(Dense(128, input_shape=(train_x.shape[1],), activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(64, activation='relu'))
-model.add(Dropout(0.5))
-model.add(Dense(train_y.shape[1], activation='softmax'))
+    print(f"Trained on {report['train_rows']} rows ({report['augmented_rows']} augmented), "
+          f"{len(words)} words, {len(classes)} classes")
+    print(f"  {report['epochs_run']} epochs (best {report['best_epoch']}), "
+          f"train accuracy {report['train_accuracy']}"
+          + (f", held-out accuracy {report['val_accuracy']}" if val_docs else ''))
+    print('  seconds: ' + ', '.join(f'{k} {v}' for k, v in report['seconds'].items()))
+    print(f"Wrote {paths['words']}, {paths['classes']}, {paths['model']}, {paths['pack']} "
+          f"(bundle {report['version']})")
+    if not model_pack.report(model_pack.Pack(paths['pack'], verify=True)):
+        sys.exit(1)
 
-sgd = SGD(learning_rate=0.01, momentum=0.9, nesterov=True)
-model.compile(loss='categorical_crossentropy', optimizer=sgd, metrics=['accuracy'])
 
-model.fit(train_x, train_y, epochs=200, batch_size=5, verbose=1)
-model.save('model/chatbot_model.keras')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
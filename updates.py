@@ -1,103 +1,113 @@
-import requests
+import asyncio
 from bs4 import BeautifulSoup
 
+import aio
+import metrics
 
-def fetch_latest_disaster_updates(intent_tag):
-    """Fetch latest disaster updates from a set of public endpoints.
+SOURCES = {
+    'earthquake': ['https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/significant_week.geojson',
+                   'https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=earthquake'],
+    'flood': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=flood',
+              'https://api.weather.gov/alerts/active?event=Flood'],
+    'hurricane_cyclone_typhoon': ['https://api.weather.gov/alerts/active?event=Hurricane',
+                                   'https://rss.weather.gov.hk/rss/SeveralWeather.xml'],
+    'wildfire': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=wildfire',
+                 'https://api.weather.gov/alerts/active?event=Fire'],
+    'tsunami': ['https://api.weather.gov/alerts/active?event=Tsunami',
+                'https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=tsunami'],
+    'general': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&limit=5']
+}
 
-    This module is lightweight and does not depend on NLTK or the ML model,
-    so the frontend can call it without importing heavy dependencies.
-    Returns a list of up to 5 human-readable update strings.
-    """
-    sources = {
-        'earthquake': ['https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/significant_week.geojson',
-                       'https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=earthquake'],
-        'flood': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=flood',
-                  'https://api.weather.gov/alerts/active?event=Flood'],
-        'hurricane_cyclone_typhoon': ['https://api.weather.gov/alerts/active?event=Hurricane',
-                                       'https://rss.weather.gov.hk/rss/SeveralWeather.xml'],
-        'wildfire': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=wildfire',
-                     'https://api.weather.gov/alerts/active?event=Fire'],
-        'tsunami': ['https://api.weather.gov/alerts/active?event=Tsunami',
-                    'https://api.reliefweb.int/v1/disasters?appname=apidoc&filter[type]=tsunami'],
-        'general': ['https://api.reliefweb.int/v1/disasters?appname=apidoc&limit=5']
-    }
-
-    urls = sources.get(intent_tag, sources['general'])
+
+def _json_tips(data):
     tips = []
+    if isinstance(data, dict):
+        if 'features' in data and isinstance(data['features'], list):
+            for feature in data['features'][:3]:
+                props = feature.get('properties', {})
+                mag = props.get('mag')
+                place = props.get('place')
+                tips.append(f"Alert: Magnitude {mag} earthquake near {place}" if mag or place else "Earthquake alert")
+        elif 'data' in data and isinstance(data['data'], list):
+            for item in data['data'][:3]:
+                fields = item.get('fields', {}) if isinstance(item, dict) else {}
+                title = fields.get('name') or fields.get('title') or item.get('title')
+                status = fields.get('status') or 'Active'
+                tips.append(f"Update: {title} - {status}")
+        elif 'entry' in data and isinstance(data['entry'], list):
+            for entry in data['entry'][:3]:
+                title = entry.get('title') or 'Update available'
+                tips.append(f"Update: {title}")
+    return tips
+
+
+def _markup_tips(content):
+    """Tips from an XML / RSS feed, falling back to HTML headlines."""
+    tips = []
+    try:
+        soup = BeautifulSoup(content, 'xml')
+        items = soup.find_all(['item', 'entry'])
+        for it in items[:3]:
+            title = it.find('title')
+            title_text = title.get_text(strip=True) if title else it.get_text(strip=True)
+            if title_text:
+                tips.append(f"Update: {title_text}")
+        if tips:
+            return tips
+
+        # Fallback: parse HTML and take headlines
+        soup_html = BeautifulSoup(content, 'html.parser')
+        headlines = []
+        for tag in ['h1', 'h2', 'h3', 'a']:
+            for node in soup_html.find_all(tag)[:5]:
+                text = node.get_text(strip=True)
+                if text:
+                    headlines.append(text)
+        return [f"Update: {h}" for h in headlines[:3]]
+    except Exception:
+        return tips
+
+
+async def _fetch_source(url):
+    feed = metrics.host_of(url)
+    try:
+        # network errors and timeouts are counted per host by aio's transport
+        resp = await aio.get(url, timeout=6)
+    except Exception:
+        return []
+    if resp.status_code != 200:
+        metrics.feed_error(feed, 'status')
+        return []
 
-    for url in urls:
+    content_type = resp.headers.get('content-type', '').lower()
+    if 'application/json' in content_type or resp.text.lstrip().startswith('{'):
         try:
-            resp = requests.get(url, timeout=6)
+            tips = _json_tips(resp.json())
         except Exception:
-            continue
-
-        if resp.status_code != 200:
-            continue
-
-        content_type = resp.headers.get('content-type', '').lower()
-
-        # JSON endpoints
-        if 'application/json' in content_type or resp.text.lstrip().startswith('{'):
-            try:
-                data = resp.json()
-            except Exception:
-                data = None
-
-            if isinstance(data, dict):
-                if 'features' in data and isinstance(data['features'], list):
-                    for feature in data['features'][:3]:
-                        props = feature.get('properties', {})
-                        mag = props.get('mag')
-                        place = props.get('place')
-                        tips.append(f"Alert: Magnitude {mag} earthquake near {place}" if mag or place else "Earthquake alert")
-                elif 'data' in data and isinstance(data['data'], list):
-                    for item in data['data'][:3]:
-                        fields = item.get('fields', {}) if isinstance(item, dict) else {}
-                        title = fields.get('name') or fields.get('title') or item.get('title')
-                        status = fields.get('status') or 'Active'
-                        tips.append(f"Update: {title} - {status}")
-                elif 'entry' in data and isinstance(data['entry'], list):
-                    for entry in data['entry'][:3]:
-                        title = entry.get('title') or 'Update available'
-                        tips.append(f"Update: {title}")
-
-        else:
-            # Try XML / RSS / HTML
-            try:
-                soup = BeautifulSoup(resp.content, 'xml')
-                items = soup.find_all(['item', 'entry'])
-                if items:
-                    for it in items[:3]:
-                        title = it.find('title')
-                        title_text = title.get_text(strip=True) if title else it.get_text(strip=True)
-                        if title_text:
-                            tips.append(f"Update: {title_text}")
-                    if tips:
-                        continue
-
-                # Fallback: parse HTML and take headlines
-                soup_html = BeautifulSoup(resp.content, 'html.parser')
-                headlines = []
-                for tag in ['h1', 'h2', 'h3', 'a']:
-                    for node in soup_html.find_all(tag)[:5]:
-                        text = node.get_text(strip=True)
-                        if text:
-                            headlines.append(text)
-                for h in headlines[:3]:
-                    tips.append(f"Update: {h}")
-            except Exception:
-                continue
-
-    # Deduplicate while preserving order and limit to 5
+            tips = []
+    else:
+        # BeautifulSoup is CPU work; keep it off the shared event loop
+        tips = await asyncio.get_running_loop().run_in_executor(None, _markup_tips, resp.content)
+    if tips:
+        metrics.feed_success(feed)
+    else:
+        metrics.feed_error(feed, 'parse')
+    return tips
+
+
+async def fetch_latest_disaster_updates_async(intent_tag):
+    """Async version of fetch_latest_disaster_updates; sources are fetched concurrently."""
+    urls = SOURCES.get(intent_tag, SOURCES['general'])
+    per_source = await aio.gather_settled(*(_fetch_source(u) for u in urls))
+
+    # Deduplicate while preserving source order and limit to 5
     seen = set()
     out = []
-    for t in tips:
-        if t and t not in seen:
-            seen.add(t)
-            out.append(t)
-        if len(out) >= 5:
-            break
+    for tips in per_source:
+        for t in tips or []:
+            if t and t not in seen and len(out) < 5:
+                seen.add(t)
+                out.append(t)
 
     if not out:
         out = [
@@ -107,3 +117,13 @@ def fetch_latest_disaster_updates(intent_tag):
         ]
 
     return out
+
+
+def fetch_latest_disaster_updates(intent_tag):
+    """Fetch latest disaster updates from a set of public endpoints.
+
+    This module is lightweight and does not depend on NLTK or the ML model,
+    so the frontend can call it without importing heavy dependencies.
+    Returns a list of up to 5 human-readable update strings.
+    """
+    return aio.run(fetch_latest_disaster_updates_async(intent_tag))
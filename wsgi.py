@@ -0,0 +1,6 @@
+# Production WSGI entrypoint:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# The one place an application is built; each worker imports this once.
+from app import create_app
+
+app = create_app()